@@ -1,16 +1,32 @@
-from flask import Flask, render_template, request, jsonify, Response, send_from_directory, url_for
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory, url_for, stream_with_context
 from functools import wraps
 import os
+import gzip
+import json
+import zlib
+import hashlib
 import threading
 import time
 import subprocess
-import shutil
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
+from werkzeug.http import is_resource_modified
 
 # Import project modules
-import worker
 import config
+import backup
+import bulk_io
 import data_manager # Use the new data manager
+import job_queue
+import coupon_cache
+import ledger
+import log_reader
+import log_tailer
+import matrix
+import metrics
+import scheduler
+import screenshots
+import search_index
+import session_status
 
 import logging
 from logging.handlers import RotatingFileHandler
@@ -45,6 +61,43 @@ app = Flask(__name__)
 app.logger.handlers = root_logger.handlers
 app.logger.setLevel(logging.INFO)
 
+# --- Response Compression ---
+# JSON and text responses are gzip- or deflate-encoded when the client accepts it. Streams (SSE, CSV
+# exports) and file downloads are left alone, as are responses too small to be worth it.
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript')
+
+def _accepted_encoding():
+    for encoding in ('gzip', 'deflate'):
+        if request.accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or 'Content-Range' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    encoding = _accepted_encoding()
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    if encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=6)
+    else:
+        body = zlib.compress(body, 6)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # The encoded bytes differ from the ones the ETag was computed for.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
 # --- Authentication ---
 def check_auth(username, password):
     """This function is called to check if a username /
@@ -68,101 +121,61 @@ def requires_auth(f):
         return f(*args, **kwargs)
     return decorated
 
-# Thread-safe in-memory store for running threads and their status
+# Thread-safe in-memory store for the jobs this process runs and their status.
+# The status fields are mirrored to session_status's shared store, which /status reads.
 
 thread_lock = threading.Lock()
-# { "base_filename": {"thread": obj, "status": str, "log_preview": str, "display_name": str, "session_id": str} }
+# { "base_filename": SessionStatus({"future": obj, "status": str, "log_preview": str, "display_name": str, "session_id": str, ...}) }
 running_threads = {}
-# Use a semaphore to limit concurrent browser sessions
-session_semaphore = threading.Semaphore(config.MAX_CONCURRENT_SESSIONS)
+# Jobs are started by scheduler.py, which leases session slots from slot_broker across processes.
 
 # Ensure necessary directories exist
 os.makedirs("logs", exist_ok=True)
 os.makedirs("coupon_logs", exist_ok=True)
-os.makedirs("screenshots", exist_ok=True)
+os.makedirs(config.SCREENSHOT_DIR, exist_ok=True)
 data_manager.ensure_data_dir_exists()
 
 def get_uids_map():
-    """Reads data/uids.txt and returns a map of base_filename to uid/comment."""
-    uids_list = data_manager.get_uids_list()
-    uids_map = {}
-    for item in uids_list:
-        base_filename = f"{item['uid']}_{item['comment']}"
-        uids_map[base_filename] = {'uid': item['uid'], 'comment': item['comment']}
-    return uids_map
-
-def worker_wrapper(uid, comment, all_coupons, base_filename, force_run=False):
-    """Wrapper to manage semaphore and status dict for the worker thread."""
-    with session_semaphore:
-        # The worker will update its own status in the running_threads dict
-        worker.process_uid(uid, comment, all_coupons, running_threads[base_filename], thread_lock, force_run=force_run)
-
-def perform_backup():
-    """Backs up the uids.txt and coupons.txt files."""
-    data_dir = 'data'
-    files_to_backup = ['uids.txt', 'coupons.txt']
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    
-    for filename in files_to_backup:
-        source_path = os.path.join(data_dir, filename)
-        if os.path.exists(source_path):
-            try:
-                # e.g., uids_2025-08-02_000000.txt
-                backup_filename = f"{os.path.splitext(filename)[0]}_{timestamp}.txt"
-                dest_path = os.path.join(data_dir, backup_filename)
-                shutil.copy2(source_path, dest_path)
-                app.logger.info(f"Successfully backed up {source_path} to {dest_path}")
-            except Exception as e:
-                app.logger.error(f"Error backing up {source_path}: {e}")
-
-
-def dispatch_workers(selected_ids, selected_coupons, force_run=False):
+    """Returns the map of base_filename to UID entry from data/uids.txt (cached by data_manager)."""
+    return data_manager.get_uids_map()
+
+def enqueue_run(selected_ids, selected_coupons, force_run=False, priority=0, backend=None):
     """
-    Iterates through selected UIDs and starts a worker thread for each,
-    with a delay between each start. This runs in a background thread
-    and does not block the main Flask app.
+    Adds a job for each selected UID to the persistent job queue and wakes the scheduler.
+    `backend` selects the redemption backend ("selenium" or "http"); it defaults to REDEEM_BACKEND.
+    Returns a dict counting how many UIDs were queued, merged into existing jobs, already running or invalid.
     """
     uids_map = get_uids_map()
-    
-    for i, base_filename in enumerate(selected_ids):
-        # For any thread after the first one, wait for the configured delay.
-        if i > 0:
-            app.logger.info(f"Waiting {config.DELAY_BETWEEN_SESSIONS} seconds before starting next session...")
-            time.sleep(config.DELAY_BETWEEN_SESSIONS)
-
-        with thread_lock:
-            # Double-check that the thread hasn't been started by another request or is finished
-            if base_filename in uids_map and (base_filename not in running_threads or not running_threads[base_filename]['thread'].is_alive()):
-                uid_info = uids_map[base_filename]
-                
-                app.logger.info(f"Preparing to start worker for: {base_filename}")
-
-                # Initialize status dict for the new thread
-                running_threads[base_filename] = {
-                    'status': 'Queued',
-                    'log_preview': 'Waiting for an available session...', 
-                    'display_name': f"{uid_info['uid']} ({uid_info['comment']})",
-                    'session_id': None
-                }
-                
-                thread = threading.Thread(
-                    target=worker_wrapper,
-                    args=(uid_info['uid'], uid_info['comment'], selected_coupons, base_filename, force_run)
-                )
-                thread.daemon = True
-                thread.start()
-                running_threads[base_filename]['thread'] = thread
-                app.logger.info(f"Successfully started worker thread for {base_filename}")
-            else:
-                app.logger.warning(f"Skipping already running or invalid worker: {base_filename}")
+    result = {'queued': 0, 'merged': 0, 'running': 0, 'invalid': 0}
+    backend = backend or config.REDEEM_BACKEND
+
+    for base_filename in selected_ids:
+        if base_filename not in uids_map:
+            app.logger.warning(f"Skipping invalid UID: {base_filename}")
+            result['invalid'] += 1
+            continue
+
+        uid_info = uids_map[base_filename]
+        outcome = job_queue.enqueue(uid_info['uid'], uid_info['comment'], selected_coupons,
+                                    force_run=force_run, priority=priority, backend=backend)
+        result[outcome] += 1
+
+        if outcome == job_queue.RUNNING:
+            app.logger.warning(f"Skipping already running worker: {base_filename}")
+            continue
+
+        scheduler.publish_queued(uid_info['uid'], uid_info['comment'])
+
+    scheduler.wake()
+    return result
 
 
 @app.route('/run', methods=['POST'])
 @requires_auth
 def run_automation():
     """
-    Receives a request to start automation and kicks off the dispatcher
-    thread to manage the process in the background.
+    Receives a request to start automation and adds the selected UIDs
+    to the job queue, where the scheduler picks them up.
     """
     data = request.json
     selected_ids = data.get('uids', [])
@@ -178,25 +191,36 @@ def run_automation():
     if not selected_coupons:
         return jsonify({'status': 'error', 'message': 'No coupons selected.'}), 400
 
-    # Start the dispatcher thread to handle the staggered start
-    dispatcher = threading.Thread(
-        target=dispatch_workers,
-        args=(selected_ids, selected_coupons, False) # Pass force_run=False
-    )
-    dispatcher.daemon = True
-    dispatcher.start()
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Priority must be an integer.'}), 400
+
+    # Drop codes another UID already found to be invalid or expired.
+    live_coupons = coupon_cache.drop_dead(selected_coupons)
+    if not live_coupons:
+        return jsonify({'status': 'error', 'message': 'All selected coupons are known to be invalid or expired.'}), 400
+    selected_coupons = live_coupons
+
+    backend = data.get('backend') or config.REDEEM_BACKEND
+    if backend not in ('selenium', 'http'):
+        return jsonify({'status': 'error', 'message': f'Unknown backend: {backend}'}), 400
+
+    result = enqueue_run(selected_ids, selected_coupons, force_run=False,
+                         priority=priority, backend=backend)
 
     return jsonify({
         'status': 'success',
-        'message': f'Automation process initiated for {len(selected_ids)} UIDs. They will start sequentially.'
+        'message': f"Queued {result['queued']} UIDs ({result['merged']} merged into waiting jobs, {result['running']} already running). They will start as sessions become available.",
+        'result': result
     })
 
 @app.route('/force_run', methods=['POST'])
 @requires_auth
 def force_run_automation():
     """
-    Receives a request to FORCE start automation and kicks off the dispatcher
-    thread to manage the process in the background.
+    Receives a request to FORCE start automation and adds the selected UIDs
+    to the job queue, where the scheduler picks them up.
     """
     data = request.json
     selected_ids = data.get('uids', [])
@@ -209,43 +233,23 @@ def force_run_automation():
     if not selected_ids:
         return jsonify({'status': 'error', 'message': 'No UIDs selected.'}), 400
     
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Priority must be an integer.'}), 400
+
     # For force run, coupons are not strictly required to start a session
     # but we still need to pass the list, even if empty.
+    selected_coupons = coupon_cache.drop_dead(selected_coupons)
 
-    # Start the dispatcher thread to handle the staggered start
-    dispatcher = threading.Thread(
-        target=dispatch_workers,
-        args=(selected_ids, selected_coupons, True) # Pass force_run=True
-    )
-    dispatcher.daemon = True
-    dispatcher.start()
+    result = enqueue_run(selected_ids, selected_coupons, force_run=True, priority=priority)
 
     return jsonify({
         'status': 'success',
-        'message': f'Force run process initiated for {len(selected_ids)} UIDs. They will start sequentially.'
+        'message': f"Force run queued for {result['queued']} UIDs ({result['merged']} merged into waiting jobs, {result['running']} already running). They will start as sessions become available.",
+        'result': result
     })
 
-def backup_scheduler():
-    """Runs a loop to schedule backups at midnight every day."""
-    app.logger.info("Backup scheduler started.")
-    while True:
-        now = datetime.now()
-        # Calculate the next midnight
-        tomorrow = now.date() + timedelta(days=1)
-        midnight = datetime.combine(tomorrow, datetime.min.time())
-        
-        sleep_seconds = (midnight - now).total_seconds()
-        
-        app.logger.info(f"Scheduler will sleep for {sleep_seconds / 3600:.2f} hours until next backup.")
-        time.sleep(sleep_seconds)
-        
-        # Time to wake up and do the backup
-        app.logger.info("Performing scheduled daily backup...")
-        perform_backup()
-        # Sleep for a short while to ensure we don't run it twice in the same second
-        time.sleep(1)
-
-
 @app.context_processor
 def inject_global_vars():
     """Injects global variables into all templates."""
@@ -263,17 +267,8 @@ def logout():
 @app.route('/')
 @requires_auth
 def index():
-    """Renders the main control panel page."""
-    uids_list = data_manager.get_uids_list()
-    uids_raw = data_manager.get_uids_raw()
-    coupons_list = data_manager.get_all_coupons()
-    coupons_raw = data_manager.get_coupons_raw()
-
-    return render_template('index.html', 
-                           uids_list=uids_list, 
-                           uids_raw=uids_raw, 
-                           coupons_list=coupons_list,
-                           coupons_raw=coupons_raw)
+    """Renders the main control panel page. The UID and coupon lists are fetched from /api/uids and /api/coupons."""
+    return render_template('index.html')
 
 @app.route('/monitoring')
 @requires_auth
@@ -290,32 +285,36 @@ def full_logs_page():
 @app.route('/stream-all-logs')
 @requires_auth
 def stream_all_logs():
-    """Streams the content of app.log file."""
+    """Streams new lines of app.log from this process's shared log tailer."""
+    log_file_path = os.path.join('logs', 'app.log')
+    if not os.path.exists(log_file_path):
+        # Try to create the file if it doesn't exist, as the app might be idle.
+        try:
+            with open(log_file_path, 'a'):
+                os.utime(log_file_path, None)
+            app.logger.info("app.log was not found, so it was created.")
+        except Exception as e:
+            app.logger.error(f"Could not create app.log: {e}")
+            return Response("data: Log file could not be created.\n\n", mimetype='text/event-stream')
+
+    try:
+        subscription = log_tailer.subscribe(log_file_path)
+    except log_tailer.SubscriberLimitReached:
+        return Response("Too many live pages are open. Close one and try again.", status=503,
+                        headers={'Retry-After': '30'})
+
     def generate():
-        log_file_path = os.path.join('logs', 'app.log')
-        if not os.path.exists(log_file_path):
-            # Try to create the file if it doesn't exist, as the app might be idle.
-            try:
-                with open(log_file_path, 'a'):
-                    os.utime(log_file_path, None)
-                app.logger.info("app.log was not found, so it was created.")
-            except Exception as e:
-                app.logger.error(f"Could not create app.log: {e}")
-                yield "data: Log file could not be created.\n\n"
-                return
-
-        with open(log_file_path, 'r', encoding='utf-8') as log_file:
-            # Seek to the end of the file
-            log_file.seek(0, 2)
-            
-            while True:
-                line = log_file.readline()
-                if not line:
-                    time.sleep(0.1)  # Wait for new lines
-                    continue
-                yield f"data: {line.strip()}\n\n"
-
-    return Response(generate(), mimetype='text/event-stream')
+        for batch in subscription.batches(timeout=session_status.STREAM_KEEPALIVE_SECONDS):
+            if batch is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield "".join(f"data: {line.strip()}\n\n" for line in batch)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the client disconnects, even if the stream never started.
+    response.call_on_close(lambda: log_tailer.unsubscribe(subscription))
+    return response
 
 @app.route('/logs')
 @requires_auth
@@ -323,96 +322,354 @@ def logs_page():
     """Renders the main log viewer page."""
     return render_template('old_logs.html')
 
+@app.route('/matrix')
+@requires_auth
+def matrix_page():
+    """Renders the UID x coupon status page."""
+    return render_template('matrix.html')
+
+@app.route('/api/matrix')
+@requires_auth
+def api_get_matrix():
+    """
+    Returns per-coupon success/used/failed/pending counts and the coupons each UID still lacks.
+    Served from an in-memory aggregate; clients revalidate with If-None-Match.
+    """
+    etag, body = matrix.get()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# --- Cached JSON Endpoints ---
+# The control panel's lists are served as JSON with a strong ETag and Last-Modified derived from
+# the data file's signature (mtime, size, inode) or the ledger's change marker. Clients send
+# If-None-Match and get 304 Not Modified, without the body being built, while nothing changed.
+
+def _conditional_json(etag, last_modified, build):
+    """Returns build()'s result as JSON, or 304 if the request's validators still match."""
+    response = Response(mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.set_data(json.dumps(build(), ensure_ascii=False))
+    return response.make_conditional(request)
+
+def _snapshot_validators(name, snapshot):
+    """Returns (etag, last_modified) for a data_manager snapshot."""
+    if snapshot.signature is None:
+        return f"{name}-missing", None
+    mtime_ns, size, inode = snapshot.signature
+    last_modified = datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc).replace(microsecond=0)
+    return f"{name}-{mtime_ns:x}-{size:x}-{inode:x}", last_modified
+
+@app.route('/api/uids')
+@requires_auth
+def api_get_uids():
+    """Returns the UIDs in uids.txt and the file's raw text."""
+    snapshot = data_manager.get_snapshot(data_manager.UIDS_FILE)
+    etag, last_modified = _snapshot_validators('uids', snapshot)
+    return _conditional_json(etag, last_modified, lambda: {
+        'version': etag,
+        'uids': list(snapshot.items),
+        'raw': snapshot.raw,
+    })
+
+@app.route('/api/coupons')
+@requires_auth
+def api_get_coupons():
+    """Returns the coupons in coupons.txt and the file's raw text."""
+    snapshot = data_manager.get_snapshot(data_manager.COUPONS_FILE)
+    etag, last_modified = _snapshot_validators('coupons', snapshot)
+    return _conditional_json(etag, last_modified, lambda: {
+        'version': etag,
+        'coupons': list(snapshot.items),
+        'raw': snapshot.raw,
+    })
+
+# (directory mtime_ns, sorted .log names) of the last listing of logs/.
+_log_listing = (None, [])
+_log_listing_lock = threading.Lock()
+
+def _list_log_files():
+    """Returns the .log files in logs/, newest name first. Re-lists only when the directory changed."""
+    global _log_listing
+    try:
+        mtime_ns = os.stat('logs').st_mtime_ns
+    except FileNotFoundError:
+        return None, []
+    with _log_listing_lock:
+        if _log_listing[0] != mtime_ns:
+            names = sorted((f for f in os.listdir('logs') if f.endswith('.log')), reverse=True)
+            _log_listing = (mtime_ns, names)
+        return _log_listing
+
 @app.route('/api/logs')
 @requires_auth
 def api_get_logs():
     """API endpoint to get a list of all log files."""
-    log_files = []
-    coupon_log_files = []
-
-    # Scan logs directory
-    if os.path.exists('logs'):
-        for filename in sorted(os.listdir('logs'), reverse=True):
-            if filename.endswith('.log'):
-                log_files.append(filename)
-    
-    # Scan coupon_logs directory
-    if os.path.exists('coupon_logs'):
-        for filename in sorted(os.listdir('coupon_logs'), reverse=True):
-            if filename.endswith('.txt'):
-                coupon_log_files.append(filename)
-            
-    return jsonify({
+    # Creating, deleting or rotating a file changes the directory's mtime.
+    mtime_ns, log_files = _list_log_files()
+    generation, seq = ledger.change_marker()
+    etag = hashlib.sha1(json.dumps([mtime_ns, generation, seq]).encode('utf-8')).hexdigest()
+
+    # Coupon logs are rendered from the redemption ledger under their old file names.
+    # Ledger writes do not show in any mtime, so this listing has no Last-Modified.
+    return _conditional_json(etag, None, lambda: {
+        'version': etag,
         'logs': log_files,
-        'coupon_logs': coupon_log_files
+        'coupon_logs': ledger.log_names(),
     })
 
+def _resolve_log_path(filename):
+    """Returns the path of a file in logs/, or None if the name points outside of it."""
+    dir_path = 'logs'
+    file_path = os.path.join(dir_path, filename)
+    # Security check to prevent directory traversal
+    if not os.path.abspath(file_path).startswith(os.path.abspath(dir_path) + os.sep):
+        return None
+    return file_path
+
+def _int_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    return int(value)
+
 @app.route('/api/log-content')
 @requires_auth
 def api_get_log_content():
-    """API endpoint to get the content of a specific log file."""
+    """
+    API endpoint to get a page of a log file.
+    ?tail=N returns the last N lines, or the N lines before position ?before=. ?after=<position>
+    returns the lines written after an earlier page's end, and ?offset=&limit= pages by line number.
+    Without any of these the last log_reader.DEFAULT_PAGE_LINES lines are returned. Positions are byte
+    offsets for process logs and row numbers for coupon logs; the response carries the page's
+    start/end and whether there is more before or after it.
+    """
     log_type = request.args.get('type')
     filename = request.args.get('file')
 
     if not log_type or not filename:
         return jsonify({'error': 'Missing log type or filename'}), 400
+    if log_type not in ('coupon', 'log'):
+        return jsonify({'error': 'Invalid log type'}), 400
 
-    if log_type == 'log':
-        dir_path = 'logs'
-    elif log_type == 'coupon':
-        dir_path = 'coupon_logs'
+    try:
+        tail = _int_arg('tail')
+        before = _int_arg('before')
+        after = _int_arg('after')
+        offset = _int_arg('offset')
+        limit = _int_arg('limit', log_reader.DEFAULT_PAGE_LINES)
+        if tail is not None:
+            limit = tail
+    except ValueError:
+        return jsonify({'error': 'Positions and line counts must be integers'}), 400
+    limit = max(0, min(limit, log_reader.MAX_PAGE_LINES))
+
+    if log_type == 'coupon':
+        base_filename = filename[:-len('.txt')] if filename.endswith('.txt') else filename
+        size = ledger.count_results(base_filename)
+        if after is not None:
+            start = max(0, min(after, size))
+        elif offset is not None:
+            start = max(0, min(offset, size))
+        else:
+            end = size if before is None else max(0, min(before, size))
+            start = max(0, end - limit)
+        lines = ledger.export_lines(base_filename, start, limit)
+        end = start + len(lines)
     else:
-        return jsonify({'error': 'Invalid log type'}), 400
+        file_path = _resolve_log_path(filename)
+        if file_path is None:
+            return jsonify({'error': 'Invalid file path'}), 400
+        try:
+            size = os.path.getsize(file_path)
+            if after is not None:
+                lines, start, end = log_reader.read_after(file_path, max(0, min(after, size)), limit)
+            elif offset is not None:
+                lines, has_more = log_reader.read_lines(file_path, max(0, offset), limit)
+                # Line-number pages have no byte positions; report line numbers instead.
+                start, end, size = offset, offset + len(lines), offset + len(lines) + int(has_more)
+            else:
+                lines, start, end = log_reader.tail(file_path, limit, before)
+        except FileNotFoundError:
+            lines, start, end, size = [], 0, 0, 0
 
-    file_path = os.path.join(dir_path, filename)
-    
-    # Security check to prevent directory traversal
-    if not os.path.abspath(file_path).startswith(os.path.abspath(dir_path)):
+    content = "\n".join(lines) if lines else ("File not found or empty." if size == 0 else "")
+    return jsonify({
+        'filename': filename,
+        'content': content,
+        'lines': lines,
+        'start': start,
+        'end': end,
+        'size': size,
+        'has_more_before': start > 0,
+        'has_more_after': end < size,
+    })
+
+@app.route('/api/log-download')
+@requires_auth
+def api_download_log():
+    """Downloads a whole log file. Supports Range requests, so an interrupted download can be resumed."""
+    log_type = request.args.get('type')
+    filename = request.args.get('file')
+
+    if not log_type or not filename:
+        return jsonify({'error': 'Missing log type or filename'}), 400
+
+    if log_type == 'coupon':
+        base_filename = filename[:-len('.txt')] if filename.endswith('.txt') else filename
+        content = ledger.export_text(base_filename)
+        if content is None:
+            return jsonify({'error': 'File not found'}), 404
+        body = content.encode('utf-8')
+        response = Response(body, mimetype='text/plain',
+                            headers={'Content-Disposition': f'attachment; filename={os.path.basename(filename)}'})
+        response.set_etag(hashlib.sha1(body).hexdigest())
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
+
+    if log_type != 'log':
+        return jsonify({'error': 'Invalid log type'}), 400
+    if _resolve_log_path(filename) is None:
         return jsonify({'error': 'Invalid file path'}), 400
+    # send_from_directory answers Range and If-Range requests itself.
+    return send_from_directory('logs', filename, as_attachment=True, conditional=True)
 
+def _parse_time(value):
+    """Parses a Unix timestamp or an ISO 8601 date/time (local time) into a Unix timestamp."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except FileNotFoundError:
-        content = "File not found or empty."
-        
-    return jsonify({'filename': filename, 'content': content})
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
 
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
 
+def _parse_duration(value):
+    """Parses "90", "15m", "1h" or "2d" into seconds."""
+    unit = value[-1:].lower()
+    if unit in _DURATION_UNITS:
+        return float(value[:-1]) * _DURATION_UNITS[unit]
+    return float(value)
 
+@app.route('/api/search')
+@requires_auth
+def api_search_logs():
+    """
+    Searches the worker log lines of every UID.
+    ?q= matches words in the message; ?uid=, ?coupon=, ?level= and ?result_class= filter (the last two
+    accept comma-separated lists); ?since=/?until= take Unix timestamps or ISO dates and ?last=1h is a
+    shorthand for "since an hour ago". ?group_by=uid|coupon|result_class|level returns per-value counts,
+    e.g. every UID that hit a message. ?limit= caps the number of results.
+    """
+    args = request.args
+    try:
+        since = _parse_time(args['since']) if args.get('since') else None
+        until = _parse_time(args['until']) if args.get('until') else None
+        if args.get('last'):
+            since = time.time() - _parse_duration(args['last'])
+        limit = int(args.get('limit', 100))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Invalid time or limit: {e}'}), 400
+
+    def listed(name):
+        value = args.get(name)
+        return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+    started = time.perf_counter()
+    try:
+        results = search_index.search(
+            text=args.get('q'), uid=args.get('uid'), coupon=args.get('coupon'),
+            level=listed('level'), result_class=listed('result_class'),
+            since=since, until=until, group_by=args.get('group_by'), limit=limit,
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({
+        'results': results,
+        'count': len(results),
+        'took_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
 
 @app.route('/status')
 @requires_auth
 def get_status():
-    """Returns the status of all running and finished threads."""
-    with thread_lock:
-        # Clean up finished threads that are no longer active
-        active_threads = {}
-        for key, data in running_threads.items():
-            if 'thread' in data and data['thread'].is_alive():
-                active_threads[key] = data
-            elif data.get('status') not in ['Finished', 'Error']:
-                # If thread is dead but status wasn't final, mark as Finished
-                data['status'] = 'Finished'
-                active_threads[key] = data
-            else: # Already Finished or Error
-                 active_threads[key] = data
-
-
-        running_threads.clear()
-        running_threads.update(active_threads);
-
-        # Create a JSON-serializable copy of the status dictionary
-        status_copy = {}
-        for key, value in running_threads.items():
-            status_copy[key] = {
-                'status': value.get('status', 'Unknown'),
-                'log_preview': value.get('log_preview', ''),
-                'display_name': value.get('display_name', key),
-                'session_id': value.get('session_id')
-            }
-        
-        return jsonify(status_copy)
+    """
+    Returns the status of all running and finished sessions from the shared status store,
+    so every process gives the same answer. Clients revalidate with If-None-Match.
+    """
+    version, sessions = session_status.collect()
+    response = jsonify(sessions)
+    response.set_etag(f"status-{version}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/status/stream')
+@requires_auth
+def stream_status():
+    """
+    Server-Sent Events: a 'snapshot' event with every session on connect, then a message with only the
+    sessions whose status changed, at most every STATUS_STREAM_INTERVAL seconds. Shares the per-process
+    stream budget with the log viewers.
+    """
+    try:
+        log_tailer.open_stream('/status/stream')
+    except log_tailer.SubscriberLimitReached:
+        return Response("Too many live pages are open. Close one and try again.", status=503,
+                        headers={'Retry-After': '30'})
+
+    def generate():
+        version, sessions = session_status.collect()
+        yield f"event: snapshot\ndata: {json.dumps(sessions)}\n\n"
+        while True:
+            if not session_status.wait_for_change(version, timeout=session_status.STREAM_KEEPALIVE_SECONDS):
+                # Keeps proxies from closing an idle connection.
+                yield ": keep-alive\n\n"
+                continue
+            # Let a burst of log lines settle into one message.
+            time.sleep(config.STATUS_STREAM_INTERVAL)
+            version, sessions = session_status.collect(since=version)
+            if sessions:
+                yield f"data: {json.dumps(sessions)}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the client disconnects, even if the stream never started.
+    response.call_on_close(log_tailer.close_stream)
+    return response
+
+@app.route('/api/jobs')
+@requires_auth
+def api_get_jobs():
+    """Returns job counts per state and the queued, running and parked jobs."""
+    return jsonify({
+        'counts': job_queue.counts(),
+        'active': job_queue.active_jobs()
+    })
+
+@app.route('/metrics')
+@requires_auth
+def prometheus_metrics():
+    """Phase timings, coupon results and queue gauges of every process, in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/coupon-status')
+@requires_auth
+def api_get_coupon_status():
+    """Returns what the store has told us about each coupon code (valid / invalid / expired / unknown)."""
+    return jsonify({'coupons': coupon_cache.all_statuses()})
+
+@app.route('/api/coupon-status/forget', methods=['POST'])
+@requires_auth
+def api_forget_coupon_status():
+    """Clears a coupon's cached status so every UID will try it again."""
+    coupon = request.json.get('coupon')
+    if not coupon:
+        return jsonify({'status': 'error', 'message': 'Coupon is required'}), 400
+    if coupon_cache.forget(coupon):
+        return jsonify({'status': 'success', 'message': f'Cached status for {coupon} cleared.'})
+    return jsonify({'status': 'error', 'message': 'Coupon has no cached status.'}), 404
 
 @app.route('/save/uids', methods=['POST'])
 @requires_auth
@@ -432,6 +689,102 @@ def save_coupons():
     else:
         return jsonify({'status': 'error', 'message': 'Failed to save coupons file.'}), 500
 
+def _import_upload(import_func):
+    """
+    Runs a bulk import on the uploaded file (multipart field 'file') or on the raw request body.
+    The format comes from ?format= or the file extension; ?dry_run=1 validates without saving.
+    """
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = bulk_io.detect_format(upload.filename if upload else None, request.args.get('format'))
+    dry_run = request.args.get('dry_run') in ('1', 'true', 'yes')
+    try:
+        summary, rows = import_func(stream, fmt, dry_run=dry_run)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'status': 'error', 'message': f'Could not read {fmt} upload: {e}'}), 400
+    except Exception as e:
+        app.logger.error(f"Bulk import failed: {e}")
+        return jsonify({'status': 'error', 'message': 'Import failed.'}), 500
+    return jsonify({'status': 'success', 'dry_run': dry_run, 'format': fmt, 'summary': summary, 'rows': rows})
+
+def _export_download(export_func, name):
+    fmt = request.args.get('format', 'txt')
+    if fmt not in bulk_io.FORMATS:
+        return jsonify({'status': 'error', 'message': f'Unknown format: {fmt}'}), 400
+    return Response(stream_with_context(export_func(fmt)), mimetype=bulk_io.MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'})
+
+@app.route('/api/uids/import', methods=['POST'])
+@requires_auth
+def api_import_uids():
+    return _import_upload(bulk_io.import_uids)
+
+@app.route('/api/coupons/import', methods=['POST'])
+@requires_auth
+def api_import_coupons():
+    return _import_upload(bulk_io.import_coupons)
+
+@app.route('/api/uids/export')
+@requires_auth
+def api_export_uids():
+    return _export_download(bulk_io.export_uids, 'uids')
+
+@app.route('/api/coupons/export')
+@requires_auth
+def api_export_coupons():
+    return _export_download(bulk_io.export_coupons, 'coupons')
+
+@app.route('/api/ledger/compact', methods=['POST'])
+@requires_auth
+def api_compact_ledger():
+    """Drops transient failures from the redemption ledger so those coupons are retried (what failed.sh did)."""
+    result = ledger.compact()
+    return jsonify({
+        'status': 'success',
+        'message': f"Removed {result['ledger_removed']} transient results; {result['ledger_remaining']} remain.",
+        'result': result
+    })
+
+@app.route('/api/backups', methods=['GET'])
+@requires_auth
+def api_list_backups():
+    """Lists backup snapshots, newest first, with the files each one holds."""
+    snapshots = []
+    for name in backup.list_snapshots():
+        manifest = backup.load_manifest(name)
+        snapshots.append({
+            'name': name,
+            'created_at': manifest['created_at'],
+            'files': {path: entry['size'] for path, entry in manifest['files'].items()}
+        })
+    return jsonify({'snapshots': snapshots})
+
+@app.route('/api/backups', methods=['POST'])
+@requires_auth
+def api_create_backup():
+    """Takes a backup snapshot now. Nothing is written if no file changed since the last one."""
+    name = backup.create_snapshot()
+    if name is None:
+        return jsonify({'status': 'success', 'message': 'Nothing changed since the last backup.', 'snapshot': None})
+    return jsonify({'status': 'success', 'message': f'Backup snapshot {name} created.', 'snapshot': name})
+
+@app.route('/api/backups/restore', methods=['POST'])
+@requires_auth
+def api_restore_backup():
+    """
+    Restores a backup snapshot: {"snapshot": "<name>", "files": [optional list of file names]}.
+    The current state is backed up first, so a restore can itself be undone.
+    """
+    data = request.json or {}
+    name = data.get('snapshot')
+    if not name:
+        return jsonify({'status': 'error', 'message': 'Snapshot name is required'}), 400
+    try:
+        restored = backup.restore(name, data.get('files'))
+    except FileNotFoundError as e:
+        return jsonify({'status': 'error', 'message': f'Not found: {e}'}), 404
+    return jsonify({'status': 'success', 'message': f'Restored {len(restored)} files from {name}.', 'restored': restored})
+
 
 @app.route('/delete_coupon', methods=['POST'])
 @requires_auth
@@ -459,16 +812,42 @@ def delete_uid():
         return jsonify({'status': 'error', 'message': 'UID not found or error deleting.'}), 404
 
 
-@app.route('/screenshots/<filename>')
+@app.route('/screenshots/<path:filename>')
 @requires_auth
 def get_screenshot(filename):
-    """Serves the screenshot image."""
-    return send_from_directory('screenshots', filename)
+    """
+    Serves a screenshot image. History frames never change, so browsers keep them; the latest frame
+    and its thumbnail are overwritten in place, so browsers revalidate them with their ETag.
+    """
+    response = send_from_directory(config.SCREENSHOT_DIR, filename, conditional=True)
+    if filename.startswith(f"{screenshots.HISTORY_DIR}/"):
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/screenshots/<base_filename>')
+@requires_auth
+def api_get_screenshots(base_filename):
+    """Lists a UID's latest screenshot, its thumbnail and its recent frames as /screenshots/ URLs."""
+    if base_filename.startswith('.'):
+        return jsonify({'error': 'Invalid UID'}), 400
+    files = screenshots.recent(base_filename)
+    def url(name):
+        return url_for('get_screenshot', filename=name) if name else None
+    return jsonify({
+        'latest': url(files['latest']),
+        'thumbnail': url(files['thumbnail']),
+        'history': [url(name) for name in files['history']],
+    })
 
 if __name__ == '__main__':
+    scheduler.start(running_threads, thread_lock)
+    backup.start()
     app.run(debug=False, host='0.0.0.0', port=5001)
 else:
-    # Start the backup scheduler in a background thread when run with Gunicorn
-    backup_thread = threading.Thread(target=backup_scheduler)
-    backup_thread.daemon = True
-    backup_thread.start()
\ No newline at end of file
+    # Start the job scheduler. Only one process in the container becomes its leader.
+    scheduler.start(running_threads, thread_lock)
+
+    # Start the backup scheduler. Likewise, only its leader takes backups.
+    backup.start()
\ No newline at end of file
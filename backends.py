@@ -0,0 +1,37 @@
+import config
+import http_backend
+import worker
+
+# --- Redemption Backends ---
+# A backend takes a batch of accounts (dicts with 'uid', 'comment', 'coupons', 'force_run' and
+# 'status_dict') and redeems their coupons. process_batch returns the accounts it could not handle,
+# with 'coupons' narrowed to what is left, so the scheduler can hand them to the Selenium backend.
+
+SELENIUM = 'selenium'
+HTTP = 'http'
+
+class SeleniumBackend:
+    """The browser flow in worker.py. Needs a session slot on the Selenium hub."""
+    name = SELENIUM
+    needs_browser = True
+
+    def process_batch(self, accounts, lock):
+        worker.process_uid_batch(accounts, lock)
+        return []
+
+class HttpBackend:
+    """Replays the store's HTTP calls without a browser. Falls back to Selenium on failure."""
+    name = HTTP
+    needs_browser = False
+
+    def process_batch(self, accounts, lock):
+        return http_backend.process_uid_batch(accounts, lock)
+
+BACKENDS = {
+    SELENIUM: SeleniumBackend(),
+    HTTP: HttpBackend(),
+}
+
+def get_backend(name=None):
+    """Returns the named backend, or the configured default (REDEEM_BACKEND)."""
+    return BACKENDS.get(name or config.REDEEM_BACKEND, BACKENDS[SELENIUM])
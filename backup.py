@@ -0,0 +1,284 @@
+import os
+import json
+import fcntl
+import gzip
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import config
+import coupon_cache
+import data_manager
+import leader
+import ledger
+
+# --- Content-Addressed Backups ---
+# A snapshot is a small JSON manifest that maps each backed-up file to the SHA-256 of its content.
+# Contents are stored once, gzip-compressed, under objects/<hash[:2]>/<hash>.gz, so unchanged files
+# cost nothing and a snapshot is only written when some hash changed since the previous one.
+# Besides uids.txt and coupons.txt, snapshots hold the redemption ledger and coupon status cache
+# (exported as ordered JSON lines so identical content hashes identically), the worker logs and
+# any legacy coupon_logs. Retention keeps the newest snapshot of each of the last BACKUP_KEEP_DAILY
+# days and of each of the last BACKUP_KEEP_WEEKLY ISO weeks; unreferenced objects are then removed.
+# One process per container (elected with leader.py) runs the nightly backup.
+
+OBJECTS_DIR = os.path.join(config.BACKUP_DIR, "objects")
+MANIFESTS_DIR = os.path.join(config.BACKUP_DIR, "manifests")
+
+# Logical name of the ledger export inside a snapshot.
+LEDGER_NAME = "ledger.jsonl"
+
+# Directories whose files are included, with the extensions to pick up.
+LOG_SOURCES = (("logs", ".log"), ("coupon_logs", ".txt"))
+
+# How often (in seconds) a non-leader process checks whether it should take over.
+LEADER_RETRY_SECONDS = 60
+
+_backup_lock = threading.Lock()
+LOCK_FILE = os.path.join(config.BACKUP_DIR, ".backup.lock")
+_scheduler_thread = None
+_start_lock = threading.Lock()
+
+@contextmanager
+def _locked():
+    """
+    Holds the backup lock in this process and across processes, so retention never collects objects
+    of a snapshot another process is still writing, and restores do not interleave with snapshots.
+    """
+    os.makedirs(config.BACKUP_DIR, exist_ok=True)
+    with _backup_lock:
+        with open(LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _object_path(digest):
+    return os.path.join(OBJECTS_DIR, digest[:2], f"{digest}.gz")
+
+def _store_object(path):
+    """Stores a file's content if it is not stored yet. Returns (sha256, size)."""
+    digest = _hash_file(path)
+    object_path = _object_path(digest)
+    if not os.path.exists(object_path):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(object_path), prefix=".tmp.")
+        try:
+            with open(path, 'rb') as src, os.fdopen(fd, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as dst:
+                    shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, object_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return digest, os.path.getsize(path)
+
+def _export_ledger(path):
+    """Writes the ledger and coupon status cache as ordered JSON lines."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in ledger.all_rows():
+            f.write(json.dumps({'table': 'redemptions', **row}, ensure_ascii=False, sort_keys=True) + "\n")
+        for row in sorted(coupon_cache.all_statuses(), key=lambda r: r['coupon']):
+            f.write(json.dumps({'table': 'coupon_status', **row}, ensure_ascii=False, sort_keys=True) + "\n")
+
+def _source_files():
+    """Returns { logical name: path on disk } for everything that goes into a snapshot."""
+    sources = {}
+    for path in (data_manager.UIDS_FILE, data_manager.COUPONS_FILE):
+        if os.path.exists(path):
+            sources[os.path.relpath(path)] = path
+    for directory, extension in LOG_SOURCES:
+        if os.path.isdir(directory):
+            for filename in sorted(os.listdir(directory)):
+                if filename.endswith(extension):
+                    sources[os.path.join(directory, filename)] = os.path.join(directory, filename)
+    return sources
+
+def list_snapshots():
+    """Returns snapshot names (their timestamps), newest first."""
+    if not os.path.isdir(MANIFESTS_DIR):
+        return []
+    return sorted((f[:-len('.json')] for f in os.listdir(MANIFESTS_DIR) if f.endswith('.json')), reverse=True)
+
+def load_manifest(name):
+    """Returns a snapshot's manifest. Raises FileNotFoundError for unknown snapshots."""
+    if os.sep in name or name.startswith('.'):
+        raise FileNotFoundError(name)
+    with open(os.path.join(MANIFESTS_DIR, f"{name}.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def create_snapshot():
+    """
+    Backs up every source whose content changed since the last snapshot.
+    Returns the new snapshot's name, or None if nothing changed.
+    """
+    with _locked():
+        return _create_snapshot()
+
+def _create_snapshot():
+    """create_snapshot() for callers already holding the backup lock."""
+    os.makedirs(MANIFESTS_DIR, exist_ok=True)
+    files = {}
+    with tempfile.TemporaryDirectory(dir=config.BACKUP_DIR) as tmp_dir:
+        ledger_path = os.path.join(tmp_dir, LEDGER_NAME)
+        _export_ledger(ledger_path)
+        sources = {LEDGER_NAME: ledger_path, **_source_files()}
+        for name, path in sources.items():
+            try:
+                digest, size = _store_object(path)
+            except FileNotFoundError:
+                # A log rotated away between listing and reading it.
+                continue
+            files[name] = {'sha256': digest, 'size': size}
+
+    snapshots = list_snapshots()
+    if snapshots and load_manifest(snapshots[0])['files'] == files:
+        logging.info("Backup skipped: nothing changed since the last snapshot.")
+        return None
+
+    name = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    manifest = {'name': name, 'created_at': time.time(), 'files': files}
+    tmp_path = os.path.join(MANIFESTS_DIR, f".{name}.json")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(MANIFESTS_DIR, f"{name}.json"))
+    logging.info(f"Backup snapshot {name} written ({len(files)} files).")
+    return name
+
+def apply_retention(now=None):
+    """Deletes snapshots outside the daily/weekly retention and objects no snapshot uses. Returns the deleted snapshot names."""
+    with _locked():
+        now = now or datetime.now()
+        keep = set()
+        daily_cutoff = (now - timedelta(days=config.BACKUP_KEEP_DAILY)).date()
+        weekly_cutoff = (now - timedelta(weeks=config.BACKUP_KEEP_WEEKLY)).date()
+        seen_days, seen_weeks = set(), set()
+        snapshots = list_snapshots()
+        # Newest first, so the first snapshot seen for a day or week is the one kept.
+        for name in snapshots:
+            taken = datetime.strptime(name, "%Y-%m-%d_%H%M%S")
+            day, week = taken.date(), taken.isocalendar()[:2]
+            if day > daily_cutoff and day not in seen_days:
+                keep.add(name)
+            if day > weekly_cutoff and week not in seen_weeks:
+                keep.add(name)
+            seen_days.add(day)
+            seen_weeks.add(week)
+        if snapshots:
+            # Never delete the latest snapshot.
+            keep.add(snapshots[0])
+
+        deleted = [name for name in snapshots if name not in keep]
+        for name in deleted:
+            os.remove(os.path.join(MANIFESTS_DIR, f"{name}.json"))
+
+        referenced = {entry['sha256'] for name in keep for entry in load_manifest(name)['files'].values()}
+        if os.path.isdir(OBJECTS_DIR):
+            for prefix in os.listdir(OBJECTS_DIR):
+                for filename in os.listdir(os.path.join(OBJECTS_DIR, prefix)):
+                    if filename.endswith('.gz') and filename[:-len('.gz')] not in referenced:
+                        os.remove(os.path.join(OBJECTS_DIR, prefix, filename))
+        if deleted:
+            logging.info(f"Backup retention removed {len(deleted)} snapshots.")
+        return deleted
+
+def read_object(digest):
+    """Returns the decompressed content of a stored object."""
+    with gzip.open(_object_path(digest), 'rb') as f:
+        return f.read()
+
+def restore(name, files=None):
+    """
+    Restores files from a snapshot, all of them or only the logical names in `files`.
+    A snapshot of the current state is taken first so the restore can be undone.
+    Returns the list of restored names. Raises FileNotFoundError for unknown snapshots or names.
+    """
+    manifest = load_manifest(name)
+    selected = files or list(manifest['files'])
+    unknown = [f for f in selected if f not in manifest['files']]
+    if unknown:
+        raise FileNotFoundError(f"Not in snapshot {name}: {', '.join(unknown)}")
+
+    restored = []
+    with _locked():
+        _create_snapshot()
+        for logical_name in selected:
+            content = read_object(manifest['files'][logical_name]['sha256'])
+            if logical_name == LEDGER_NAME:
+                _restore_ledger(content)
+            elif logical_name == os.path.relpath(data_manager.UIDS_FILE):
+                data_manager.save_uids_raw(content.decode('utf-8'))
+            elif logical_name == os.path.relpath(data_manager.COUPONS_FILE):
+                data_manager.save_coupons_raw(content.decode('utf-8'))
+            else:
+                _restore_file(logical_name, content)
+            restored.append(logical_name)
+    logging.info(f"Restored {len(restored)} files from backup snapshot {name}.")
+    return restored
+
+def _restore_ledger(content):
+    tables = {'redemptions': [], 'coupon_status': []}
+    for line in content.decode('utf-8').splitlines():
+        if line.strip():
+            row = json.loads(line)
+            tables[row.pop('table')].append(row)
+    ledger.replace_all(tables['redemptions'])
+    coupon_cache.replace_all(tables['coupon_status'])
+
+def _restore_file(logical_name, content):
+    # Only paths inside the backed-up log directories may be written.
+    directory = os.path.dirname(logical_name)
+    if directory not in {d for d, _ in LOG_SOURCES} or os.path.basename(logical_name) in ('', '.', '..'):
+        raise FileNotFoundError(logical_name)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".restore.")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, logical_name)
+
+def run_backup():
+    """Takes a snapshot if anything changed, then applies retention."""
+    try:
+        create_snapshot()
+        apply_retention()
+    except Exception as e:
+        logging.error(f"Backup failed: {e}")
+
+def _scheduler_loop():
+    while not leader.try_acquire('backup'):
+        time.sleep(LEADER_RETRY_SECONDS)
+    logging.info("Backup scheduler started in this process.")
+    while True:
+        now = datetime.now()
+        # Calculate the next midnight
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        sleep_seconds = (midnight - now).total_seconds()
+        logging.info(f"Backup scheduler will sleep for {sleep_seconds / 3600:.2f} hours until next backup.")
+        time.sleep(sleep_seconds)
+        logging.info("Performing scheduled daily backup...")
+        run_backup()
+        # Sleep for a short while to ensure we don't run it twice in the same second
+        time.sleep(1)
+
+def start():
+    """Starts this process's backup scheduler. Only the elected leader ever runs backups."""
+    global _scheduler_thread
+    with _start_lock:
+        if _scheduler_thread is None or not _scheduler_thread.is_alive():
+            _scheduler_thread = threading.Thread(target=_scheduler_loop, name="backup-scheduler")
+            _scheduler_thread.daemon = True
+            _scheduler_thread.start()
@@ -0,0 +1,273 @@
+import io
+import re
+import csv
+import json
+
+import config
+import data_manager
+
+# --- Bulk Import / Export ---
+# Parses uploaded UID and coupon lists row by row (CSV, JSON array, JSON Lines or the plain
+# uids.txt/coupons.txt format) without reading the whole upload into memory, validates each row,
+# and hands the accepted ones to data_manager in a single atomic write. Exporters stream the
+# data files back out line by line in the same formats.
+
+FORMATS = ('csv', 'json', 'jsonl', 'txt')
+
+_uid_pattern = re.compile(config.UID_PATTERN)
+
+# How much of a JSON upload is read at a time while streaming through an array.
+_JSON_CHUNK_SIZE = 64 * 1024
+# Characters that can continue a JSON number.
+_NUMBER_CHARS = '0123456789.eE+-'
+
+def detect_format(filename, requested=None):
+    """Picks the upload format from an explicit `format` value or the file extension. Defaults to txt."""
+    if requested in FORMATS:
+        return requested
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension == 'ndjson':
+        return 'jsonl'
+    return extension if extension in FORMATS else 'txt'
+
+def _iter_json_array(text_stream):
+    """Yields the elements of a top-level JSON array one at a time, reading the stream in chunks."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    started = False
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ',')):
+            position += 1
+
+        # Need more input: the buffer is used up, or the next element may continue past it.
+        if position == len(buffer):
+            if eof:
+                if started:
+                    raise ValueError("JSON array is not closed.")
+                return
+            chunk = text_stream.read(_JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        if not started:
+            if buffer[position] != '[':
+                raise ValueError("JSON upload must be an array.")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            end = None
+        # A number at the very end of the buffer, or cut off before its fraction or exponent
+        # ("12" + ".5"), may go on in the next chunk, so read on before trusting it.
+        cut_off = end is not None and not eof and (
+            end == len(buffer)
+            or (isinstance(value, (int, float)) and not isinstance(value, bool) and buffer[end] in _NUMBER_CHARS)
+        )
+        if end is None or cut_off:
+            if eof:
+                raise ValueError(f"Invalid JSON near: {buffer[position:position + 40]!r}")
+            chunk = text_stream.read(_JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield value
+        position = end
+
+def iter_rows(stream, fmt):
+    """
+    Yields (row_number, value) for each record in an uploaded binary stream.
+    `value` is a dict for CSV-with-header and JSON objects, a list for headerless CSV rows and
+    JSON arrays, or a string for plain lines and JSON strings.
+    """
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        reader = csv.reader(text_stream)
+        header = None
+        for number, row in enumerate(reader, start=1):
+            if not any(cell.strip() for cell in row):
+                continue
+            if number == 1 and any(cell.strip().lower() in ('uid', 'coupon', 'code', 'comment') for cell in row):
+                header = [cell.strip().lower() for cell in row]
+                continue
+            yield number, dict(zip(header, row)) if header else row
+    elif fmt == 'json':
+        for number, value in enumerate(_iter_json_array(text_stream), start=1):
+            yield number, value
+    else:
+        for number, line in enumerate(text_stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if fmt == 'jsonl':
+                try:
+                    line = json.loads(line)
+                except ValueError:
+                    # Reported as an unreadable row rather than failing the whole upload.
+                    line = None
+            yield number, line
+
+def _uid_fields(value):
+    """Returns (uid, comment) from an uploaded UID record."""
+    if isinstance(value, dict):
+        return str(value.get('uid') or '').strip(), str(value.get('comment') or '').strip()
+    if isinstance(value, (list, tuple)):
+        return (str(value[0]).strip() if value else ''), (str(value[1]).strip() if len(value) > 1 else '')
+    if isinstance(value, str):
+        # The uids.txt line format: "<uid> #<comment>"
+        uid, _, comment = value.partition('#')
+        return uid.strip(), comment.strip()
+    return '', ''
+
+def _coupon_field(value):
+    """Returns the coupon code from an uploaded coupon record."""
+    if isinstance(value, dict):
+        return str(value.get('coupon') or value.get('code') or '').strip()
+    if isinstance(value, (list, tuple)):
+        return str(value[0]).strip() if value else ''
+    if isinstance(value, (str, int)):
+        return str(value).strip()
+    return ''
+
+def validate_uid(uid, comment):
+    """Returns an error message for an invalid UID entry, or None."""
+    if not uid:
+        return "Missing UID."
+    if not _uid_pattern.match(uid):
+        return f"UID '{uid}' does not match the expected format."
+    if not comment:
+        return "Missing comment."
+    if '#' in comment or '\n' in comment:
+        return "Comment must not contain '#' or line breaks."
+    return None
+
+def validate_coupon(coupon):
+    """Returns an error message for an invalid coupon code, or None."""
+    if not coupon:
+        return "Missing coupon code."
+    if '#' in coupon or any(ch.isspace() for ch in coupon):
+        return f"Coupon '{coupon}' must not contain spaces or '#'."
+    return None
+
+def _row_result(number, status, value, message=None):
+    result = {'row': number, 'status': status, 'value': value}
+    if message:
+        result['message'] = message
+    return result
+
+def import_uids(stream, fmt, dry_run=False):
+    """
+    Imports UIDs from an uploaded stream. Returns (summary, rows) where `rows` has one result per
+    record: 'added', 'duplicate' (already listed or repeated in the upload) or 'invalid'.
+    Accepted UIDs are written in one atomic update unless `dry_run` is set.
+    """
+    rows = []
+    accepted = []
+    for number, value in iter_rows(stream, fmt):
+        if value is None:
+            rows.append(_row_result(number, 'invalid', None, "Could not parse row."))
+            continue
+        uid, comment = _uid_fields(value)
+        error = validate_uid(uid, comment)
+        if error:
+            rows.append(_row_result(number, 'invalid', f"{uid} #{comment}", error))
+            continue
+        accepted.append((number, uid, comment))
+
+    added = data_manager.add_uids([(uid, comment) for _, uid, comment in accepted], dry_run=dry_run)
+    for number, uid, comment in accepted:
+        status = 'added' if (uid, comment) in added else 'duplicate'
+        added.discard((uid, comment))
+        rows.append(_row_result(number, status, f"{uid} #{comment}"))
+    return _summarize(rows), sorted(rows, key=lambda row: row['row'])
+
+def import_coupons(stream, fmt, dry_run=False):
+    """Imports coupon codes from an uploaded stream. Same results as import_uids."""
+    rows = []
+    accepted = []
+    for number, value in iter_rows(stream, fmt):
+        if value is None:
+            rows.append(_row_result(number, 'invalid', None, "Could not parse row."))
+            continue
+        coupon = _coupon_field(value)
+        error = validate_coupon(coupon)
+        if error:
+            rows.append(_row_result(number, 'invalid', coupon, error))
+            continue
+        accepted.append((number, coupon))
+
+    added = data_manager.add_coupons([coupon for _, coupon in accepted], dry_run=dry_run)
+    for number, coupon in accepted:
+        status = 'added' if coupon in added else 'duplicate'
+        added.discard(coupon)
+        rows.append(_row_result(number, status, coupon))
+    return _summarize(rows), sorted(rows, key=lambda row: row['row'])
+
+def _summarize(rows):
+    summary = {'added': 0, 'duplicate': 0, 'invalid': 0}
+    for row in rows:
+        summary[row['status']] += 1
+    return summary
+
+# --- Export ---
+
+def _csv_line(values):
+    out = io.StringIO()
+    csv.writer(out).writerow(values)
+    return out.getvalue()
+
+def export_uids(fmt):
+    """Yields uids.txt in the given format, one record at a time."""
+    if fmt == 'csv':
+        yield _csv_line(['uid', 'comment'])
+    elif fmt == 'json':
+        yield '['
+    first = True
+    for entry in data_manager.iter_uids():
+        if fmt == 'csv':
+            yield _csv_line([entry['uid'], entry['comment']])
+        elif fmt in ('json', 'jsonl'):
+            record = json.dumps({'uid': entry['uid'], 'comment': entry['comment']}, ensure_ascii=False)
+            if fmt == 'json':
+                yield record if first else f",{record}"
+            else:
+                yield f"{record}\n"
+        else:
+            yield f"{entry['uid']} #{entry['comment']}\n"
+        first = False
+    if fmt == 'json':
+        yield ']'
+
+def export_coupons(fmt):
+    """Yields coupons.txt in the given format, one record at a time."""
+    if fmt == 'csv':
+        yield _csv_line(['coupon'])
+    elif fmt == 'json':
+        yield '['
+    first = True
+    for coupon in data_manager.iter_coupons():
+        if fmt == 'csv':
+            yield _csv_line([coupon])
+        elif fmt == 'json':
+            yield json.dumps(coupon) if first else f",{json.dumps(coupon)}"
+        elif fmt == 'jsonl':
+            yield json.dumps({'coupon': coupon}) + "\n"
+        else:
+            yield f"{coupon}\n"
+        first = False
+    if fmt == 'json':
+        yield ']'
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'jsonl': 'application/x-ndjson',
+    'txt': 'text/plain',
+}
@@ -0,0 +1,111 @@
+import re
+import enum
+import json
+import logging
+
+import config
+
+# --- Result Classification ---
+# Turns a redemption result message into a ResultCode. The messages the worker writes itself are
+# looked up exactly. Every phrase of the catalog is compiled into a single case-insensitive regex, so
+# a store message is scanned once instead of once per phrase list. English phrases only match whole
+# words ("invalid code" is not found in "invalid codes"); Korean phrases are word stems and match
+# anywhere. When phrases of several codes occur in one message, the code listed first in the catalog wins.
+# The built-in catalog can be extended with a JSON file (RESULT_CATALOG_PATH) such as
+# {"RATE_LIMITED": ["please wait"], "EXPIRED": ["기한이 지난"]}.
+
+class ResultCode(enum.StrEnum):
+    SUCCESS = 'success'
+    ALREADY_USED = 'already_used'
+    LIMIT_REACHED = 'limit_reached'
+    INVALID = 'invalid'
+    EXPIRED = 'expired'
+    RATE_LIMITED = 'rate_limited'
+    FAILED = 'failed'
+    UNKNOWN = 'unknown'
+
+# Results that say nothing final about the coupon for a UID; it is tried again on the next run.
+TRANSIENT_CODES = (ResultCode.RATE_LIMITED, ResultCode.FAILED)
+
+# Store errors that end the coupon for a UID.
+REJECTED_CODES = (ResultCode.ALREADY_USED, ResultCode.LIMIT_REACHED, ResultCode.INVALID, ResultCode.EXPIRED)
+
+# Written by the worker itself when it got no answer from the store. A store message that merely
+# contains "failed" is classified by its other phrases, so a real rejection is never retried forever.
+WORKER_MESSAGES = {
+    "Unknown Error (Fleeting)": ResultCode.FAILED,
+    "Failed after multiple retries": ResultCode.FAILED,
+    "Success": ResultCode.SUCCESS,
+}
+
+# { code: phrases }, highest priority first.
+DEFAULT_CATALOG = {
+    ResultCode.INVALID: [
+        "Data does not exist", "데이터가 존재하지 않", "Invalid CDKey", "invalid code", "invalid gift code",
+        "유효하지 않은 코드", "유효하지 않은 CDKey",
+    ],
+    ResultCode.EXPIRED: [
+        "code has expired", "coupon has expired", "CDKey has expired", "event has ended", "redemption has ended",
+        "쿠폰이 만료", "코드가 만료", "기간이 만료", "이벤트가 종료", "교환 기간이 종료",
+    ],
+    ResultCode.LIMIT_REACHED: ["Personal redemption limit reached", "개인 교환 횟수 제한"],
+    ResultCode.ALREADY_USED: ["Already Used", "이미 사용"],
+    ResultCode.RATE_LIMITED: [
+        "빈번한", "frequent", "too many", "try again later", "잠시 후 다시 시도", "작업이 너무 자주", "횟수가 초과",
+        # Written by older versions when a UID was parked.
+        "Limit/Rate", "Paused",
+    ],
+    ResultCode.SUCCESS: ["Success"],
+    # Only phrases from RESULT_CATALOG_PATH; the worker's own failures are in WORKER_MESSAGES.
+    ResultCode.FAILED: [],
+}
+
+def load_catalog(path=None):
+    """Returns the built-in catalog extended with the phrases from a JSON catalog file, if one is configured."""
+    catalog = {code: list(phrases) for code, phrases in DEFAULT_CATALOG.items()}
+    path = path if path is not None else config.RESULT_CATALOG_PATH
+    if not path:
+        return catalog
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            extra = json.load(f)
+        for name, phrases in extra.items():
+            catalog[ResultCode[name.upper()]].extend(phrases)
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Could not load result catalog {path}: {e}. Using the built-in catalog.")
+    return catalog
+
+def _phrase_pattern(phrase):
+    """Escapes a phrase; an end that is an ASCII letter or digit must also be a word boundary."""
+    pattern = re.escape(phrase)
+    if phrase[:1].isascii() and phrase[:1].isalnum():
+        pattern = r'\b' + pattern
+    if phrase[-1:].isascii() and phrase[-1:].isalnum():
+        pattern = pattern + r'\b'
+    return pattern
+
+def compile_catalog(catalog):
+    """
+    Compiles a catalog into one regex. Each alternative sits in a lookahead, so every position of the
+    message is tried and overlapping phrases of different codes are all found.
+    """
+    groups = []
+    for code, phrases in catalog.items():
+        if phrases:
+            alternatives = '|'.join(_phrase_pattern(p) for p in sorted(phrases, key=len, reverse=True))
+            groups.append(f"(?P<{code.name}>{alternatives})")
+    return re.compile(f"(?=(?:{'|'.join(groups)}))", re.IGNORECASE)
+
+_catalog = load_catalog()
+_pattern = compile_catalog(_catalog)
+# { group name: (priority, code) }; the lowest priority number wins.
+_priority = {code.name: (rank, code) for rank, code in enumerate(_catalog)}
+
+def classify(message):
+    """Returns the ResultCode for a result message."""
+    if not message:
+        return ResultCode.UNKNOWN
+    if message.strip() in WORKER_MESSAGES:
+        return WORKER_MESSAGES[message.strip()]
+    matches = [_priority[match.lastgroup] for match in _pattern.finditer(message)]
+    return min(matches)[1] if matches else ResultCode.UNKNOWN
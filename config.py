@@ -18,6 +18,156 @@ MAX_CONCURRENT_SESSIONS = int(os.getenv("MAX_CONCURRENT_SESSIONS", 1))
 # If the variable is not set, it defaults to 10.
 DELAY_BETWEEN_SESSIONS = int(os.getenv("DELAY_BETWEEN_SESSIONS", 10))
 
+# --- Rate Limit Settings ---
+# How long (in seconds) a rate-limited UID is parked before its remaining coupons are retried.
+# The browser session and slot are released while the UID is parked.
+# It reads from the "RATE_LIMIT_COOLDOWN_SECONDS" environment variable.
+# If the variable is not set, it defaults to 660.
+RATE_LIMIT_COOLDOWN_SECONDS = int(os.getenv("RATE_LIMIT_COOLDOWN_SECONDS", 660))
+
+# --- Batch Settings ---
+# The number of UIDs processed one after another in a single browser session.
+# Each UID is logged out before the next one logs in, saving session startup and the first page load.
+# It reads from the "BATCH_SIZE" environment variable.
+# If the variable is not set, it defaults to 1 (one browser session per UID).
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 1))
+
+# --- Scheduler Settings ---
+# How often (in seconds) the job scheduler re-checks the queue when it has not been woken up,
+# e.g. for jobs queued by another process or parked jobs whose cooldown expired.
+# It reads from the "SCHEDULER_POLL_SECONDS" environment variable.
+# If the variable is not set, it defaults to 2.
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", 2))
+
+# The number of jobs this process runs at the same time. Jobs are run by a fixed set of asyncio
+# workers that hand the blocking browser and HTTP work to a thread pool of this size.
+# It reads from the "RUNNER_WORKERS" environment variable.
+# If the variable is not set, it defaults to 0 (MAX_CONCURRENT_SESSIONS + HTTP_CONCURRENCY).
+RUNNER_WORKERS = int(os.getenv("RUNNER_WORKERS", 0))
+
+# How often (in hours) the scheduler leader drops transient failures from the redemption ledger
+# so those coupons are retried, like running failed.sh.
+# It reads from the "LEDGER_COMPACT_HOURS" environment variable.
+# If the variable is not set, it defaults to 0, which turns scheduled compaction off.
+LEDGER_COMPACT_HOURS = float(os.getenv("LEDGER_COMPACT_HOURS", 0))
+
+# --- Monitoring Settings ---
+# The shortest time (in seconds) between two updates on the /status/stream event stream.
+# Status changes within this window are sent together.
+# It reads from the "STATUS_STREAM_INTERVAL" environment variable.
+# If the variable is not set, it defaults to 0.5.
+STATUS_STREAM_INTERVAL = float(os.getenv("STATUS_STREAM_INTERVAL", 0.5))
+
+# The most event streams (Full Logs viewers and Monitoring pages together) each web process serves
+# at once. Every stream holds one of the process's request threads, so the limit keeps open tabs from
+# starving the API.
+# It reads from the "LOG_STREAM_MAX_CLIENTS" environment variable.
+# If the variable is not set, it defaults to 4.
+LOG_STREAM_MAX_CLIENTS = int(os.getenv("LOG_STREAM_MAX_CLIENTS", 4))
+
+# How many batches of log lines may wait for a viewer before it is dropped as too slow.
+LOG_STREAM_QUEUE_SIZE = int(os.getenv("LOG_STREAM_QUEUE_SIZE", 100))
+
+# --- Screenshot Settings ---
+# When workers take screenshots: "never", "on-error", "per-phase" (each step of the login flow, plus
+# errors) or "per-coupon" (every coupon as well). Each screenshot pulls a full-size PNG from the hub.
+# It reads from the "SCREENSHOT_POLICY" environment variable.
+# If the variable is not set, it defaults to "on-error".
+SCREENSHOT_POLICY = os.getenv("SCREENSHOT_POLICY", "on-error").lower()
+
+# Directory for the latest screenshot, thumbnail and recent frames of each UID.
+# It reads from the "SCREENSHOT_DIR" environment variable.
+# If the variable is not set, it defaults to "screenshots".
+SCREENSHOT_DIR = os.getenv("SCREENSHOT_DIR", "screenshots")
+
+# Thumbnails (needs Pillow) are SCREENSHOT_THUMB_WIDTH pixels wide, in "jpeg" or "webp" format.
+SCREENSHOT_THUMB_WIDTH = int(os.getenv("SCREENSHOT_THUMB_WIDTH", 480))
+SCREENSHOT_THUMB_FORMAT = os.getenv("SCREENSHOT_THUMB_FORMAT", "jpeg").lower()
+
+# How many recent frames are kept per UID for debugging.
+# It reads from the "SCREENSHOT_HISTORY" environment variable.
+# If the variable is not set, it defaults to 5.
+SCREENSHOT_HISTORY = int(os.getenv("SCREENSHOT_HISTORY", 5))
+
+# --- Metrics Settings ---
+# How often (in seconds) each process writes its metrics to the shared database for /metrics.
+# It reads from the "METRICS_FLUSH_SECONDS" environment variable.
+# If the variable is not set, it defaults to 15.
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 15))
+
+# --- Shared State Settings ---
+# The SQLite database shared by all gunicorn workers and the Telegram bot.
+# It reads from the "STATE_DB_PATH" environment variable.
+# If the variable is not set, it defaults to "data/state.db".
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join("data", "state.db"))
+
+# How long (in seconds) a browser session slot lease stays valid without being renewed.
+# Leases are renewed automatically while a worker runs, so this only matters if a process dies.
+# It reads from the "SESSION_LEASE_SECONDS" environment variable.
+# If the variable is not set, it defaults to 300.
+SESSION_LEASE_SECONDS = int(os.getenv("SESSION_LEASE_SECONDS", 300))
+
+# --- Browser Session Pool Settings ---
+# The number of idle browser sessions to keep warm for reuse by the next UID.
+# Idle sessions still occupy a Chrome node on the hub, so keep this at or below MAX_CONCURRENT_SESSIONS.
+# It reads from the "DRIVER_POOL_SIZE" environment variable.
+# If the variable is not set, it defaults to 0 (every UID gets a fresh session).
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", 0))
+
+# A pooled session is closed after this many UIDs or this many seconds, whichever comes first.
+DRIVER_MAX_USES = int(os.getenv("DRIVER_MAX_USES", 20))
+DRIVER_MAX_AGE_SECONDS = int(os.getenv("DRIVER_MAX_AGE_SECONDS", 1800))
+
+# Idle pooled sessions are closed after this many seconds without being reused.
+DRIVER_IDLE_SECONDS = int(os.getenv("DRIVER_IDLE_SECONDS", 60))
+
+# --- Import Settings ---
+# Regular expression a UID must match to be accepted by the bulk import API.
+# It reads from the "UID_PATTERN" environment variable.
+# If the variable is not set, it defaults to digits only.
+UID_PATTERN = os.getenv("UID_PATTERN", r"^\d+$")
+
+# --- Result Classification Settings ---
+# Optional JSON file adding store messages to the built-in result catalog, e.g.
+# {"RATE_LIMITED": ["please wait"], "ALREADY_USED": ["already redeemed"]}.
+# It reads from the "RESULT_CATALOG_PATH" environment variable.
+# If the variable is not set, only the built-in catalog is used.
+RESULT_CATALOG_PATH = os.getenv("RESULT_CATALOG_PATH", "")
+
+# --- Log Search Settings ---
+# How many days of worker log lines the search index keeps. The log files themselves are not affected.
+# It reads from the "SEARCH_RETENTION_DAYS" environment variable.
+# If the variable is not set, it defaults to 30. 0 keeps every line.
+SEARCH_RETENTION_DAYS = float(os.getenv("SEARCH_RETENTION_DAYS", 30))
+
+# --- Redemption Backend Settings ---
+# How coupons are redeemed: "selenium" drives Chrome on the hub, "http" replays the store's
+# login and redeem calls without a browser and falls back to Selenium when that fails.
+# It reads from the "REDEEM_BACKEND" environment variable.
+# If the variable is not set, it defaults to "selenium". It can also be chosen per run.
+REDEEM_BACKEND = os.getenv("REDEEM_BACKEND", "selenium")
+
+# Store endpoints used by the "http" backend. Both must be set for it to be used.
+STORE_LOGIN_URL = os.getenv("STORE_LOGIN_URL", "")
+STORE_REDEEM_URL = os.getenv("STORE_REDEEM_URL", "")
+# JSON field names for the UID and the gift code in those requests.
+STORE_UID_FIELD = os.getenv("STORE_UID_FIELD", "uid")
+STORE_CODE_FIELD = os.getenv("STORE_CODE_FIELD", "code")
+
+# The number of UIDs the "http" backend processes at the same time.
+HTTP_CONCURRENCY = int(os.getenv("HTTP_CONCURRENCY", 8))
+
+# --- Backup Settings ---
+# Directory holding the deduplicated, compressed backup snapshots.
+# It reads from the "BACKUP_DIR" environment variable.
+# If the variable is not set, it defaults to "data/backups".
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join("data", "backups"))
+
+# The newest snapshot of each of the last BACKUP_KEEP_DAILY days and of each of the
+# last BACKUP_KEEP_WEEKLY weeks is kept; older snapshots are deleted after the nightly backup.
+BACKUP_KEEP_DAILY = int(os.getenv("BACKUP_KEEP_DAILY", 7))
+BACKUP_KEEP_WEEKLY = int(os.getenv("BACKUP_KEEP_WEEKLY", 4))
+
 # --- User Data ---
 # IMPORTANT: UIDs and Coupon Codes are now loaded from uids.txt and coupons.txt respectively.
 
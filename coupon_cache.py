@@ -0,0 +1,120 @@
+import time
+
+import classifier
+import db
+
+# --- Global Coupon Validity Cache ---
+# Records what the store told us about each coupon code, independent of UID. Once any UID learns
+# that a code does not exist or has expired, every other UID skips it before a browser is involved.
+
+VALID = 'valid'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+UNKNOWN = 'unknown'
+
+# Statuses that make a coupon useless for every UID.
+DEAD_STATUSES = (INVALID, EXPIRED)
+
+# What each result code tells us about the code itself.
+_STATUS_BY_CODE = {
+    classifier.ResultCode.INVALID: INVALID,
+    classifier.ResultCode.EXPIRED: EXPIRED,
+    # The code exists, even if this UID could not use it.
+    classifier.ResultCode.SUCCESS: VALID,
+    classifier.ResultCode.ALREADY_USED: VALID,
+    classifier.ResultCode.LIMIT_REACHED: VALID,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS coupon_status (
+    coupon     TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,
+    message    TEXT,
+    first_seen REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+def _ensure_schema():
+    db.ensure_schema('coupon_cache', _SCHEMA)
+
+def status_for(code):
+    """Maps a ResultCode to a coupon status."""
+    return _STATUS_BY_CODE.get(code, UNKNOWN)
+
+def record(coupon, message, code=None):
+    """Updates a coupon's status from a redemption result. Unknown results never overwrite a known status."""
+    _ensure_schema()
+    status = status_for(code or classifier.classify(message))
+    now = time.time()
+    with db.transaction() as conn:
+        conn.execute(
+            """INSERT INTO coupon_status (coupon, status, message, first_seen, updated_at)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(coupon) DO UPDATE SET
+                   status = excluded.status, message = excluded.message, updated_at = excluded.updated_at
+               WHERE excluded.status != ? OR coupon_status.status = ?""",
+            (coupon, status, message, now, now, UNKNOWN, UNKNOWN)
+        )
+    return status
+
+def get_status(coupon):
+    """Returns the cached status of a coupon, or UNKNOWN."""
+    _ensure_schema()
+    row = db.get_connection().execute("SELECT status FROM coupon_status WHERE coupon = ?", (coupon,)).fetchone()
+    return row['status'] if row else UNKNOWN
+
+def dead_coupons(coupons=None):
+    """Returns the set of coupons known to be invalid or expired, optionally limited to `coupons`."""
+    _ensure_schema()
+    rows = db.get_connection().execute(
+        "SELECT coupon FROM coupon_status WHERE status IN (?, ?)", DEAD_STATUSES
+    ).fetchall()
+    dead = {row['coupon'] for row in rows}
+    if coupons is not None:
+        dead &= set(coupons)
+    return dead
+
+def drop_dead(coupons):
+    """Returns `coupons` without the globally dead codes, preserving order."""
+    dead = dead_coupons(coupons)
+    return [c for c in coupons if c not in dead]
+
+def reclassify_dead():
+    """
+    Re-derives the status of dead coupons from their stored message, so a code marked dead by a
+    message the classifier no longer reads that way is tried again. Returns how many were revived.
+    """
+    _ensure_schema()
+    now = time.time()
+    with db.transaction() as conn:
+        changed = []
+        for row in conn.execute("SELECT coupon, status, message FROM coupon_status WHERE status IN (?, ?)", DEAD_STATUSES):
+            status = status_for(classifier.classify(row['message']))
+            if status != row['status']:
+                changed.append((status, now, row['coupon']))
+        conn.executemany("UPDATE coupon_status SET status = ?, updated_at = ? WHERE coupon = ?", changed)
+    return len(changed)
+
+def all_statuses():
+    """Returns every cached coupon status, most recently updated first."""
+    _ensure_schema()
+    rows = db.get_connection().execute("SELECT * FROM coupon_status ORDER BY updated_at DESC").fetchall()
+    return [dict(row) for row in rows]
+
+def forget(coupon):
+    """Removes a coupon from the cache so it will be tried again."""
+    _ensure_schema()
+    with db.transaction() as conn:
+        return conn.execute("DELETE FROM coupon_status WHERE coupon = ?", (coupon,)).rowcount > 0
+
+def replace_all(rows):
+    """Replaces the whole cache with `rows` (dicts as produced by all_statuses) in one transaction."""
+    _ensure_schema()
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM coupon_status")
+        conn.executemany(
+            """INSERT INTO coupon_status (coupon, status, message, first_seen, updated_at)
+               VALUES (:coupon, :status, :message, :first_seen, :updated_at)""",
+            rows
+        )
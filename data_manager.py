@@ -1,5 +1,10 @@
 import os
+import fcntl
 import logging
+import tempfile
+from contextlib import contextmanager
+from collections import namedtuple
+from types import MappingProxyType
 from threading import Lock
 
 # --- Constants ---
@@ -7,31 +12,156 @@ DATA_DIR = "data"
 UIDS_FILE = os.path.join(DATA_DIR, "uids.txt")
 COUPONS_FILE = os.path.join(DATA_DIR, "coupons.txt")
 
-# --- Thread-safe lock for file operations ---
+# --- Locking for file writes ---
+# file_lock serialises writers inside this process; an fcntl lock on a sidecar file
+# (data/.<name>.lock) serialises them across gunicorn workers and the Telegram bot.
+# Readers take no lock: full rewrites go through a temp file and os.replace, and adds
+# are single appended lines, so a reader always sees a complete file.
 file_lock = Lock()
 
+# --- Parsed Snapshots ---
+# Each data file is parsed once into an immutable snapshot that is reused until the file's
+# mtime, size or inode changes (or this process writes it). Readers only stat the file and
+# pick up the current snapshot; they never take file_lock or re-parse on the hot path.
+# `lines` are the non-empty stripped lines, `items` the parsed entries, `index` maps each entry's key
+# (base filename or coupon code) to the entry and `by_uid` maps UIDs to their first entry.
+Snapshot = namedtuple('Snapshot', ['signature', 'raw', 'lines', 'items', 'index', 'by_uid'])
+
+_snapshots = {}
+_snapshot_lock = Lock()
+
 # --- Helper Functions ---
 
 def ensure_data_dir_exists():
     """Ensures the data directory exists."""
     os.makedirs(DATA_DIR, exist_ok=True)
 
+def _file_signature(filepath):
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _parse_uid_line(line):
+    """Parses a "<uid> #<comment>" line into a UID entry, or None for lines without a comment."""
+    if '#' not in line:
+        return None
+    parts = line.split('#', 1)
+    uid, comment = parts[0].strip(), parts[1].strip()
+    return {'uid': uid, 'comment': comment, 'id': f"{uid}_{comment}"}
+
+def _parse_uids(lines):
+    items = []
+    index = {}
+    by_uid = {}
+    for line in lines:
+        item = _parse_uid_line(line)
+        if item:
+            items.append(item)
+            index[item['id']] = item
+            by_uid.setdefault(item['uid'], item)
+    return tuple(items), index, by_uid
+
+def _parse_coupons(lines):
+    return tuple(lines), {coupon: coupon for coupon in lines}, {}
+
+_PARSERS = {UIDS_FILE: _parse_uids}
+
+def get_snapshot(filepath):
+    """Returns the current parsed snapshot of a data file, re-reading it only if it changed on disk."""
+    signature = _file_signature(filepath)
+    snapshot = _snapshots.get(filepath)
+    if snapshot is not None and snapshot.signature == signature:
+        return snapshot
+
+    with _snapshot_lock:
+        # Another thread may have refreshed it while we waited.
+        snapshot = _snapshots.get(filepath)
+        if snapshot is not None and snapshot.signature == signature:
+            return snapshot
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raw = ""
+        lines = tuple(line.strip() for line in raw.splitlines() if line.strip())
+        items, index, by_uid = _PARSERS.get(filepath, _parse_coupons)(lines)
+        snapshot = Snapshot(signature, raw, lines, items, index, by_uid)
+        _snapshots[filepath] = snapshot
+        return snapshot
+
+def invalidate(filepath):
+    """Drops the cached snapshot of a file after this process wrote it."""
+    _snapshots.pop(filepath, None)
+
 def read_file_lines(filepath):
     """Reads all lines from a file and returns them as a list."""
+    return list(get_snapshot(filepath).lines)
+
+@contextmanager
+def locked(filepath):
+    """Holds the write lock for a data file, in this process and across processes."""
+    lock_path = os.path.join(os.path.dirname(filepath), f".{os.path.basename(filepath)}.lock")
+    with file_lock:
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _replace_file(filepath, content):
+    """Writes content to a temp file next to `filepath` and atomically swaps it in. Call with the file locked."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix=f".{os.path.basename(filepath)}.")
     try:
-        with file_lock:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return [line.strip() for line in f.readlines() if line.strip()]
-    except FileNotFoundError:
-        return []
+        # mkstemp creates the file as 0600; keep the permissions the data file had.
+        try:
+            os.chmod(tmp_path, os.stat(filepath).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    invalidate(filepath)
+
+def _append_line(filepath, line, snapshot):
+    """
+    Appends one line to a file and extends its snapshot in place of a re-read.
+    Call with the file locked and `snapshot` taken under that lock.
+    """
+    # Older files may lack a trailing newline; never glue the new line onto the last one.
+    prefix = "\n" if snapshot.raw and not snapshot.raw.endswith("\n") else ""
+    with open(filepath, 'a', encoding='utf-8') as f:
+        f.write(f"{prefix}{line}\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    items, index, by_uid = _PARSERS.get(filepath, _parse_coupons)((line,))
+    merged_by_uid = dict(snapshot.by_uid)
+    for uid, item in by_uid.items():
+        merged_by_uid.setdefault(uid, item)
+    with _snapshot_lock:
+        _snapshots[filepath] = Snapshot(
+            _file_signature(filepath),
+            f"{snapshot.raw}{prefix}{line}\n",
+            snapshot.lines + (line,),
+            snapshot.items + items,
+            {**snapshot.index, **index},
+            merged_by_uid,
+        )
 
 def write_file_lines(filepath, lines):
-    """Writes a list of lines to a file, overwriting it."""
+    """Writes a list of lines to a file, atomically replacing it."""
     try:
-        with file_lock:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                for line in lines:
-                    f.write(f"{line}\n")
+        with locked(filepath):
+            _replace_file(filepath, "".join(f"{line}\n" for line in lines))
         return True
     except Exception as e:
         logging.error(f"Error writing to file {filepath}: {e}")
@@ -41,98 +171,173 @@ def write_file_lines(filepath, lines):
 
 def get_uids_list():
     """
-    Reads the uids.txt file and returns a list of dictionaries.
-    Each dictionary contains 'uid', 'comment', and 'id'.
+    Returns the UIDs in uids.txt as a list of dictionaries.
+    Each dictionary contains 'uid', 'comment', and 'id'. The dictionaries are shared; do not modify them.
     """
-    lines = read_file_lines(UIDS_FILE)
-    uids_list = []
-    for line in lines:
-        if '#' in line:
-            parts = line.split('#', 1)
-            uid, comment = parts[0].strip(), parts[1].strip()
-            uids_list.append({'uid': uid, 'comment': comment, 'id': f"{uid}_{comment}"})
-    return uids_list
+    return list(get_snapshot(UIDS_FILE).items)
+
+def get_uids_map():
+    """Returns a read-only view of base filename -> UID entry."""
+    return MappingProxyType(get_snapshot(UIDS_FILE).index)
+
+def get_uid_entry(base_filename):
+    """Returns the UID entry for a base filename ('<uid>_<comment>'), or None."""
+    return get_snapshot(UIDS_FILE).index.get(base_filename)
+
+def find_uid(uid):
+    """Returns the first entry listed for a UID, or None."""
+    return get_snapshot(UIDS_FILE).by_uid.get(uid)
 
 def get_uids_raw():
     """Returns the raw content of the uids.txt file."""
-    try:
-        with file_lock:
-            with open(UIDS_FILE, 'r', encoding='utf-8') as f:
-                return f.read()
-    except FileNotFoundError:
-        return ""
+    return get_snapshot(UIDS_FILE).raw
 
 def save_uids_raw(content):
     """Saves raw text content to the uids.txt file."""
     try:
-        with file_lock:
-            with open(UIDS_FILE, 'w', encoding='utf-8') as f:
-                f.write(content)
+        with locked(UIDS_FILE):
+            _replace_file(UIDS_FILE, content)
         return True
     except Exception as e:
         logging.error(f"Error saving UIDs file: {e}")
         return False
 
 def add_uid(uid, comment):
-    """Adds a new UID and comment to the uids.txt file."""
-    lines = read_file_lines(UIDS_FILE)
-    new_line = f"{uid} #{comment}"
-    if new_line not in lines:
-        lines.append(new_line)
-        return write_file_lines(UIDS_FILE, lines)
-    return True # Already exists
+    """Appends a new UID and comment to the uids.txt file."""
+    try:
+        with locked(UIDS_FILE):
+            snapshot = get_snapshot(UIDS_FILE)
+            if f"{uid}_{comment}" not in snapshot.index:
+                _append_line(UIDS_FILE, f"{uid} #{comment}", snapshot)
+        return True # Added, or already exists
+    except Exception as e:
+        logging.error(f"Error adding UID {uid}: {e}")
+        return False
+
+def add_uids(entries, dry_run=False):
+    """
+    Adds many (uid, comment) pairs in one atomic write, skipping ones already listed or repeated.
+    Returns the set of pairs that were added (or would be, with `dry_run`).
+    """
+    with locked(UIDS_FILE):
+        snapshot = get_snapshot(UIDS_FILE)
+        seen = set(snapshot.index)
+        added = set()
+        new_lines = []
+        for uid, comment in entries:
+            if f"{uid}_{comment}" in seen:
+                continue
+            seen.add(f"{uid}_{comment}")
+            added.add((uid, comment))
+            new_lines.append(f"{uid} #{comment}")
+        if new_lines and not dry_run:
+            prefix = "\n" if snapshot.raw and not snapshot.raw.endswith("\n") else ""
+            _replace_file(UIDS_FILE, snapshot.raw + prefix + "".join(f"{line}\n" for line in new_lines))
+    return added
+
+def iter_uids():
+    """Yields the UID entries of uids.txt straight from disk, without building the whole list."""
+    try:
+        with open(UIDS_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                item = _parse_uid_line(line.strip())
+                if item:
+                    yield item
+    except FileNotFoundError:
+        return
 
 def delete_uid(uid_to_delete):
     """Deletes a UID from the uids.txt file."""
-    lines = read_file_lines(UIDS_FILE)
-    original_count = len(lines)
-    lines = [line for line in lines if not line.strip().startswith(uid_to_delete)]
-    
-    if len(lines) < original_count:
-        return write_file_lines(UIDS_FILE, lines)
-    return False # Not found
+    try:
+        with locked(UIDS_FILE):
+            lines = get_snapshot(UIDS_FILE).lines
+            remaining = [line for line in lines if not line.strip().startswith(uid_to_delete)]
+            if len(remaining) == len(lines):
+                return False # Not found
+            _replace_file(UIDS_FILE, "".join(f"{line}\n" for line in remaining))
+        return True
+    except Exception as e:
+        logging.error(f"Error deleting UID {uid_to_delete}: {e}")
+        return False
 
 # --- Coupon Management ---
 
 def get_all_coupons():
-    """Reads coupons from coupons.txt."""
-    return read_file_lines(COUPONS_FILE)
+    """Returns the coupons in coupons.txt."""
+    return list(get_snapshot(COUPONS_FILE).items)
+
+def has_coupon(coupon_code):
+    """True if the coupon is listed in coupons.txt."""
+    return coupon_code in get_snapshot(COUPONS_FILE).index
 
 def get_coupons_raw():
     """Returns the raw content of the coupons.txt file."""
-    try:
-        with file_lock:
-            with open(COUPONS_FILE, 'r', encoding='utf-8') as f:
-                return f.read()
-    except FileNotFoundError:
-        return ""
+    return get_snapshot(COUPONS_FILE).raw
 
 def save_coupons_raw(content):
     """Saves raw text content to the coupons.txt file."""
     try:
-        with file_lock:
-            with open(COUPONS_FILE, 'w', encoding='utf-8') as f:
-                f.write(content)
+        with locked(COUPONS_FILE):
+            _replace_file(COUPONS_FILE, content)
         return True
     except Exception as e:
         logging.error(f"Error saving coupons file: {e}")
         return False
 
 def add_coupon(coupon_code):
-    """Adds a new coupon to the coupons.txt file."""
-    coupons = get_all_coupons()
-    if coupon_code not in coupons:
-        coupons.append(coupon_code)
-        return write_file_lines(COUPONS_FILE, coupons)
-    return True # Already exists
+    """Appends a new coupon to the coupons.txt file."""
+    try:
+        with locked(COUPONS_FILE):
+            snapshot = get_snapshot(COUPONS_FILE)
+            if coupon_code not in snapshot.index:
+                _append_line(COUPONS_FILE, coupon_code, snapshot)
+        return True # Added, or already exists
+    except Exception as e:
+        logging.error(f"Error adding coupon {coupon_code}: {e}")
+        return False
+
+def add_coupons(coupon_codes, dry_run=False):
+    """
+    Adds many coupons in one atomic write, skipping ones already listed or repeated.
+    Returns the set of coupons that were added (or would be, with `dry_run`).
+    """
+    with locked(COUPONS_FILE):
+        snapshot = get_snapshot(COUPONS_FILE)
+        added = set()
+        new_lines = []
+        for coupon in coupon_codes:
+            if coupon in snapshot.index or coupon in added:
+                continue
+            added.add(coupon)
+            new_lines.append(coupon)
+        if new_lines and not dry_run:
+            prefix = "\n" if snapshot.raw and not snapshot.raw.endswith("\n") else ""
+            _replace_file(COUPONS_FILE, snapshot.raw + prefix + "".join(f"{line}\n" for line in new_lines))
+    return added
+
+def iter_coupons():
+    """Yields the coupons of coupons.txt straight from disk, without building the whole list."""
+    try:
+        with open(COUPONS_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+    except FileNotFoundError:
+        return
 
 def delete_coupon(coupon_to_delete):
     """Deletes a coupon from the coupons.txt file."""
-    coupons = get_all_coupons()
-    if coupon_to_delete in coupons:
-        coupons.remove(coupon_to_delete)
-        return write_file_lines(COUPONS_FILE, coupons)
-    return False # Not found
+    try:
+        with locked(COUPONS_FILE):
+            coupons = list(get_snapshot(COUPONS_FILE).lines)
+            if coupon_to_delete not in coupons:
+                return False # Not found
+            coupons.remove(coupon_to_delete)
+            _replace_file(COUPONS_FILE, "".join(f"{coupon}\n" for coupon in coupons))
+        return True
+    except Exception as e:
+        logging.error(f"Error deleting coupon {coupon_to_delete}: {e}")
+        return False
 
 # --- Initialization ---
 ensure_data_dir_exists()
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import config
+
+# --- Shared State Database ---
+# A single SQLite file (WAL mode) shared by every gunicorn worker and the Telegram bot.
+# Each module that keeps cross-process state registers its own tables through ensure_schema().
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_initialized_schemas = set()
+
+def get_connection():
+    """
+    Returns the calling thread's connection to the shared state database.
+    Connections are opened lazily and re-opened after a fork.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        db_dir = os.path.dirname(config.STATE_DB_PATH)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # isolation_level=None lets us control transactions explicitly with BEGIN IMMEDIATE.
+        conn = sqlite3.connect(config.STATE_DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+def ensure_schema(name, ddl):
+    """Runs the given DDL script once per process for the named component."""
+    key = (os.getpid(), name)
+    if key in _initialized_schemas:
+        return
+    with _schema_lock:
+        if key in _initialized_schemas:
+            return
+        get_connection().executescript(ddl)
+        _initialized_schemas.add(key)
+
+def ensure_columns(name, table, columns):
+    """
+    Adds columns missing from an existing table, once per process.
+    `columns` maps column names to their SQL definitions.
+    """
+    key = (os.getpid(), name)
+    if key in _initialized_schemas:
+        return
+    with _schema_lock:
+        if key in _initialized_schemas:
+            return
+        conn = get_connection()
+        existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, definition in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        _initialized_schemas.add(key)
+
+@contextmanager
+def transaction():
+    """
+    Opens a write transaction that takes the database write lock up front,
+    so read-modify-write sequences are atomic across processes.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
@@ -0,0 +1,184 @@
+import time
+import logging
+import threading
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+import config
+import metrics
+
+# --- Warm Remote WebDriver Pool ---
+# Creating a Remote session on the hub and loading BASE_URL is the most expensive step per UID.
+# The pool keeps up to DRIVER_POOL_SIZE idle sessions warm between UIDs: a returned driver has its
+# cookies and storage wiped and BASE_URL reloaded, so the next UID can start at the login button.
+# Sessions are recycled after DRIVER_MAX_USES uses or DRIVER_MAX_AGE_SECONDS, and idle ones are
+# closed after DRIVER_IDLE_SECONDS so they do not hold hub nodes while no work is running.
+
+# Implicit wait applied to every session; condition-based waits switch it off while they poll.
+IMPLICIT_WAIT_SECONDS = 3
+
+def create_driver():
+    """Opens a new Remote WebDriver session on the Selenium hub."""
+    with metrics.span('driver_create'):
+        return _create_driver()
+
+def _create_driver():
+    chrome_options = Options()
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    # Add arguments for running in a container
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+
+    driver = webdriver.Remote(
+        command_executor=config.SELENIUM_HUB_URL,
+        options=chrome_options
+    )
+    driver.set_window_size(1920, 1080)
+    driver.implicitly_wait(IMPLICIT_WAIT_SECONDS)
+    return driver
+
+def reset_driver_state(driver):
+    """Clears cookies and web storage so the session is logged out for the next UID."""
+    driver.delete_all_cookies()
+    driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+
+def quit_driver(driver):
+    """Closes a session, ignoring errors from sessions the hub already dropped."""
+    try:
+        with metrics.span('quit'):
+            driver.quit()
+    except Exception as e:
+        logging.warning(f"Error while closing browser session: {e}")
+
+class DriverPool:
+    """A bounded pool of reusable Remote WebDriver sessions."""
+
+    def __init__(self, size, max_uses, max_age, idle_timeout):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # Idle drivers ready to be handed out, most recently returned last.
+        self._idle = []
+        # { session_id: {'created_at': float, 'uses': int, 'warm': bool, 'idle_since': float} }
+        self._meta = {}
+        self._reaper = None
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def _is_expired(self, meta, now):
+        return meta['uses'] >= self.max_uses or now - meta['created_at'] >= self.max_age
+
+    def _is_healthy(self, driver):
+        try:
+            driver.execute_script("return document.readyState")
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """Returns a healthy idle driver from the pool, or a newly created one."""
+        while self.enabled:
+            with self._lock:
+                if not self._idle:
+                    break
+                driver = self._idle.pop()
+                meta = self._meta[driver.session_id]
+            if not self._is_expired(meta, time.time()) and self._is_healthy(driver):
+                meta['uses'] += 1
+                return driver
+            self._discard(driver)
+
+        driver = create_driver()
+        with self._lock:
+            self._meta[driver.session_id] = {'created_at': time.time(), 'uses': 1, 'warm': False, 'idle_since': None}
+        return driver
+
+    def is_warm(self, driver):
+        """True if the driver was returned to the pool with BASE_URL already loaded."""
+        with self._lock:
+            meta = self._meta.get(driver.session_id)
+            return bool(meta and meta['warm'])
+
+    def release(self, driver, discard=False):
+        """
+        Returns a driver after use. It is reset and kept warm if the pool has room and the
+        session is still young and healthy; otherwise it is closed.
+        """
+        with self._lock:
+            meta = self._meta.get(driver.session_id)
+            has_room = len(self._idle) < self.size
+        if discard or not self.enabled or not has_room or meta is None or self._is_expired(meta, time.time()):
+            self._discard(driver)
+            return
+
+        try:
+            reset_driver_state(driver)
+            driver.get(config.BASE_URL)
+        except Exception as e:
+            logging.warning(f"Could not reset browser session {driver.session_id} for reuse: {e}")
+            self._discard(driver)
+            return
+
+        with self._lock:
+            meta['warm'] = True
+            meta['idle_since'] = time.time()
+            self._idle.append(driver)
+        self._ensure_reaper()
+
+    def _discard(self, driver):
+        with self._lock:
+            self._meta.pop(driver.session_id, None)
+        quit_driver(driver)
+
+    def _reap_loop(self):
+        """
+        Closes idle sessions that outlived the idle timeout or their maximum age. Exits once no session
+        is idle; release() starts it again.
+        """
+        while True:
+            time.sleep(max(1, min(10, self.idle_timeout)))
+            now = time.time()
+            with self._lock:
+                stale = [d for d in self._idle
+                         if now - self._meta[d.session_id]['idle_since'] >= self.idle_timeout
+                         or self._is_expired(self._meta[d.session_id], now)]
+                self._idle = [d for d in self._idle if d not in stale]
+                done = not self._idle
+                if done:
+                    # Cleared under the lock, so a release() after this starts a new reaper.
+                    self._reaper = None
+            for driver in stale:
+                logging.info(f"Closing idle pooled browser session {driver.session_id}.")
+                self._discard(driver)
+            if done:
+                return
+
+    def _ensure_reaper(self):
+        with self._lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap_loop, name="driver-pool-reaper")
+                self._reaper.daemon = True
+                self._reaper.start()
+
+_pool = DriverPool(
+    size=config.DRIVER_POOL_SIZE,
+    max_uses=config.DRIVER_MAX_USES,
+    max_age=config.DRIVER_MAX_AGE_SECONDS,
+    idle_timeout=config.DRIVER_IDLE_SECONDS,
+)
+
+def acquire():
+    """Gets a driver from the process-wide pool."""
+    return _pool.acquire()
+
+def release(driver, discard=False):
+    """Returns a driver to the process-wide pool."""
+    _pool.release(driver, discard=discard)
+
+def is_warm(driver):
+    """True if the driver already has BASE_URL loaded in a clean, logged-out state."""
+    return _pool.is_warm(driver)
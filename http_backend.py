@@ -0,0 +1,172 @@
+import json
+import time
+import logging
+from http.cookies import SimpleCookie
+import urllib3
+
+import classifier
+import config
+import metrics
+import rate_limit
+import worker
+
+# --- Browserless HTTP Redemption ---
+# Replays the store's login and redeem calls with a pooled keep-alive HTTP client instead of driving
+# Chrome. Results are written through the same log_coupon_result / RateLimited paths as the Selenium
+# flow. Anything unexpected (transport errors, non-JSON answers, a failed login) raises
+# BackendUnavailable so the UID can fall back to Selenium with the coupons it has not tried yet.
+
+_http = urllib3.PoolManager(
+    maxsize=config.HTTP_CONCURRENCY,
+    timeout=urllib3.Timeout(connect=5, read=15),
+    retries=False,
+)
+
+# Logging in again is harmless, so the login call is retried on gateway errors. A redeem call is never
+# retried: the store may have applied the code before the gateway gave up, and sending it twice could
+# redeem it twice. Its failures fall back to Selenium, which checks the page before trying again.
+LOGIN_RETRIES = urllib3.Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=None)
+
+class BackendUnavailable(Exception):
+    """Raised when the HTTP flow cannot be used for a UID; the remaining coupons go to Selenium."""
+
+    def __init__(self, message, remaining_coupons):
+        super().__init__(message)
+        self.remaining_coupons = remaining_coupons
+
+def is_configured():
+    """True if the store's login and redeem endpoints are configured."""
+    return bool(config.STORE_LOGIN_URL and config.STORE_REDEEM_URL)
+
+class StoreSession:
+    """One logged-in store session: cookies and bearer token carried between calls."""
+
+    def __init__(self):
+        self.cookies = {}
+        self.token = None
+
+    def post(self, url, payload, retries=False):
+        """
+        POSTs JSON and returns the decoded JSON body. Raises ValueError on anything unexpected.
+        The request is only sent again if `retries` (a urllib3.Retry) allows it.
+        """
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if self.cookies:
+            headers['Cookie'] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+
+        try:
+            response = _http.request('POST', url, body=json.dumps(payload).encode('utf-8'), headers=headers, retries=retries)
+        except urllib3.exceptions.HTTPError as e:
+            raise ValueError(f"Request to {url} failed: {e}")
+
+        for header in response.headers.getlist('Set-Cookie'):
+            cookie = SimpleCookie()
+            cookie.load(header)
+            self.cookies.update({name: morsel.value for name, morsel in cookie.items()})
+
+        try:
+            body = json.loads(response.data.decode('utf-8'))
+        except ValueError:
+            raise ValueError(f"{url} answered HTTP {response.status} with a non-JSON body.")
+        if not isinstance(body, dict):
+            raise ValueError(f"{url} answered with unexpected JSON: {str(body)[:50]}")
+        return body
+
+def _is_success(body):
+    return body.get('code') in (0, 200, '0', '200') or body.get('success') is True
+
+def _message(body):
+    return str(body.get('msg') or body.get('message') or '').strip()
+
+def log_in(session, uid):
+    """Logs the session in as `uid`. Raises ValueError if the store does not accept it."""
+    body = session.post(config.STORE_LOGIN_URL, {config.STORE_UID_FIELD: uid}, retries=LOGIN_RETRIES)
+    if not _is_success(body):
+        raise ValueError(f"Login rejected: {_message(body) or body}")
+    data = body.get('data')
+    if isinstance(data, dict) and data.get('token'):
+        session.token = data['token']
+
+def redeem_coupons(session, log_func, base_filename, coupons_to_try):
+    """
+    Redeems each coupon over HTTP, mirroring worker.redeem_coupons.
+    Raises worker.RateLimited or BackendUnavailable with the coupons not yet tried.
+    """
+    for index, coupon in enumerate(coupons_to_try):
+        try:
+            with metrics.span('http_coupon'):
+                body = session.post(config.STORE_REDEEM_URL, {config.STORE_CODE_FIELD: coupon})
+        except ValueError as e:
+            raise BackendUnavailable(str(e), coupons_to_try[index:])
+
+        msg_text = _message(body)
+        if _is_success(body):
+            log_func(f"Success confirmed: {msg_text or 'Success'}")
+            worker.log_coupon_result(base_filename, coupon, "Success", log_func, classifier.ResultCode.SUCCESS)
+        elif not msg_text:
+            raise BackendUnavailable(f"Store gave no message for {coupon}: {str(body)[:50]}", coupons_to_try[index:])
+        else:
+            code = classifier.classify(msg_text)
+            if code == classifier.ResultCode.RATE_LIMITED:
+                log_func(f"RATE LIMIT DETECTED: {msg_text}. Parking remaining coupons.")
+                raise worker.RateLimited(coupons_to_try[index:], msg_text)
+            if code in classifier.REJECTED_CODES:
+                log_func(f"Coupon already used or invalid: {msg_text}")
+            worker.log_coupon_result(base_filename, coupon, msg_text, log_func, code)
+
+def process_uid_batch(accounts, lock):
+    """
+    Processes accounts over HTTP. Returns the accounts that must fall back to Selenium,
+    with 'coupons' narrowed to the ones not yet tried.
+    """
+    if not is_configured():
+        logging.warning("HTTP redemption selected but STORE_LOGIN_URL/STORE_REDEEM_URL are not set. Using Selenium.")
+        return list(accounts)
+
+    fallback = []
+    for account in accounts:
+        uid, comment, status_dict = account['uid'], account['comment'], account['status_dict']
+        base_filename = f"{uid}_{comment}" if comment else uid
+        log = worker.get_thread_safe_logger(base_filename, status_dict, lock)
+
+        if account['force_run']:
+            # Force runs exist to click through the site's promotions, which needs a browser.
+            log("Force run requested. Handing this UID to Selenium.")
+            fallback.append(account)
+            continue
+
+        with lock:
+            status_dict['status'] = 'Preparing'
+        started = time.monotonic()
+        coupons_to_try = worker.get_coupons_to_try(base_filename, account['coupons'], log)
+        worker.start_progress(status_dict, lock, coupons_to_try)
+        if not coupons_to_try:
+            log("No new coupons to try. Nothing to do over HTTP.")
+            worker.set_final_status(status_dict, lock, 'Finished', started)
+            continue
+
+        with lock:
+            status_dict['status'] = 'Running (HTTP)'
+        session = StoreSession()
+        try:
+            try:
+                with metrics.span('http_login'):
+                    log_in(session, uid)
+            except ValueError as e:
+                raise BackendUnavailable(str(e), coupons_to_try)
+            log("Logged in over HTTP.")
+            redeem_coupons(session, log, base_filename, coupons_to_try)
+            log("All tasks completed for this UID.")
+            worker.set_final_status(status_dict, lock, 'Finished', started)
+        except worker.RateLimited as e:
+            rate_limit.park(uid, comment, e.remaining_coupons, force_run=account['force_run'], reason=str(e))
+            log(f"Parked {len(e.remaining_coupons)} coupons after rate limit.", level=logging.WARNING)
+            worker.set_final_status(status_dict, lock, 'Parked', started)
+        except BackendUnavailable as e:
+            log(f"HTTP redemption unavailable ({e}). Falling back to Selenium for {len(e.remaining_coupons)} coupons.", level=logging.WARNING)
+            with lock:
+                status_dict['status'] = 'Queued'
+            fallback.append(dict(account, coupons=e.remaining_coupons))
+    return fallback
@@ -0,0 +1,207 @@
+import json
+import time
+
+import db
+
+# --- Persistent Job Queue ---
+# Every UID run is a job row in the shared state database, so queued work survives restarts and
+# is visible to every process. A UID has at most one active (queued/running/parked) job: enqueueing
+# it again merges the coupon lists instead of creating a duplicate.
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PARKED = 'parked'
+DONE = 'done'
+FAILED = 'failed'
+
+ACTIVE_STATES = (QUEUED, RUNNING, PARKED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    base_filename TEXT NOT NULL,
+    uid           TEXT NOT NULL,
+    comment       TEXT,
+    coupons       TEXT NOT NULL,
+    force_run     INTEGER NOT NULL DEFAULT 0,
+    priority      INTEGER NOT NULL DEFAULT 0,
+    backend       TEXT NOT NULL DEFAULT 'selenium',
+    state         TEXT NOT NULL,
+    resume_at     REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    error         TEXT,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_uid ON jobs (base_filename)
+    WHERE state IN ('queued', 'running', 'parked');
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, priority DESC, id);
+"""
+
+def _ensure_schema():
+    db.ensure_schema('job_queue', _SCHEMA)
+    # Columns added after the table was first created
+    db.ensure_columns('job_queue.columns', 'jobs', {'backend': "TEXT NOT NULL DEFAULT 'selenium'"})
+
+def _runnable_clause(backend):
+    """SQL condition (and its parameters) for jobs that could be claimed now."""
+    clause = "(state = ? OR (state = ? AND resume_at <= ?))"
+    if backend is None:
+        return clause, []
+    return clause + " AND backend = ?", [backend]
+
+def _merge_coupons(existing, new):
+    merged = list(existing)
+    merged.extend(c for c in new if c not in existing)
+    return merged
+
+def enqueue(uid, comment, coupons, force_run=False, priority=0, backend='selenium'):
+    """
+    Queues a run for a UID on the given redemption backend. Returns 'queued' for a new job, 'merged' if an existing queued or
+    parked job absorbed the coupons, or 'running' if the UID is already being processed.
+    """
+    _ensure_schema()
+    base_filename = f"{uid}_{comment}" if comment else uid
+    now = time.time()
+    with db.transaction() as conn:
+        row = conn.execute(
+            "SELECT id, state, coupons, force_run, priority FROM jobs WHERE base_filename = ? AND state IN (?, ?, ?)",
+            (base_filename, *ACTIVE_STATES)
+        ).fetchone()
+        if row is None:
+            conn.execute(
+                """INSERT INTO jobs (base_filename, uid, comment, coupons, force_run, priority, backend, state, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (base_filename, uid, comment, json.dumps(list(coupons)), int(force_run), priority, backend, QUEUED, now, now)
+            )
+            return QUEUED
+        if row['state'] == RUNNING:
+            return RUNNING
+        conn.execute(
+            "UPDATE jobs SET coupons = ?, force_run = ?, priority = ?, backend = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(_merge_coupons(json.loads(row['coupons']), coupons)),
+             int(force_run or row['force_run']), max(priority, row['priority']), backend, now, row['id'])
+        )
+        return 'merged'
+
+def claim(limit=1, backend=None, now=None):
+    """
+    Atomically moves up to `limit` runnable jobs (optionally only those for `backend`) to 'running'
+    and returns them, highest priority first. Parked jobs become runnable once their resume-at time has passed.
+    """
+    _ensure_schema()
+    now = time.time() if now is None else now
+    clause, params = _runnable_clause(backend)
+    with db.transaction() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM jobs WHERE {clause} ORDER BY priority DESC, id LIMIT ?",
+            (QUEUED, PARKED, now, *params, limit)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            [(RUNNING, now, row['id']) for row in rows]
+        )
+    jobs = [_row_to_job(row) for row in rows]
+    for job in jobs:
+        job['state'] = RUNNING
+        job['attempts'] += 1
+    return jobs
+
+def has_runnable(backend=None, now=None):
+    """True if at least one job (optionally for `backend`) could be claimed right now."""
+    _ensure_schema()
+    now = time.time() if now is None else now
+    clause, params = _runnable_clause(backend)
+    row = db.get_connection().execute(
+        f"SELECT 1 FROM jobs WHERE {clause} LIMIT 1",
+        (QUEUED, PARKED, now, *params)
+    ).fetchone()
+    return row is not None
+
+def requeue(job_id, coupons, backend):
+    """Sends a running job back to the queue with a narrowed coupon list, e.g. to fall back to another backend."""
+    _ensure_schema()
+    with db.transaction() as conn:
+        conn.execute(
+            "UPDATE jobs SET state = ?, coupons = ?, backend = ?, updated_at = ? WHERE id = ? AND state = ?",
+            (QUEUED, json.dumps(list(coupons)), backend, time.time(), job_id, RUNNING)
+        )
+
+def finish(job_id, state, error=None):
+    """Records the final state of a running job. Jobs parked while running are left parked."""
+    _ensure_schema()
+    with db.transaction() as conn:
+        conn.execute(
+            "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ? AND state = ?",
+            (state, error, time.time(), job_id, RUNNING)
+        )
+
+def park(uid, comment, coupons, force_run, resume_at, reason=None):
+    """Parks a UID's active job with its remaining coupons until resume_at, creating one if needed."""
+    _ensure_schema()
+    base_filename = f"{uid}_{comment}" if comment else uid
+    now = time.time()
+    with db.transaction() as conn:
+        cursor = conn.execute(
+            """UPDATE jobs SET state = ?, coupons = ?, resume_at = ?, error = ?, updated_at = ?
+               WHERE base_filename = ? AND state IN (?, ?, ?)""",
+            (PARKED, json.dumps(list(coupons)), resume_at, reason, now, base_filename, *ACTIVE_STATES)
+        )
+        if cursor.rowcount == 0:
+            conn.execute(
+                """INSERT INTO jobs (base_filename, uid, comment, coupons, force_run, state, resume_at, error, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (base_filename, uid, comment, json.dumps(list(coupons)), int(force_run), PARKED, resume_at, reason, now, now)
+            )
+
+def requeue_running():
+    """
+    Returns jobs left 'running' by a scheduler that died back to the queue.
+    Only call this while holding scheduler leadership.
+    """
+    _ensure_schema()
+    with db.transaction() as conn:
+        return conn.execute(
+            "UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?",
+            (QUEUED, time.time(), RUNNING)
+        ).rowcount
+
+def prune(older_than_seconds):
+    """Deletes finished jobs older than the given age."""
+    _ensure_schema()
+    with db.transaction() as conn:
+        return conn.execute(
+            "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+            (DONE, FAILED, time.time() - older_than_seconds)
+        ).rowcount
+
+def counts():
+    """Returns the number of jobs in each state."""
+    _ensure_schema()
+    rows = db.get_connection().execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+    return {row['state']: row['n'] for row in rows}
+
+def active_jobs():
+    """Returns all queued, running and parked jobs in the order they would run."""
+    _ensure_schema()
+    rows = db.get_connection().execute(
+        "SELECT * FROM jobs WHERE state IN (?, ?, ?) ORDER BY priority DESC, id",
+        ACTIVE_STATES
+    ).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+def _row_to_job(row):
+    return {
+        'id': row['id'],
+        'base_filename': row['base_filename'],
+        'uid': row['uid'],
+        'comment': row['comment'],
+        'coupons': json.loads(row['coupons']),
+        'force_run': bool(row['force_run']),
+        'priority': row['priority'],
+        'backend': row['backend'],
+        'state': row['state'],
+        'resume_at': row['resume_at'],
+        'attempts': row['attempts'],
+        'error': row['error'],
+    }
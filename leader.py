@@ -0,0 +1,34 @@
+import os
+import fcntl
+import threading
+
+import data_manager
+
+# --- Single-Leader Election ---
+# gunicorn runs several workers and the Telegram bot imports app into its own process, so
+# background jobs that must run once per container elect a leader with an fcntl lock file.
+# The lock is released by the kernel when the leader process exits, letting another take over.
+
+# Lock files held by this process: { name: file object }
+_held = {}
+_held_lock = threading.Lock()
+
+def try_acquire(name):
+    """Tries to become the leader for `name`. Returns True if this process holds leadership."""
+    with _held_lock:
+        if name in _held:
+            return True
+        lock_path = os.path.join(data_manager.DATA_DIR, f".{name}.lock")
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        _held[name] = lock_file
+        return True
+
+def is_leader(name):
+    """True if this process currently holds leadership for `name`."""
+    with _held_lock:
+        return name in _held
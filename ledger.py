@@ -0,0 +1,307 @@
+import os
+import time
+import logging
+import tempfile
+
+import classifier
+import db
+
+# --- Redemption Ledger ---
+# One row per (uid, coupon) with the latest ResultCode and message, replacing the per-UID
+# coupon_logs/<base_filename>.txt files. "Which coupons has this UID used?" and "which UIDs still
+# need this coupon?" are indexed reads on the stored code. Existing text logs are imported once, and
+# export_text() renders a UID's rows in the old "<coupon> # <result>" format for the log viewers.
+
+COUPON_LOG_DIR = "coupon_logs"
+# ledger_meta key marking migrate_result_codes() as done. Bumped when a classifier fix changes codes
+# already stored (".2": store messages containing "failed", "invalid" or "later" were misclassified;
+# ".3": the same for "expired", "만료" and "종료", e.g. an expired login session).
+RESULT_CODES_KEY = "result_codes.3"
+
+_TRANSIENT_PLACEHOLDERS = ','.join('?' * len(classifier.TRANSIENT_CODES))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS redemptions (
+    uid           TEXT NOT NULL,
+    coupon        TEXT NOT NULL,
+    base_filename TEXT NOT NULL,
+    result_class  TEXT NOT NULL,
+    message       TEXT NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 1,
+    first_seen    REAL NOT NULL,
+    updated_at    REAL NOT NULL,
+    PRIMARY KEY (uid, coupon)
+);
+CREATE INDEX IF NOT EXISTS redemptions_coupon ON redemptions (coupon, result_class);
+CREATE INDEX IF NOT EXISTS redemptions_base_filename ON redemptions (base_filename, first_seen);
+CREATE TABLE IF NOT EXISTS ledger_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Every write stamps its row with the next sequence number, so readers such as matrix.py can fetch
+# just the rows changed since they last looked. Deleting or bulk-replacing rows changes the generation
+# instead, which tells them to start over.
+_SEQ_INDEX = "CREATE INDEX IF NOT EXISTS redemptions_seq ON redemptions (seq);"
+
+def _ensure_schema():
+    db.ensure_schema('ledger', _SCHEMA)
+    db.ensure_columns('ledger_seq', 'redemptions', {'seq': 'INTEGER NOT NULL DEFAULT 0'})
+    db.ensure_schema('ledger_seq_index', _SEQ_INDEX)
+
+def _next_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM redemptions").fetchone()[0]
+
+def _bump_generation(conn):
+    conn.execute(
+        """INSERT INTO ledger_meta (key, value) VALUES ('generation', ?)
+           ON CONFLICT(key) DO UPDATE SET value = excluded.value""",
+        (str(time.time_ns()),)
+    )
+
+def change_marker():
+    """Returns (generation, last sequence number). It changes whenever any ledger row does."""
+    _ensure_schema()
+    row = db.get_connection().execute(
+        """SELECT (SELECT value FROM ledger_meta WHERE key = 'generation') AS generation,
+                  (SELECT COALESCE(MAX(seq), 0) FROM redemptions) AS seq"""
+    ).fetchone()
+    return row['generation'], row['seq']
+
+def changes_since(seq):
+    """Returns (uid, coupon, result_class, seq) rows written after sequence number `seq`, oldest first."""
+    _ensure_schema()
+    return db.get_connection().execute(
+        "SELECT uid, coupon, result_class, seq FROM redemptions WHERE seq > ? ORDER BY seq", (seq,)
+    ).fetchall()
+
+def split_base_filename(base_filename):
+    """Returns (uid, comment) for a "<uid>_<comment>" base filename; comment is None if absent."""
+    uid, _, comment = base_filename.partition('_')
+    return uid, comment or None
+
+def _upsert(conn, uid, coupon, base_filename, result_class, message, now):
+    seq = _next_seq(conn)
+    row = conn.execute("SELECT result_class FROM redemptions WHERE uid = ? AND coupon = ?", (uid, coupon)).fetchone()
+    if row is None:
+        conn.execute(
+            """INSERT INTO redemptions (uid, coupon, base_filename, result_class, message, first_seen, updated_at, seq)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (uid, coupon, base_filename, result_class, message, now, now, seq)
+        )
+    elif result_class in classifier.TRANSIENT_CODES and row['result_class'] not in classifier.TRANSIENT_CODES:
+        # A transient result never replaces a final one, but still counts as an attempt.
+        conn.execute(
+            "UPDATE redemptions SET attempts = attempts + 1, updated_at = ?, seq = ? WHERE uid = ? AND coupon = ?",
+            (now, seq, uid, coupon)
+        )
+    else:
+        conn.execute(
+            """UPDATE redemptions SET base_filename = ?, result_class = ?, message = ?, attempts = attempts + 1, updated_at = ?, seq = ?
+               WHERE uid = ? AND coupon = ?""",
+            (base_filename, result_class, message, now, seq, uid, coupon)
+        )
+
+def record(base_filename, coupon, message, result_class=None):
+    """Records the result of a coupon attempt for a UID. Returns its ResultCode."""
+    _ensure_schema()
+    result_class = result_class or classifier.classify(message)
+    uid, _ = split_base_filename(base_filename)
+    with db.transaction() as conn:
+        _upsert(conn, uid, coupon, base_filename, result_class, message, time.time())
+    return result_class
+
+def used_coupons(base_filename):
+    """Returns the coupons this UID has a final result for. Transient failures are left out so they are retried."""
+    _ensure_schema()
+    uid, _ = split_base_filename(base_filename)
+    rows = db.get_connection().execute(
+        f"SELECT coupon FROM redemptions WHERE uid = ? AND result_class NOT IN ({_TRANSIENT_PLACEHOLDERS})",
+        (uid, *classifier.TRANSIENT_CODES)
+    ).fetchall()
+    return {row['coupon'] for row in rows}
+
+def uids_needing(coupon, base_filenames):
+    """Returns the base filenames, out of `base_filenames`, whose UID has no final result for `coupon`."""
+    _ensure_schema()
+    rows = db.get_connection().execute(
+        f"SELECT uid FROM redemptions WHERE coupon = ? AND result_class NOT IN ({_TRANSIENT_PLACEHOLDERS})",
+        (coupon, *classifier.TRANSIENT_CODES)
+    ).fetchall()
+    done = {row['uid'] for row in rows}
+    return [base for base in base_filenames if split_base_filename(base)[0] not in done]
+
+def results(base_filename, offset=0, limit=-1):
+    """Returns a UID's rows in the order the coupons were first tried, optionally a page of them."""
+    _ensure_schema()
+    rows = db.get_connection().execute(
+        "SELECT * FROM redemptions WHERE base_filename = ? ORDER BY first_seen, rowid LIMIT ? OFFSET ?",
+        (base_filename, limit, offset)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def count_results(base_filename):
+    """Returns how many rows a UID has."""
+    _ensure_schema()
+    return db.get_connection().execute(
+        "SELECT COUNT(*) FROM redemptions WHERE base_filename = ?", (base_filename,)
+    ).fetchone()[0]
+
+def log_names():
+    """Returns "<base_filename>.txt" for every UID with results, in the order the coupon_logs listing used."""
+    _ensure_schema()
+    rows = db.get_connection().execute("SELECT DISTINCT base_filename FROM redemptions").fetchall()
+    return sorted((f"{row['base_filename']}.txt" for row in rows), reverse=True)
+
+def export_lines(base_filename, offset=0, limit=-1):
+    """Renders a page of a UID's results as coupon_logs text lines (without line breaks)."""
+    return [
+        f"{row['coupon']} # {row['message']}" if row['message'] else row['coupon']
+        for row in results(base_filename, offset, limit)
+    ]
+
+def export_text(base_filename):
+    """Renders a UID's results in the coupon_logs text format, or None if it has none."""
+    lines = export_lines(base_filename)
+    if not lines:
+        return None
+    return "".join(f"{line}\n" for line in lines)
+
+def _parse_text_log(path):
+    """Yields (coupon, message) pairs from a coupon_logs text file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if '#' in line:
+                coupon, message = (part.strip() for part in line.strip().split('#', 1))
+            else:
+                # Lines without a result were always treated as used.
+                coupon, message = line.strip(), ""
+            if coupon:
+                yield coupon, message
+
+def import_text_logs(directory=COUPON_LOG_DIR):
+    """
+    Imports coupon_logs/*.txt into the ledger once per database. Returns the number of lines imported,
+    or 0 if the import already ran. The text files are left in place.
+    """
+    _ensure_schema()
+    if not os.path.isdir(directory):
+        return 0
+    imported = 0
+    with db.transaction() as conn:
+        if conn.execute("SELECT 1 FROM ledger_meta WHERE key = 'text_logs_imported'").fetchone():
+            return 0
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.txt'):
+                continue
+            path = os.path.join(directory, filename)
+            base_filename = filename[:-len('.txt')]
+            uid, _ = split_base_filename(base_filename)
+            mtime = os.path.getmtime(path)
+            try:
+                for coupon, message in _parse_text_log(path):
+                    # Bare coupon lines have no result; keep them as used.
+                    result_class = classifier.classify(message)
+                    _upsert(conn, uid, coupon, base_filename, result_class, message, mtime)
+                    imported += 1
+            except Exception as e:
+                logging.error(f"Could not import coupon log {filename}: {e}")
+        conn.execute("INSERT INTO ledger_meta (key, value) VALUES ('text_logs_imported', ?)", (str(time.time()),))
+    if imported:
+        logging.info(f"Imported {imported} coupon log lines from {directory} into the redemption ledger.")
+    return imported
+
+def all_rows():
+    """Yields every ledger row, in a stable order, for backups."""
+    _ensure_schema()
+    for row in db.get_connection().execute("SELECT * FROM redemptions ORDER BY uid, coupon"):
+        yield dict(row)
+
+def replace_all(rows):
+    """Replaces the whole ledger with `rows` (dicts as produced by all_rows) in one transaction."""
+    _ensure_schema()
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM redemptions")
+        _bump_generation(conn)
+        conn.executemany(
+            """INSERT INTO redemptions (uid, coupon, base_filename, result_class, message, attempts, first_seen, updated_at)
+               VALUES (:uid, :coupon, :base_filename, :result_class, :message, :attempts, :first_seen, :updated_at)""",
+            rows
+        )
+
+def migrate_result_codes():
+    """
+    Re-derives result_class from the stored message once per database, for rows written before
+    results were stored as ResultCodes. Returns the number of rows whose code changed.
+    """
+    _ensure_schema()
+    with db.transaction() as conn:
+        if conn.execute("SELECT 1 FROM ledger_meta WHERE key = ?", (RESULT_CODES_KEY,)).fetchone():
+            return 0
+        rows = conn.execute("SELECT uid, coupon, result_class, message FROM redemptions").fetchall()
+        changed = []
+        for row in rows:
+            code = classifier.classify(row['message'])
+            if code != row['result_class']:
+                changed.append((code, row['uid'], row['coupon']))
+        conn.executemany("UPDATE redemptions SET result_class = ? WHERE uid = ? AND coupon = ?", changed)
+        if changed:
+            _bump_generation(conn)
+        conn.execute("INSERT INTO ledger_meta (key, value) VALUES (?, ?)", (RESULT_CODES_KEY, str(time.time())))
+    if changed:
+        logging.info(f"Converted {len(changed)} redemption ledger rows to result codes.")
+    return len(changed)
+
+def _compact_text_log(path):
+    """Rewrites one coupon_logs file with the latest result per coupon and no transient lines. Returns lines removed."""
+    latest = {}
+    total = 0
+    for coupon, message in _parse_text_log(path):
+        total += 1
+        # Re-inserting moves a coupon to where its latest result was logged.
+        latest.pop(coupon, None)
+        latest[coupon] = message
+    kept = {coupon: message for coupon, message in latest.items() if classifier.classify(message) not in classifier.TRANSIENT_CODES}
+    if len(kept) == total:
+        return 0
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".compact.")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for coupon, message in kept.items():
+                f.write(f"{coupon} # {message}\n" if message else f"{coupon}\n")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return total - len(kept)
+
+def compact(directory=COUPON_LOG_DIR):
+    """
+    Drops transient results (classifier.TRANSIENT_CODES) from the ledger so those coupons are retried, and rewrites the legacy
+    coupon_logs files the same way, keeping only the latest line per coupon. Replaces failed.sh.
+    Returns {'ledger_removed': n, 'ledger_remaining': n, 'log_lines_removed': n}.
+    """
+    _ensure_schema()
+    with db.transaction() as conn:
+        removed = conn.execute(
+            f"DELETE FROM redemptions WHERE result_class IN ({_TRANSIENT_PLACEHOLDERS})", classifier.TRANSIENT_CODES
+        ).rowcount
+        if removed:
+            _bump_generation(conn)
+        remaining = conn.execute("SELECT COUNT(*) FROM redemptions").fetchone()[0]
+
+    log_lines_removed = 0
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.txt'):
+                continue
+            try:
+                log_lines_removed += _compact_text_log(os.path.join(directory, filename))
+            except Exception as e:
+                logging.error(f"Could not compact coupon log {filename}: {e}")
+
+    result = {'ledger_removed': removed, 'ledger_remaining': remaining, 'log_lines_removed': log_lines_removed}
+    logging.info(f"Compacted the redemption ledger: {result}")
+    return result
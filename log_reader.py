@@ -0,0 +1,75 @@
+import os
+
+# --- Paged Log Reading ---
+# Reads a page of a log file instead of the whole file. Pages are addressed by byte positions, which
+# the caller gets back with every page: tail() reads backwards from the end (or from an earlier page's
+# start) in fixed-size blocks, and read_after() continues forward from an earlier page's end, which
+# is also how a viewer follows a growing file. read_lines() pages by line number for plain
+# offset/limit queries.
+
+BLOCK_SIZE = 64 * 1024
+# Lines per page when the caller does not ask for a number, and the most one page may hold.
+DEFAULT_PAGE_LINES = 500
+MAX_PAGE_LINES = 5000
+
+def _decode(lines):
+    return [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines]
+
+def tail(path, count, before=None):
+    """
+    Returns (lines, start, end): the last `count` lines that end at byte `before` (default: the end of the
+    file), where the first returned line starts and where the last one ends. Reads backwards in blocks.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if before is None else max(0, min(before, size))
+        position = end
+        buffer = b''
+        # One more line break than lines wanted guarantees the first wanted line is complete.
+        while position > 0 and buffer.count(b'\n') <= count:
+            step = min(BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            buffer = f.read(step) + buffer
+
+    if count <= 0 or not buffer:
+        return [], end, end
+    body = buffer[:-1] if buffer.endswith(b'\n') else buffer
+    lines = body.split(b'\n')
+    if position > 0:
+        # Cut off somewhere inside a line that belongs to the previous page.
+        lines = lines[1:]
+    lines = lines[-count:]
+    start = end - len(b'\n'.join(lines)) - (len(buffer) - len(body))
+    return _decode(lines), start, end
+
+def read_after(path, start, limit):
+    """
+    Returns (lines, start, end): up to `limit` complete lines from byte `start` on and the byte where
+    the next page begins. A last line still being written is left for the next call.
+    """
+    lines = []
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        while len(lines) < limit:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                break
+            lines.append(line[:-1])
+            position += len(line)
+    return _decode(lines), start, position
+
+def read_lines(path, offset, limit):
+    """Returns (lines, has_more): up to `limit` lines starting at line number `offset` (0-based)."""
+    lines = []
+    has_more = False
+    with open(path, 'rb') as f:
+        for number, line in enumerate(f):
+            if number < offset:
+                continue
+            if len(lines) == limit:
+                has_more = True
+                break
+            lines.append(line.rstrip(b'\n'))
+    return _decode(lines), has_more
@@ -0,0 +1,229 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+import config
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+# --- Shared Log Tailer ---
+# One background thread per followed file and process reads new lines and hands them, in batches, to
+# every subscriber's bounded queue. A subscriber whose queue is full is dropped instead of slowing down
+# the others. The thread follows RotatingFileHandler rotation (the file being renamed and recreated),
+# sleeps on inotify events where available and falls back to polling, and exits when the last
+# subscriber leaves.
+
+# How often (in seconds) the file is checked when inotify is not available.
+POLL_SECONDS = 0.5
+# How long (in seconds) an inotify wait lasts before the thread checks whether anyone is still listening.
+WATCH_TIMEOUT_SECONDS = 5
+# The most lines sent in one batch.
+MAX_BATCH_LINES = 500
+
+class SubscriberLimitReached(Exception):
+    """Raised when LOG_STREAM_MAX_CLIENTS event streams are already open in this process."""
+
+class Subscription:
+    """A viewer's queue of line batches."""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = False
+        self.tailer = None
+        self.closed = False
+
+    def batches(self, timeout):
+        """
+        Yields lists of new lines, or None after `timeout` seconds without any.
+        Ends once the subscriber was dropped for falling behind and its queue is drained.
+        """
+        while True:
+            if self.dropped and self.queue.empty():
+                return
+            try:
+                yield self.queue.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+
+class _Watcher:
+    """Waits until the followed file may have changed, using inotify on its directory if available."""
+
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        self.inotify = None
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                self.inotify.add_watch(
+                    os.path.dirname(path) or '.',
+                    inotify_flags.MODIFY | inotify_flags.CREATE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+                )
+            except OSError as e:
+                logging.warning(f"inotify unavailable for {path} ({e}); polling instead.")
+                self.close()
+
+    def wait(self):
+        if self.inotify is None:
+            time.sleep(POLL_SECONDS)
+            return
+        deadline = time.monotonic() + WATCH_TIMEOUT_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # Other files in the directory (such as worker logs) also raise events; only ours ends the wait.
+            if any(event.name == self.name for event in self.inotify.read(timeout=int(remaining * 1000))):
+                return
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+class _Tailer:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.thread = None
+
+    def subscribe(self):
+        subscription = Subscription(config.LOG_STREAM_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(subscription)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name=f"log-tailer-{os.path.basename(self.path)}")
+                self.thread.daemon = True
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def _broadcast(self, lines):
+        with self.lock:
+            for subscription in list(self.subscribers):
+                try:
+                    subscription.queue.put_nowait(lines)
+                except queue.Full:
+                    subscription.dropped = True
+                    self.subscribers.discard(subscription)
+                    logging.warning(f"Dropped a slow viewer of {self.path}.")
+
+    def _open(self, at_end):
+        try:
+            handle = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        if at_end:
+            handle.seek(0, os.SEEK_END)
+        return handle
+
+    def _replaced(self, handle):
+        """True if the file was rotated away from `handle` or truncated."""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            # Between the rename and the new file being created.
+            return False
+        return current.st_ino != os.fstat(handle.fileno()).st_ino or current.st_size < handle.tell()
+
+    def _run(self):
+        watcher = _Watcher(self.path)
+        handle = None
+        partial = b''
+        try:
+            # Viewers only want lines written after they connected.
+            handle = self._open(at_end=True)
+            while True:
+                with self.lock:
+                    if not self.subscribers:
+                        self.thread = None
+                        return
+
+                if handle is None:
+                    handle = self._open(at_end=False)
+                if handle is not None:
+                    chunk = handle.read()
+                    if chunk:
+                        lines = (partial + chunk).split(b'\n')
+                        # The last piece has no newline yet; keep it until the rest is written.
+                        partial = lines.pop()
+                        lines = [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines]
+                        for start in range(0, len(lines), MAX_BATCH_LINES):
+                            self._broadcast(lines[start:start + MAX_BATCH_LINES])
+                        continue
+                    if self._replaced(handle):
+                        # The old file is fully read; continue at the start of the new one.
+                        handle.close()
+                        handle = self._open(at_end=False)
+                        partial = b''
+                        continue
+
+                watcher.wait()
+        except Exception as e:
+            logging.error(f"Log tailer for {self.path} stopped: {e}")
+            with self.lock:
+                for subscription in self.subscribers:
+                    subscription.dropped = True
+                self.subscribers.clear()
+                self.thread = None
+        finally:
+            watcher.close()
+            if handle is not None:
+                handle.close()
+
+_tailers = {}
+_tailers_lock = threading.Lock()
+
+# --- Stream Budget ---
+# Every event stream this process serves (log viewers here, /status/stream in app.py) holds a request
+# thread until the client leaves, so all of them share the LOG_STREAM_MAX_CLIENTS slots. A slot is
+# held until the stream is closed, even after a slow log viewer was dropped.
+_open_streams = 0
+
+def _reserve_stream(name):
+    global _open_streams
+    if _open_streams >= config.LOG_STREAM_MAX_CLIENTS:
+        raise SubscriberLimitReached(name)
+    _open_streams += 1
+
+def open_stream(name):
+    """Takes a stream slot; call close_stream() when the stream ends. Raises SubscriberLimitReached if none is free."""
+    with _tailers_lock:
+        _reserve_stream(name)
+
+def close_stream():
+    """Gives back a slot taken with open_stream()."""
+    global _open_streams
+    with _tailers_lock:
+        _open_streams = max(0, _open_streams - 1)
+
+def subscribe(path):
+    """
+    Starts following a file and returns a Subscription; pass it to unsubscribe() when done.
+    Raises SubscriberLimitReached if LOG_STREAM_MAX_CLIENTS streams are already open.
+    """
+    with _tailers_lock:
+        _reserve_stream(path)
+        tailer = _tailers.get(path)
+        if tailer is None:
+            tailer = _tailers[path] = _Tailer(path)
+        subscription = tailer.subscribe()
+        subscription.tailer = tailer
+    return subscription
+
+def unsubscribe(subscription):
+    """Stops delivering lines to a subscription and frees its stream slot. Safe to call more than once."""
+    subscription.tailer.unsubscribe(subscription)
+    with _tailers_lock:
+        if subscription.closed:
+            return
+        subscription.closed = True
+    close_stream()
@@ -3,9 +3,11 @@ import threading
 import time
 import os
 
-# Import configuration and the worker function
+# Import configuration and the job queue the scheduler runs from
 import config
-from worker import process_uid
+import job_queue
+import leader
+import scheduler
 
 def load_uids_from_file(filepath="uids.txt"):
     """
@@ -49,7 +51,8 @@ def load_coupons_from_file(filepath="coupons.txt"):
 def main():
     """
     Main entry point for the automation script.
-    Manages concurrent execution of browser tasks using a thread pool.
+    Queues a job per UID and lets the job scheduler run them on the asyncio job runner,
+    so the script uses a fixed number of threads however many UIDs are listed.
     """
     # Create directories for logs if they don't exist
     os.makedirs("logs", exist_ok=True)
@@ -70,24 +73,35 @@ def main():
     print(f"Max concurrent sessions: {config.MAX_CONCURRENT_SESSIONS}")
     print("-" * 40)
 
-    # A semaphore is used to limit the number of concurrent browser sessions.
-    # This prevents overwhelming the Selenium Hub or the target website.
-    semaphore = threading.Semaphore(config.MAX_CONCURRENT_SESSIONS)
-    
-    threads = []
+    # Each UID becomes a job in the shared queue. The scheduler starts them as session slots free up
+    # and hands them to the job runner, the same way runs from the web UI and Telegram are executed.
+    base_filenames = set()
     for uid, comment in uids_with_comments:
-        # For each UID, a new thread is created.
-        # The `process_uid` function from worker.py is the target.
-        # The uid, comment, full coupon list, and semaphore are passed to the worker.
-        thread = threading.Thread(target=process_uid, args=(uid, comment, coupons, semaphore))
-        threads.append(thread)
-        thread.start()
-        time.sleep(0.1) # Stagger thread starts slightly
+        job_queue.enqueue(uid, comment, coupons, backend=config.REDEEM_BACKEND)
+        base_filenames.add(f"{uid}_{comment}" if comment else uid)
 
-    # Wait for all threads to complete their execution.
-    # The `join()` method blocks the main thread until the worker thread finishes.
-    for thread in threads:
-        thread.join()
+    running_threads = {}
+    thread_lock = threading.Lock()
+    scheduler.start(running_threads, thread_lock)
+    scheduler.wake()
+
+    # Wait until none of our jobs is queued, running or parked.
+    # If another process (the web app or the bot) is the scheduler leader, it runs them instead.
+    remaining = len(base_filenames)
+    while remaining:
+        time.sleep(config.SCHEDULER_POLL_SECONDS)
+        active = [job for job in job_queue.active_jobs() if job['base_filename'] in base_filenames]
+        if len(active) != remaining:
+            remaining = len(active)
+            print(f"{len(base_filenames) - remaining}/{len(base_filenames)} UIDs processed.")
+
+    # As the scheduler leader, this process may also have started jobs queued by the web app or the bot.
+    # Start no more, and let the started ones finish: the runner's threads die with the process and
+    # would leave their browser sessions open on the hub.
+    scheduler.stop()
+    if leader.is_leader('scheduler'):
+        print("Waiting for jobs started for other processes to finish...")
+        scheduler.wait_idle(running_threads, thread_lock)
 
     end_time = time.time()
     print("-" * 40)
@@ -0,0 +1,151 @@
+import json
+import time
+import hashlib
+import threading
+
+import classifier
+import data_manager
+import ledger
+
+# --- UID x Coupon Status Matrix ---
+# Keeps, in memory, the latest result code of every (uid, coupon) pair together with per-coupon
+# counts and per-UID gaps for the UIDs and coupons currently listed. Every ledger write (from
+# log_coupon_result) stamps its row with a sequence number, so a refresh only reads the rows written
+# since the last one and moves their pairs between buckets. The rendered JSON and its ETag are cached
+# until the ledger or the uids.txt/coupons.txt lists change.
+
+SUCCESS = 'success'
+USED = 'used'
+FAILED = 'failed'
+PENDING = 'pending'
+BUCKETS = (SUCCESS, USED, FAILED, PENDING)
+
+# Codes that are not listed here (no result yet, or a transient one) are still pending.
+_BUCKET_BY_CODE = {
+    classifier.ResultCode.SUCCESS: SUCCESS,
+    classifier.ResultCode.ALREADY_USED: USED,
+    classifier.ResultCode.LIMIT_REACHED: USED,
+    classifier.ResultCode.INVALID: FAILED,
+    classifier.ResultCode.EXPIRED: FAILED,
+    classifier.ResultCode.UNKNOWN: FAILED,
+}
+
+_lock = threading.Lock()
+# { (uid, coupon): result code }
+_codes = {}
+_generation = None
+_seq = 0
+_lists_signature = None
+# The listed UIDs (first entry per UID) and coupons, in file order.
+_uids = []
+_coupons = []
+_coupon_set = set()
+# { coupon: { bucket: count } }
+_counts = {}
+# { uid: set of coupons still pending }
+_gaps = {}
+_etag = None
+_body = None
+
+def bucket(code):
+    """Returns the matrix bucket for a result code, or PENDING for None."""
+    return _BUCKET_BY_CODE.get(code, PENDING)
+
+def _load_all():
+    global _seq
+    _codes.clear()
+    _seq = -1
+    _apply(ledger.changes_since(_seq), move=False)
+
+def _rebuild():
+    """Recomputes counts and gaps for the listed UIDs and coupons from _codes."""
+    _counts.clear()
+    _gaps.clear()
+    for coupon in _coupons:
+        _counts[coupon] = dict.fromkeys(BUCKETS, 0)
+    for entry in _uids:
+        uid = entry['uid']
+        missing = _gaps[uid] = set()
+        for coupon in _coupons:
+            name = bucket(_codes.get((uid, coupon)))
+            _counts[coupon][name] += 1
+            if name == PENDING:
+                missing.add(coupon)
+
+def _apply(rows, move=True):
+    """
+    Applies changed ledger rows. With `move`, each listed pair is also moved from its old bucket to its
+    new one; without it the caller rebuilds the buckets afterwards.
+    """
+    global _seq
+    for row in rows:
+        key = (row['uid'], row['coupon'])
+        old = bucket(_codes.get(key))
+        _codes[key] = row['result_class']
+        _seq = max(_seq, row['seq'])
+        new = bucket(row['result_class'])
+        if not move or old == new or row['uid'] not in _gaps or row['coupon'] not in _coupon_set:
+            continue
+        _counts[row['coupon']][old] -= 1
+        _counts[row['coupon']][new] += 1
+        if new == PENDING:
+            _gaps[row['uid']].add(row['coupon'])
+        else:
+            _gaps[row['uid']].discard(row['coupon'])
+
+def _render():
+    global _etag, _body
+    coupon_order = {coupon: i for i, coupon in enumerate(_coupons)}
+    data = {
+        'coupons': [{'coupon': coupon, **_counts[coupon]} for coupon in _coupons],
+        'uids': [
+            {
+                'uid': entry['uid'],
+                'comment': entry['comment'],
+                'missing': sorted(_gaps[entry['uid']], key=coupon_order.get),
+            }
+            for entry in _uids
+        ],
+        'generated_at': time.time(),
+    }
+    _body = json.dumps(data, ensure_ascii=False)
+    marker = json.dumps([_generation, _seq, _lists_signature], default=str)
+    _etag = hashlib.sha1(marker.encode('utf-8')).hexdigest()
+
+def get():
+    """Returns (etag, json_body) of the current matrix, catching up with the ledger and data files first."""
+    global _generation, _lists_signature, _uids, _coupons, _coupon_set
+    with _lock:
+        generation, seq = ledger.change_marker()
+        uids_snapshot = data_manager.get_snapshot(data_manager.UIDS_FILE)
+        coupons_snapshot = data_manager.get_snapshot(data_manager.COUPONS_FILE)
+        lists_signature = (uids_snapshot.signature, coupons_snapshot.signature)
+
+        changed = False
+        if generation != _generation:
+            # Rows were deleted or replaced; start over.
+            _generation = generation
+            _load_all()
+            changed = True
+        if lists_signature != _lists_signature:
+            _lists_signature = lists_signature
+            seen = set()
+            _uids = []
+            for entry in uids_snapshot.items:
+                if entry['uid'] not in seen:
+                    seen.add(entry['uid'])
+                    _uids.append(entry)
+            _coupons = list(dict.fromkeys(coupons_snapshot.items))
+            _coupon_set = set(_coupons)
+            changed = True
+
+        if changed:
+            _apply(ledger.changes_since(_seq), move=False)
+            _rebuild()
+        elif seq != _seq:
+            _apply(ledger.changes_since(_seq))
+            changed = True
+
+        if changed or _body is None:
+            _render()
+        return _etag, _body
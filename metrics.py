@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+import config
+import db
+import job_queue
+import slot_broker
+
+# --- Metrics ---
+# Hand-rolled counters and histograms, exposed on /metrics in the Prometheus text format.
+# Jobs run in whichever process leads the scheduler, so every process keeps its own values in memory
+# and writes a snapshot of them to the shared state database every METRICS_FLUSH_SECONDS.
+# render() merges the snapshots of all processes and adds live gauges for the queue and session slots.
+
+PREFIX = 'thapplier_'
+
+# Upper bounds (in seconds) of the histogram buckets, from a quick click to a whole promo loop.
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+# Snapshots from processes that stopped flushing are dropped after this long.
+SNAPSHOT_RETENTION_SECONDS = 7 * 24 * 3600
+
+# { name: (type, help) }
+METRICS = {
+    'phase_seconds': ('histogram', 'Time spent in each phase of processing a UID.'),
+    'uid_seconds': ('histogram', 'Time from starting a UID to its final status.'),
+    'uids_total': ('counter', 'UIDs processed, by final status.'),
+    'coupon_attempts_total': ('counter', 'Coupon redemption attempts, by result class.'),
+    'rate_limit_hits_total': ('counter', 'Rate-limit answers that parked a UID.'),
+    'fallback_clicks_total': ('counter', 'Clicks that used a fallback method, by method and outcome.'),
+    'backend_fallbacks_total': ('counter', 'UIDs handed from a browserless backend to Selenium.'),
+    'screenshots_dropped_total': ('counter', 'Screenshots dropped because the writer thread was behind.'),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_snapshots (
+    process    TEXT PRIMARY KEY,
+    pid        INTEGER NOT NULL,
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_lock = threading.Lock()
+# { (name, labels): value }
+_counters = {}
+# { (name, labels): [bucket counts..., +Inf count, sum] }
+_histograms = {}
+_dirty = False
+_flusher = None
+_pid = None
+# Identifies this process's snapshot; the start time keeps a reused pid from overwriting another's.
+_process_key = None
+
+def _ensure_schema():
+    db.ensure_schema('metrics', _SCHEMA)
+
+def _check_fork():
+    """Starts from empty values in a forked child so the parent's counts are not reported twice."""
+    global _pid, _process_key, _flusher, _dirty
+    if _pid != os.getpid():
+        _counters.clear()
+        _histograms.clear()
+        _dirty = False
+        _flusher = None
+        _pid = os.getpid()
+        _process_key = f"{_pid}-{time.time():.0f}"
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name, amount=1, **labels):
+    """Adds `amount` to a counter."""
+    global _dirty
+    key = (name, _labels_key(labels))
+    with _lock:
+        _check_fork()
+        _counters[key] = _counters.get(key, 0) + amount
+        _dirty = True
+    _ensure_flusher()
+
+def observe(name, value, **labels):
+    """Records one observation (in seconds) in a histogram."""
+    global _dirty
+    key = (name, _labels_key(labels))
+    with _lock:
+        _check_fork()
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                values[i] += 1
+                break
+        else:
+            values[len(BUCKETS)] += 1
+        values[-1] += value
+        _dirty = True
+    _ensure_flusher()
+
+@contextmanager
+def span(phase, **labels):
+    """Times the enclosed block as one observation of phase_seconds{phase=...}."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe('phase_seconds', time.monotonic() - start, phase=phase, **labels)
+
+def _snapshot():
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+        'histograms': [[name, list(labels), values] for (name, labels), values in _histograms.items()],
+    }
+
+def flush():
+    """Writes this process's values to the shared database if they changed since the last flush."""
+    global _dirty
+    with _lock:
+        _check_fork()
+        if not _dirty:
+            return
+        data = json.dumps(_snapshot())
+        _dirty = False
+    try:
+        _ensure_schema()
+        with db.transaction() as conn:
+            conn.execute(
+                """INSERT INTO metric_snapshots (process, pid, data, updated_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(process) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at""",
+                (_process_key, _pid, data, time.time())
+            )
+    except Exception:
+        # Try again on the next flush.
+        _dirty = True
+        raise
+
+def _flush_loop():
+    while True:
+        time.sleep(config.METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            logging.warning(f"Could not flush metrics: {e}")
+
+def _ensure_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name="metrics-flusher")
+            _flusher.daemon = True
+            _flusher.start()
+
+def _merged():
+    """Sums the snapshots of every process."""
+    _ensure_schema()
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM metric_snapshots WHERE updated_at < ?", (time.time() - SNAPSHOT_RETENTION_SECONDS,))
+        rows = conn.execute("SELECT data FROM metric_snapshots").fetchall()
+
+    counters, histograms = {}, {}
+    for row in rows:
+        data = json.loads(row['data'])
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in data['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+    return counters, histograms
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+def _gauges():
+    """Live values read at scrape time: jobs per state and session slots in use."""
+    counts = job_queue.counts()
+    gauges = [
+        ('jobs', 'Jobs in the queue, by state.',
+         [((('state', state),), counts.get(state, 0)) for state in
+          (job_queue.QUEUED, job_queue.RUNNING, job_queue.PARKED, job_queue.DONE, job_queue.FAILED)]),
+        ('session_slots_in_use', 'Browser session slots currently leased.', [((), len(slot_broker.active_leases()))]),
+        ('session_slots', 'Configured browser session slots (MAX_CONCURRENT_SESSIONS).', [((), config.MAX_CONCURRENT_SESSIONS)]),
+    ]
+    return gauges
+
+def render():
+    """Returns all metrics of all processes in the Prometheus text exposition format."""
+    flush()
+    counters, histograms = _merged()
+    lines = []
+
+    for name, (kind, help_text) in METRICS.items():
+        full_name = PREFIX + name
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, values):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                cumulative += values[len(BUCKETS)]
+                lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {cumulative}")
+
+    for name, help_text, samples in _gauges():
+        full_name = PREFIX + name
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} gauge")
+        for labels, value in samples:
+            lines.append(f"{full_name}{_format_labels(labels)} {value}")
+
+    return '\n'.join(lines) + '\n'
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+atexit.register(_flush_at_exit)
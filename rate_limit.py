@@ -0,0 +1,23 @@
+import time
+
+import classifier
+import config
+import job_queue
+import metrics
+
+# --- Rate-Limit Parking ---
+# When the store answers "too frequent", the worker parks the UID's job with its remaining coupons
+# and a resume-at timestamp, then gives its browser session and slot back instead of sleeping in them.
+# The scheduler treats parked jobs as runnable again once their cooldown has expired.
+
+def park(uid, comment, coupons, force_run=False, reason=None, cooldown=None):
+    """Parks a UID's remaining coupons until the cooldown expires. Returns the resume-at timestamp."""
+    resume_at = time.time() + (config.RATE_LIMIT_COOLDOWN_SECONDS if cooldown is None else cooldown)
+    job_queue.park(uid, comment, coupons, force_run, resume_at, reason=reason)
+    metrics.inc('rate_limit_hits_total')
+    metrics.inc('coupon_attempts_total', result=classifier.ResultCode.RATE_LIMITED)
+    return resume_at
+
+def parked():
+    """Returns all currently parked jobs."""
+    return [job for job in job_queue.active_jobs() if job['state'] == job_queue.PARKED]
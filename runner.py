@@ -0,0 +1,79 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import config
+
+# --- Asyncio Job Runner ---
+# One event loop per process runs a fixed number of worker coroutines that pull work from an
+# asyncio.Queue. The blocking part of each job (Selenium calls, HTTP redemption) is offloaded to a
+# thread pool of the same size, so the number of OS threads stays flat however many UIDs are queued.
+# Any thread can hand work to the runner with submit(), which returns a concurrent.futures.Future.
+
+_loop = None
+_queue = None
+_executor = None
+_thread = None
+_pid = None
+_start_lock = threading.Lock()
+
+def worker_count():
+    """The number of worker coroutines (and executor threads) in this process."""
+    if config.RUNNER_WORKERS > 0:
+        return config.RUNNER_WORKERS
+    # Enough for every browser slot plus every browserless job the scheduler may start at once.
+    return config.MAX_CONCURRENT_SESSIONS + config.HTTP_CONCURRENCY
+
+async def _worker(loop, queue, executor):
+    while True:
+        future, fn, args = await queue.get()
+        try:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = await loop.run_in_executor(executor, fn, *args)
+            except Exception as e:
+                logging.error(f"Runner job {getattr(fn, '__name__', fn)} failed: {e}")
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        finally:
+            queue.task_done()
+
+def _run_loop(loop, queue, executor, workers):
+    asyncio.set_event_loop(loop)
+    for _ in range(workers):
+        loop.create_task(_worker(loop, queue, executor))
+    loop.run_forever()
+
+def start():
+    """Starts this process's runner if it is not running yet. Safe to call repeatedly and after a fork."""
+    global _loop, _queue, _executor, _thread, _pid
+    with _start_lock:
+        if _thread is not None and _thread.is_alive() and _pid == os.getpid():
+            return
+        workers = worker_count()
+        _loop = asyncio.new_event_loop()
+        _queue = asyncio.Queue()
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="runner")
+        _thread = threading.Thread(target=_run_loop, args=(_loop, _queue, _executor, workers), name="job-runner")
+        _thread.daemon = True
+        _thread.start()
+        _pid = os.getpid()
+        logging.info(f"Job runner started with {workers} workers.")
+
+def submit(fn, *args):
+    """
+    Queues fn(*args) to run on the runner's executor and returns a Future for its result.
+    Jobs start in submission order as workers become free.
+    """
+    start()
+    future = Future()
+    _loop.call_soon_threadsafe(_queue.put_nowait, (future, fn, args))
+    return future
+
+def pending():
+    """The number of submitted jobs still waiting for a free worker."""
+    return _queue.qsize() if _queue is not None else 0
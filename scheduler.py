@@ -0,0 +1,234 @@
+import time
+import logging
+import threading
+
+import backends
+import config
+import coupon_cache
+import job_queue
+import leader
+import ledger
+import metrics
+import runner
+import search_index
+import session_status
+import slot_broker
+
+# --- Slot-Filling Job Scheduler ---
+# One scheduler per container (elected with leader.py) pulls jobs from job_queue and starts them as
+# soon as slot_broker has a free session slot, keeping at least DELAY_BETWEEN_SESSIONS seconds
+# between session starts. Started jobs run on runner.py's fixed pool of workers, so thousands of
+# queued UIDs cost nothing.
+# Jobs on a browserless backend skip the slot broker and are limited by HTTP_CONCURRENCY instead;
+# accounts such a backend cannot handle are sent back to the queue for the Selenium backend.
+
+FINAL_STATUSES = session_status.FINAL_STATUSES
+
+# How often (in seconds) a non-leader process checks whether it should take over.
+LEADER_RETRY_SECONDS = 15
+# Finished jobs are kept this long for inspection before being pruned.
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+_wakeup = threading.Event()
+# Set by stop(); the scheduler then starts no more jobs.
+_stopping = threading.Event()
+# Free workers for jobs on backends that do not need a browser.
+_http_capacity = threading.BoundedSemaphore(config.HTTP_CONCURRENCY)
+_scheduler_thread = None
+_start_lock = threading.Lock()
+
+def wake():
+    """Tells the scheduler in this process that new work was queued or a slot was freed."""
+    _wakeup.set()
+
+def _queued_fields(uid, comment):
+    return {
+        'status': 'Queued',
+        'log_preview': 'Waiting for an available session...',
+        'display_name': f"{uid} ({comment})",
+        'session_id': None
+    }
+
+def new_status(uid, comment):
+    """Returns a fresh status dict for a UID waiting in the queue."""
+    base_filename = f"{uid}_{comment}" if comment else uid
+    return session_status.SessionStatus(base_filename, _queued_fields(uid, comment))
+
+def publish_queued(uid, comment):
+    """
+    Shows a UID as queued in the shared status store, unless it is already queued or running there.
+    Used by processes that queue jobs; the leader tracks the run itself once it starts it.
+    """
+    base_filename = f"{uid}_{comment}" if comment else uid
+    session_status.publish_queued(base_filename, _queued_fields(uid, comment))
+
+def _job_state_for(status):
+    if status == 'Finished':
+        return job_queue.DONE
+    if status == 'Parked':
+        return job_queue.PARKED
+    return job_queue.FAILED
+
+def _run_jobs(jobs, release, running_threads, thread_lock):
+    """
+    Runs a batch of claimed jobs on their backend, then records their outcomes.
+    `release` frees the slot or worker the batch was started with.
+    """
+    fallback_ids = set()
+    try:
+        backend = backends.get_backend(jobs[0]['backend'])
+        accounts = [{
+            'job_id': job['id'],
+            'uid': job['uid'],
+            'comment': job['comment'],
+            'coupons': job['coupons'],
+            'force_run': job['force_run'],
+            'status_dict': running_threads[job['base_filename']],
+        } for job in jobs]
+        for account in backend.process_batch(accounts, thread_lock):
+            # The backend could not handle this UID; let the browser flow finish it.
+            job_queue.requeue(account['job_id'], account['coupons'], backends.SELENIUM)
+            fallback_ids.add(account['job_id'])
+            metrics.inc('backend_fallbacks_total', backend=backend.name)
+    except Exception as e:
+        logging.error(f"Unexpected error while running jobs {[job['id'] for job in jobs]}: {e}")
+    finally:
+        release()
+        for job in jobs:
+            if job['id'] in fallback_ids:
+                continue
+            with thread_lock:
+                status_dict = running_threads.get(job['base_filename'], {})
+                status = status_dict.get('status')
+                if status not in FINAL_STATUSES:
+                    status_dict['status'] = 'Error'
+            state = _job_state_for(status)
+            # Parked jobs were already moved to 'parked' by rate_limit.park.
+            if state != job_queue.PARKED:
+                job_queue.finish(job['id'], state, error=None if state == job_queue.DONE else status_dict.get('log_preview'))
+        wake()
+
+def _start_jobs(jobs, release, running_threads, thread_lock):
+    with thread_lock:
+        for job in jobs:
+            existing = running_threads.get(job['base_filename'])
+            if not existing or existing.get('status') in FINAL_STATUSES:
+                running_threads[job['base_filename']] = new_status(job['uid'], job['comment'])
+        future = runner.submit(_run_jobs, jobs, release, running_threads, thread_lock)
+        for job in jobs:
+            running_threads[job['base_filename']]['future'] = future
+    logging.info(f"Started {jobs[0]['backend']} run for {', '.join(job['base_filename'] for job in jobs)}.")
+
+def _start_browserless_jobs(running_threads, thread_lock):
+    """Starts queued browserless jobs while HTTP workers are free. Returns True if any started."""
+    started = False
+    while _http_capacity.acquire(blocking=False):
+        jobs = job_queue.claim(limit=1, backend=backends.HTTP)
+        if not jobs:
+            _http_capacity.release()
+            break
+        _start_jobs(jobs, _http_capacity.release, running_threads, thread_lock)
+        started = True
+    return started
+
+def _scheduler_loop(running_threads, thread_lock):
+    while not leader.try_acquire('scheduler'):
+        if _stopping.wait(LEADER_RETRY_SECONDS):
+            return
+
+    requeued = job_queue.requeue_running()
+    logging.info(f"Job scheduler started in this process. Re-queued {requeued} interrupted jobs.")
+    try:
+        session_status.mark_interrupted()
+    except Exception as e:
+        logging.error(f"Could not reset the status of interrupted sessions: {e}")
+    # Bring in results from the old coupon_logs text files, and give rows from before result codes
+    # (or from a classifier that misread them) their code, before the first job reads them.
+    try:
+        ledger.import_text_logs()
+        ledger.migrate_result_codes()
+        coupon_cache.reclassify_dead()
+    except Exception as e:
+        logging.error(f"Could not upgrade the redemption ledger: {e}")
+    try:
+        search_index.import_worker_logs()
+    except Exception as e:
+        logging.error(f"Could not import worker logs into the log search index: {e}")
+
+    last_start = None
+    last_prune = 0
+    last_compact = time.monotonic()
+    while not _stopping.is_set():
+        try:
+            if time.monotonic() - last_prune > 3600:
+                job_queue.prune(JOB_RETENTION_SECONDS)
+                session_status.prune(JOB_RETENTION_SECONDS)
+                if config.SEARCH_RETENTION_DAYS > 0:
+                    search_index.prune(config.SEARCH_RETENTION_DAYS * 86400)
+                last_prune = time.monotonic()
+
+            if config.LEDGER_COMPACT_HOURS > 0 and time.monotonic() - last_compact > config.LEDGER_COMPACT_HOURS * 3600:
+                last_compact = time.monotonic()
+                ledger.compact()
+
+            if _start_browserless_jobs(running_threads, thread_lock):
+                continue
+
+            if not job_queue.has_runnable(backend=backends.SELENIUM):
+                # Parked jobs become runnable on their own, so poll even without a wakeup.
+                _wakeup.wait(config.SCHEDULER_POLL_SECONDS)
+                _wakeup.clear()
+                continue
+
+            # Keep the minimum spacing between session starts.
+            if last_start is not None:
+                remaining = last_start + config.DELAY_BETWEEN_SESSIONS - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+
+            lease = slot_broker.acquire('scheduler', timeout=config.SCHEDULER_POLL_SECONDS)
+            if lease is None:
+                continue
+
+            jobs = job_queue.claim(limit=max(1, config.BATCH_SIZE), backend=backends.SELENIUM)
+            if not jobs:
+                lease.release()
+                continue
+
+            _start_jobs(jobs, lease.release, running_threads, thread_lock)
+            last_start = time.monotonic()
+        except Exception as e:
+            logging.error(f"Job scheduler error: {e}")
+            time.sleep(config.SCHEDULER_POLL_SECONDS)
+
+def stop():
+    """
+    Stops this process's scheduler from starting more jobs and waits for its thread to exit.
+    Jobs it already started keep running; use wait_idle() to wait for them.
+    """
+    _stopping.set()
+    wake()
+    thread = _scheduler_thread
+    if thread is not None:
+        thread.join()
+
+def wait_idle(running_threads, thread_lock):
+    """Blocks until every job this process's scheduler started has finished."""
+    while True:
+        with thread_lock:
+            futures = [status.get('future') for status in running_threads.values()]
+        if runner.pending() == 0 and all(future is None or future.done() for future in futures):
+            return
+        time.sleep(config.SCHEDULER_POLL_SECONDS)
+
+def start(running_threads, thread_lock):
+    """
+    Starts this process's scheduler thread. It waits to become the container's leader before
+    running jobs, so it is safe to call from every process.
+    """
+    global _scheduler_thread
+    with _start_lock:
+        if _scheduler_thread is None or not _scheduler_thread.is_alive():
+            _scheduler_thread = threading.Thread(target=_scheduler_loop, args=(running_threads, thread_lock), name="job-scheduler")
+            _scheduler_thread.daemon = True
+            _scheduler_thread.start()
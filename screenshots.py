@@ -0,0 +1,179 @@
+import io
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+import config
+import metrics
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# --- Screenshot Pipeline ---
+# Workers ask for a screenshot at each phase of the login flow, for every coupon and on errors;
+# SCREENSHOT_POLICY decides which of those are taken. The worker thread only pulls the PNG from the
+# browser (the frame has to show the page as it is at that moment); saving it, the thumbnail and the
+# per-UID history are handled by a background thread, so the worker goes straight back to redeeming.
+#
+# Files in SCREENSHOT_DIR:
+#   <base_filename>.png                 the latest frame (the URL older versions wrote to)
+#   <base_filename>.thumb.<jpg|webp>    a downscaled copy of it, if Pillow is installed
+#   history/<base_filename>/<time>_<label>.png
+#                                       the last SCREENSHOT_HISTORY frames
+
+NEVER = 'never'
+ON_ERROR = 'on-error'
+PER_PHASE = 'per-phase'
+PER_COUPON = 'per-coupon'
+POLICIES = (NEVER, ON_ERROR, PER_PHASE, PER_COUPON)
+
+# What a screenshot is taken for. Each policy takes the kinds up to its own.
+ERROR = 'error'
+PHASE = 'phase'
+COUPON = 'coupon'
+_KINDS_BY_POLICY = {
+    NEVER: (),
+    ON_ERROR: (ERROR,),
+    PER_PHASE: (ERROR, PHASE),
+    PER_COUPON: (ERROR, PHASE, COUPON),
+}
+
+HISTORY_DIR = 'history'
+# Frames waiting to be saved. When the writer falls this far behind, new frames are dropped.
+QUEUE_SIZE = 32
+
+_THUMB_EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+def _policy():
+    if config.SCREENSHOT_POLICY in POLICIES:
+        return config.SCREENSHOT_POLICY
+    logging.warning(f"Unknown SCREENSHOT_POLICY '{config.SCREENSHOT_POLICY}'. Using '{ON_ERROR}'.")
+    return ON_ERROR
+
+_kinds = _KINDS_BY_POLICY[_policy()]
+
+def wanted(kind):
+    """True if the policy takes screenshots of this kind."""
+    return kind in _kinds
+
+def thumbnail_name(base_filename):
+    extension = _THUMB_EXTENSIONS.get(config.SCREENSHOT_THUMB_FORMAT, 'jpg')
+    return f"{base_filename}.thumb.{extension}"
+
+# --- Writing ---
+_queue = queue.Queue(QUEUE_SIZE)
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _save_thumbnail(base_filename, png):
+    if Image is None:
+        return
+    with Image.open(io.BytesIO(png)) as image:
+        image = image.convert('RGB')
+        width = config.SCREENSHOT_THUMB_WIDTH
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        fmt = config.SCREENSHOT_THUMB_FORMAT if config.SCREENSHOT_THUMB_FORMAT in _THUMB_EXTENSIONS else 'jpeg'
+        image.save(output, format=fmt.upper(), quality=75)
+    _write_atomic(os.path.join(config.SCREENSHOT_DIR, thumbnail_name(base_filename)), output.getvalue())
+
+def _save_history(base_filename, png, taken_at, label):
+    directory = os.path.join(config.SCREENSHOT_DIR, HISTORY_DIR, base_filename)
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(taken_at)) + f"{taken_at % 1:.3f}"[1:]
+    safe_label = ''.join(c if c.isalnum() or c in '-_' else '-' for c in label)[:40]
+    _write_atomic(os.path.join(directory, f"{stamp}_{safe_label}.png"), png)
+    # Keep only the newest frames; names sort by time.
+    frames = sorted(f for f in os.listdir(directory) if f.endswith('.png'))
+    for old in frames[:-config.SCREENSHOT_HISTORY] if config.SCREENSHOT_HISTORY > 0 else frames:
+        os.remove(os.path.join(directory, old))
+
+def _save(base_filename, png, taken_at, label):
+    os.makedirs(config.SCREENSHOT_DIR, exist_ok=True)
+    _write_atomic(os.path.join(config.SCREENSHOT_DIR, f"{base_filename}.png"), png)
+    _save_thumbnail(base_filename, png)
+    _save_history(base_filename, png, taken_at, label)
+
+def _drain(block):
+    while True:
+        try:
+            frame = _queue.get(block=block)
+        except queue.Empty:
+            return
+        block = False
+        try:
+            with metrics.span('screenshot_save'):
+                _save(*frame)
+        except Exception as e:
+            logging.error(f"Could not save screenshot for {frame[0]}: {e}")
+
+def _writer_loop():
+    while True:
+        _drain(block=True)
+
+def _ensure_writer():
+    global _writer_thread
+    if _writer_thread is None or not _writer_thread.is_alive():
+        with _writer_lock:
+            if _writer_thread is None or not _writer_thread.is_alive():
+                _writer_thread = threading.Thread(target=_writer_loop, name="screenshot-writer")
+                _writer_thread.daemon = True
+                _writer_thread.start()
+
+def flush():
+    """Saves the frames still queued in this process."""
+    _drain(block=False)
+
+atexit.register(flush)
+
+def capture(driver, base_filename, kind, label):
+    """
+    Takes a screenshot if the policy wants this kind and queues it to be saved. `label` names the
+    frame in the UID's history (e.g. "login" or the coupon code). Never raises.
+    """
+    if kind not in _kinds:
+        return
+    try:
+        with metrics.span('screenshot'):
+            png = driver.get_screenshot_as_png()
+    except Exception as e:
+        logging.warning(f"Could not take screenshot for {base_filename}: {e}")
+        return
+    _ensure_writer()
+    try:
+        _queue.put_nowait((base_filename, png, time.time(), label))
+    except queue.Full:
+        metrics.inc('screenshots_dropped_total')
+        logging.warning(f"Screenshot writer is behind; dropped a frame for {base_filename}.")
+
+# --- Reading ---
+def recent(base_filename):
+    """
+    Returns the screenshot files of a UID, relative to SCREENSHOT_DIR: the latest frame, its
+    thumbnail and the history frames, newest first. Missing files are None or left out.
+    """
+    def existing(name):
+        return name if os.path.exists(os.path.join(config.SCREENSHOT_DIR, name)) else None
+
+    directory = os.path.join(config.SCREENSHOT_DIR, HISTORY_DIR, base_filename)
+    try:
+        frames = sorted((f for f in os.listdir(directory) if f.endswith('.png')), reverse=True)
+    except FileNotFoundError:
+        frames = []
+    return {
+        'latest': existing(f"{base_filename}.png"),
+        'thumbnail': existing(thumbnail_name(base_filename)),
+        'history': [f"{HISTORY_DIR}/{base_filename}/{frame}" for frame in frames],
+    }
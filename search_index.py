@@ -0,0 +1,327 @@
+import os
+import re
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+import classifier
+import db
+import ledger
+
+# --- Log Search Index ---
+# Every line a worker logs is also written, with its UID, level and (for coupon results) coupon and
+# result code, to a log_events table in the shared state database. An FTS5 table indexes the
+# messages, so searches across all UIDs are answered from indexes instead of by opening each
+# logs/<uid>.log file. Lines are queued by a logging handler and written in batches by one thread
+# per process. Worker logs written before the index existed are imported once by the scheduler's
+# leader. Without FTS5 support in the local SQLite build, text queries fall back to LIKE.
+
+# How long (in seconds) the writer waits to collect more lines into one transaction.
+FLUSH_SECONDS = 1.0
+# The most lines written in one transaction.
+MAX_BATCH = 500
+# The most results one search returns.
+MAX_RESULTS = 1000
+# Fields a search can group its matches by.
+GROUP_FIELDS = ('uid', 'coupon', 'result_class', 'level')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_events (
+    id            INTEGER PRIMARY KEY,
+    ts            REAL NOT NULL,
+    uid           TEXT NOT NULL,
+    base_filename TEXT NOT NULL,
+    level         TEXT NOT NULL,
+    coupon        TEXT,
+    result_class  TEXT,
+    message       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS log_events_ts ON log_events (ts);
+CREATE INDEX IF NOT EXISTS log_events_uid ON log_events (uid, ts);
+CREATE INDEX IF NOT EXISTS log_events_base ON log_events (base_filename, ts);
+CREATE INDEX IF NOT EXISTS log_events_coupon ON log_events (coupon, ts);
+CREATE INDEX IF NOT EXISTS log_events_result ON log_events (result_class, ts);
+CREATE INDEX IF NOT EXISTS log_events_level ON log_events (level, ts);
+CREATE TABLE IF NOT EXISTS log_events_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# External-content FTS table kept in step with log_events by triggers.
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS log_events_fts USING fts5(
+    message, content='log_events', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS log_events_fts_insert AFTER INSERT ON log_events BEGIN
+    INSERT INTO log_events_fts (rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER IF NOT EXISTS log_events_fts_delete AFTER DELETE ON log_events BEGIN
+    INSERT INTO log_events_fts (log_events_fts, rowid, message) VALUES ('delete', old.id, old.message);
+END;
+"""
+
+# "2024-05-01 12:34:56,789 [INFO] - message", the worker log format.
+_LINE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) \[(\w+)\] - (.*)$")
+# "Coupon 'CODE': result [code]", as written by log_coupon_result; older lines have no code.
+_COUPON_PATTERN = re.compile(r"^Coupon '(.+?)': (.*?)(?: \[(\w+)\])?$")
+
+_fts = None
+
+def _ensure_schema():
+    global _fts
+    db.ensure_schema('search_index', _SCHEMA)
+    if _fts is None:
+        try:
+            db.ensure_schema('search_index_fts', _FTS_SCHEMA)
+            _fts = True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Full-text search is not available ({e}); log searches will scan messages instead.")
+            _fts = False
+
+# --- Writing ---
+_queue = queue.Queue()
+_pending = threading.Event()
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+def _event_row(ts, base_filename, level, message, coupon=None, result_class=None):
+    uid, _ = ledger.split_base_filename(base_filename)
+    return (ts, uid, base_filename, level, coupon, str(result_class) if result_class else None, message)
+
+def _insert(rows):
+    _ensure_schema()
+    with db.transaction() as conn:
+        conn.executemany(
+            """INSERT INTO log_events (ts, uid, base_filename, level, coupon, result_class, message)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+
+def _drain():
+    """Writes the queued lines in batches."""
+    rows = []
+    while True:
+        try:
+            rows.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+        if len(rows) >= MAX_BATCH:
+            _insert(rows)
+            rows = []
+    if rows:
+        _insert(rows)
+
+def _writer_loop():
+    while True:
+        _pending.wait()
+        # Let a burst of lines collect so they share one transaction.
+        time.sleep(FLUSH_SECONDS)
+        _pending.clear()
+        try:
+            _drain()
+        except Exception as e:
+            # Logged to the root logger, which is not indexed, so this cannot loop.
+            logging.error(f"Could not write to the log search index: {e}")
+
+def _enqueue(row):
+    global _writer_thread
+    _queue.put(row)
+    _pending.set()
+    if _writer_thread is None or not _writer_thread.is_alive():
+        with _writer_lock:
+            if _writer_thread is None or not _writer_thread.is_alive():
+                _writer_thread = threading.Thread(target=_writer_loop, name="search-index-writer")
+                _writer_thread.daemon = True
+                _writer_thread.start()
+
+def flush():
+    """Writes the lines still queued in this process."""
+    try:
+        _drain()
+    except Exception as e:
+        logging.error(f"Could not write to the log search index: {e}")
+
+atexit.register(flush)
+
+class IndexHandler(logging.Handler):
+    """
+    Queues a worker logger's lines for the search index. Coupon results carry their coupon and
+    result code in the record's `search_fields` (see worker.log_coupon_result).
+    """
+
+    def __init__(self, base_filename):
+        super().__init__()
+        self.base_filename = base_filename
+
+    def emit(self, record):
+        try:
+            fields = getattr(record, 'search_fields', None) or {}
+            _enqueue(_event_row(record.created, self.base_filename, record.levelname, record.getMessage(),
+                                fields.get('coupon'), fields.get('result_class')))
+        except Exception:
+            self.handleError(record)
+
+# --- Importing Existing Worker Logs ---
+def _parse_worker_log(path):
+    """Yields (ts, level, message) entries from a worker log file. Continuation lines join their entry."""
+    entry = None
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = _LINE_PATTERN.match(line.rstrip('\n'))
+            if match is None:
+                if entry is not None:
+                    entry[2] += '\n' + line.rstrip('\n')
+                continue
+            if entry is not None:
+                yield tuple(entry)
+            stamp, millis, level, message = match.groups()
+            ts = time.mktime(time.strptime(stamp, '%Y-%m-%d %H:%M:%S')) + int(millis) / 1000
+            entry = [ts, level, message]
+    if entry is not None:
+        yield tuple(entry)
+
+def _coupon_fields(message):
+    """Returns (coupon, result_class) for a coupon result line, or (None, None)."""
+    match = _COUPON_PATTERN.match(message)
+    if match is None:
+        return None, None
+    coupon, result, code = match.groups()
+    try:
+        return coupon, classifier.ResultCode(code)
+    except ValueError:
+        return coupon, classifier.classify(result)
+
+def import_worker_logs(directory='logs'):
+    """
+    One-time import of the worker logs (<base_filename>.log and their rotated .log.1 files) into the
+    search index. Only lines older than the first line the index received live for a UID are
+    imported, so nothing is indexed twice. Returns the number of lines imported.
+    """
+    _ensure_schema()
+    conn = db.get_connection()
+    if conn.execute("SELECT 1 FROM log_events_meta WHERE key = 'worker_logs_imported'").fetchone():
+        return 0
+    if not os.path.isdir(directory):
+        return 0
+
+    cutoffs = {
+        row['base_filename']: row['first_ts']
+        for row in conn.execute("SELECT base_filename, MIN(ts) AS first_ts FROM log_events GROUP BY base_filename")
+    }
+    imported = 0
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.log'):
+            base_filename = filename[:-len('.log')]
+        elif filename.endswith('.log.1'):
+            base_filename = filename[:-len('.log.1')]
+        else:
+            continue
+        # app.log and the bot's log are not worker logs.
+        if not base_filename or not base_filename[0].isdigit():
+            continue
+        cutoff = cutoffs.get(base_filename)
+        rows = []
+        try:
+            for ts, level, message in _parse_worker_log(os.path.join(directory, filename)):
+                if cutoff is not None and ts >= cutoff:
+                    break
+                rows.append(_event_row(ts, base_filename, level, message, *_coupon_fields(message)))
+                if len(rows) >= MAX_BATCH:
+                    _insert(rows)
+                    imported += len(rows)
+                    rows = []
+        except OSError as e:
+            logging.error(f"Could not import {filename} into the log search index: {e}")
+        if rows:
+            _insert(rows)
+            imported += len(rows)
+
+    with db.transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO log_events_meta (key, value) VALUES ('worker_logs_imported', ?)", (str(time.time()),)
+        )
+    if imported:
+        logging.info(f"Imported {imported} worker log lines from {directory} into the log search index.")
+    return imported
+
+def prune(max_age_seconds):
+    """Deletes indexed lines older than `max_age_seconds`. Returns how many were deleted."""
+    _ensure_schema()
+    with db.transaction() as conn:
+        cursor = conn.execute("DELETE FROM log_events WHERE ts < ?", (time.time() - max_age_seconds,))
+    return cursor.rowcount
+
+# --- Searching ---
+def _fts_query(text):
+    """Turns free text into an FTS5 phrase query for its words; the last word may be a prefix."""
+    words = re.findall(r'\w+', text)
+    return '"' + ' '.join(words) + '"*' if words else ''
+
+
+def search(text=None, uid=None, coupon=None, level=None, result_class=None, since=None, until=None,
+           group_by=None, limit=100):
+    """
+    Returns the newest indexed lines matching every given filter, as dicts with ts, time, uid,
+    base_filename, level, coupon, result_class and message. `text` matches words in the message,
+    `level` and `result_class` may be lists, and `since`/`until` are Unix timestamps.
+    With `group_by` (one of GROUP_FIELDS), returns { value, count, last_ts } per distinct value instead.
+    """
+    _ensure_schema()
+    conditions = []
+    params = []
+    source = "log_events e"
+    if text:
+        if _fts:
+            query = _fts_query(text)
+            if not query:
+                return []
+            source = "log_events_fts f JOIN log_events e ON e.id = f.rowid"
+            conditions.append("log_events_fts MATCH ?")
+            params.append(query)
+        else:
+            conditions.append("e.message LIKE ? ESCAPE '\\'")
+            params.append('%' + re.sub(r'([%_\\])', r'\\\1', text) + '%')
+    for column, value in (('uid', uid), ('coupon', coupon), ('level', level), ('result_class', result_class)):
+        if not value:
+            continue
+        values = [value] if isinstance(value, str) else list(value)
+        if column == 'level':
+            values = [v.upper() for v in values]
+        conditions.append(f"e.{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    if since is not None:
+        conditions.append("e.ts >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("e.ts < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit = max(1, min(int(limit), MAX_RESULTS))
+
+    conn = db.get_connection()
+    if group_by:
+        if group_by not in GROUP_FIELDS:
+            raise ValueError(f"Cannot group by {group_by}")
+        rows = conn.execute(
+            f"""SELECT e.{group_by} AS value, COUNT(*) AS count, MAX(e.ts) AS last_ts FROM {source} {where}
+                GROUP BY e.{group_by} ORDER BY count DESC, last_ts DESC LIMIT ?""",
+            params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    rows = conn.execute(
+        f"""SELECT e.ts, e.uid, e.base_filename, e.level, e.coupon, e.result_class, e.message FROM {source} {where}
+            ORDER BY e.ts DESC LIMIT ?""",
+        params + [limit]
+    ).fetchall()
+    results = []
+    for row in rows:
+        event = dict(row)
+        event['time'] = datetime.fromtimestamp(event['ts']).isoformat(sep=' ', timespec='milliseconds')
+        results.append(event)
+    return results
@@ -0,0 +1,268 @@
+import time
+import atexit
+import logging
+import threading
+
+import db
+
+# --- Shared Session Status Store ---
+# Each UID's entry in the scheduler leader's running_threads is a SessionStatus. Changing one of its
+# public fields marks it dirty; a publisher thread writes dirty entries to the session_status table of
+# the shared state database a few times per second, stamping each row with the next version number.
+# Every process (any gunicorn worker, the Telegram bot) reads the same rows, so /status is consistent
+# no matter which process serves it, and /status/stream sends just the rows whose version is newer
+# than the one it last sent. Pruned sessions stay behind as tombstones (deleted = 1) with a new version
+# for TOMBSTONE_SECONDS, so streams and ETags see the removal; readers get None for them.
+
+# Fields kept in the shared store. Other keys (such as the job's 'future') stay in the process.
+PUBLIC_FIELDS = (
+    'status', 'log_preview', 'display_name', 'session_id',
+    'coupons_total', 'coupons_done', 'created_at', 'started_at', 'finished_at',
+)
+
+FINAL_STATUSES = ('Finished', 'Error', 'Parked')
+
+# How long (in seconds) a quiet status stream waits before sending a keep-alive comment.
+STREAM_KEEPALIVE_SECONDS = 15
+# How often (in seconds) dirty statuses are written to the shared store.
+PUBLISH_SECONDS = 0.2
+# How often (in seconds) a waiting reader checks the shared store for changes made by other processes.
+POLL_SECONDS = 0.5
+# How long (in seconds) a pruned session's tombstone is kept before the row is deleted.
+TOMBSTONE_SECONDS = 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_status (
+    key           TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,
+    log_preview   TEXT NOT NULL DEFAULT '',
+    display_name  TEXT,
+    session_id    TEXT,
+    coupons_total INTEGER,
+    coupons_done  INTEGER,
+    created_at    REAL,
+    started_at    REAL,
+    finished_at   REAL,
+    updated_at    REAL NOT NULL,
+    version       INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS session_status_version ON session_status (version);
+"""
+
+_COLUMNS = ('key',) + PUBLIC_FIELDS + ('updated_at', 'version')
+
+def _ensure_schema():
+    db.ensure_schema('session_status', _SCHEMA)
+    db.ensure_columns('session_status.columns', 'session_status', {'deleted': 'INTEGER NOT NULL DEFAULT 0'})
+
+def _next_version(conn):
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM session_status").fetchone()[0] + 1
+
+def _write(conn, key, fields, version):
+    conn.execute(
+        f"""INSERT OR REPLACE INTO session_status ({', '.join(_COLUMNS)})
+            VALUES ({', '.join('?' * len(_COLUMNS))})""",
+        (key, *(fields[name] for name in PUBLIC_FIELDS), time.time(), version)
+    )
+
+# --- Publishing ---
+# { key: SessionStatus } changed since the last publish.
+_dirty = {}
+_dirty_lock = threading.Lock()
+_pending = threading.Event()
+_publisher_thread = None
+# Notified after this process published, so local readers need not wait for their next poll.
+_changed = threading.Condition()
+
+def _mark_dirty(status):
+    global _publisher_thread
+    with _dirty_lock:
+        _dirty[status.key] = status
+        _pending.set()
+        if _publisher_thread is None or not _publisher_thread.is_alive():
+            _publisher_thread = threading.Thread(target=_publisher_loop, name="session-status-publisher")
+            _publisher_thread.daemon = True
+            _publisher_thread.start()
+
+def publish():
+    """Writes this process's changed statuses to the shared store."""
+    with _dirty_lock:
+        statuses = list(_dirty.values())
+        _dirty.clear()
+        _pending.clear()
+    if not statuses:
+        return
+    _ensure_schema()
+    with db.transaction() as conn:
+        version = _next_version(conn)
+        for status in statuses:
+            _write(conn, status.key, status.public(), version)
+            version += 1
+    with _changed:
+        _changed.notify_all()
+
+def publish_queued(key, fields):
+    """
+    Shows a session as queued in the shared store right away, for processes that queue jobs without
+    running them. Does nothing if the store already has it queued or running. Returns True if written.
+    """
+    _ensure_schema()
+    placeholders = ', '.join('?' * len(FINAL_STATUSES))
+    with db.transaction() as conn:
+        active = conn.execute(
+            f"SELECT 1 FROM session_status WHERE key = ? AND deleted = 0 AND status NOT IN ({placeholders})",
+            (key, *FINAL_STATUSES)
+        ).fetchone()
+        if active:
+            return False
+        fields = {name: fields.get(name) for name in PUBLIC_FIELDS}
+        fields.update(status='Queued', created_at=fields['created_at'] or time.time())
+        fields['log_preview'] = fields['log_preview'] or ''
+        _write(conn, key, fields, _next_version(conn))
+    with _changed:
+        _changed.notify_all()
+    return True
+
+def _publisher_loop():
+    while True:
+        _pending.wait()
+        # Let a burst of log lines settle into one write.
+        time.sleep(PUBLISH_SECONDS)
+        try:
+            publish()
+        except Exception as e:
+            logging.error(f"Could not publish session status: {e}")
+
+atexit.register(publish)
+
+class SessionStatus(dict):
+    """A UID's status dict whose public fields are mirrored to the shared store."""
+
+    def __init__(self, key, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key = key
+        self.setdefault('created_at', time.time())
+        _mark_dirty(self)
+
+    def __setitem__(self, key, value):
+        if key in PUBLIC_FIELDS and key in self and self[key] == value:
+            return
+        super().__setitem__(key, value)
+        if key == 'status':
+            if value in FINAL_STATUSES:
+                super().__setitem__('finished_at', time.time())
+            elif value != 'Queued' and not self.get('started_at'):
+                super().__setitem__('started_at', time.time())
+        if key in PUBLIC_FIELDS:
+            _mark_dirty(self)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def public(self):
+        """Returns the fields kept in the shared store."""
+        fields = {name: self.get(name) for name in PUBLIC_FIELDS}
+        fields['status'] = fields['status'] or 'Unknown'
+        fields['log_preview'] = fields['log_preview'] or ''
+        return fields
+
+# --- Reading ---
+def current_version():
+    """Returns the version of the most recent change in the shared store."""
+    _ensure_schema()
+    return db.get_connection().execute("SELECT COALESCE(MAX(version), 0) FROM session_status").fetchone()[0]
+
+def wait_for_change(version, timeout=None):
+    """
+    Blocks until a change newer than `version` is in the shared store. Returns False if `timeout`
+    expired first. Changes from this process wake it at once; others are noticed within POLL_SECONDS.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while current_version() <= version:
+        wait = POLL_SECONDS
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            wait = min(wait, remaining)
+        with _changed:
+            _changed.wait(wait)
+    return True
+
+def collect(since=0):
+    """
+    Returns (version, { key: fields }) for the sessions changed after version `since`, or all of them
+    for since=0. Sessions pruned since then map to None. Pass the returned version as `since` next time.
+    """
+    _ensure_schema()
+    rows = db.get_connection().execute(
+        f"SELECT {', '.join(_COLUMNS)}, deleted FROM session_status WHERE version > ? ORDER BY version", (since,)
+    ).fetchall()
+    changed = {}
+    version = since
+    for row in rows:
+        fields = dict(row)
+        key = fields.pop('key')
+        version = max(version, fields.pop('version'))
+        if fields.pop('deleted'):
+            # A full listing leaves pruned sessions out.
+            if since:
+                changed[key] = None
+            continue
+        fields['display_name'] = fields['display_name'] or key
+        changed[key] = fields
+    return version, changed
+
+def mark_interrupted():
+    """
+    Called by a new scheduler leader: sessions the previous leader left unfinished are shown as queued
+    again, as job_queue has re-queued their jobs.
+    """
+    _ensure_schema()
+    placeholders = ', '.join('?' * (len(FINAL_STATUSES) + 1))
+    with db.transaction() as conn:
+        version = _next_version(conn)
+        keys = [row['key'] for row in conn.execute(
+            f"SELECT key FROM session_status WHERE deleted = 0 AND status NOT IN ({placeholders})",
+            (*FINAL_STATUSES, 'Queued')
+        )]
+        for key in keys:
+            conn.execute(
+                """UPDATE session_status SET status = 'Queued', session_id = NULL,
+                   log_preview = 'Interrupted. Waiting to run again...', updated_at = ?, version = ?
+                   WHERE key = ?""",
+                (time.time(), version, key)
+            )
+            version += 1
+    return len(keys)
+
+def prune(max_age_seconds):
+    """
+    Turns finished sessions not updated for `max_age_seconds` into tombstones, each with a new version,
+    and deletes tombstones older than TOMBSTONE_SECONDS. Returns how many sessions were pruned.
+    """
+    _ensure_schema()
+    placeholders = ', '.join('?' * len(FINAL_STATUSES))
+    now = time.time()
+    with db.transaction() as conn:
+        version = _next_version(conn)
+        keys = [row['key'] for row in conn.execute(
+            f"SELECT key FROM session_status WHERE deleted = 0 AND status IN ({placeholders}) AND updated_at < ?",
+            (*FINAL_STATUSES, now - max_age_seconds)
+        )]
+        for key in keys:
+            conn.execute(
+                "UPDATE session_status SET deleted = 1, updated_at = ?, version = ? WHERE key = ?", (now, version, key)
+            )
+            version += 1
+        # The newest row is kept so the version counter never goes back.
+        conn.execute(
+            """DELETE FROM session_status WHERE deleted = 1 AND updated_at < ?
+               AND version < (SELECT MAX(version) FROM session_status)""",
+            (now - TOMBSTONE_SECONDS,)
+        )
+    if keys:
+        with _changed:
+            _changed.notify_all()
+    return len(keys)
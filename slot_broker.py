@@ -0,0 +1,157 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+import config
+import db
+
+# --- Cross-Process Session Slot Broker ---
+# Browser session slots are leased from the shared state database instead of a per-process
+# semaphore, so MAX_CONCURRENT_SESSIONS holds for every gunicorn worker and the Telegram bot together.
+# Leases are renewed by a heartbeat thread while held and expire if their owner dies.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_slots (
+    slot        INTEGER PRIMARY KEY,
+    lease_id    TEXT NOT NULL UNIQUE,
+    holder      TEXT NOT NULL,
+    pid         INTEGER NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at  REAL NOT NULL
+);
+"""
+
+# Leases held by this process, renewed by the heartbeat thread: { lease_id: SlotLease }
+_held_leases = {}
+_held_lock = threading.Lock()
+_heartbeat_thread = None
+
+class SlotLease:
+    """A leased browser session slot. Release it (or use it as a context manager) when done."""
+
+    def __init__(self, lease_id, slot, holder):
+        self.lease_id = lease_id
+        self.slot = slot
+        self.holder = holder
+
+    def release(self):
+        release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+def _pid_alive(pid):
+    """Checks whether a process with the given pid still exists in this container."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _reap_stale_leases(conn, now):
+    """Frees slots whose lease expired or whose owning process has exited."""
+    conn.execute("DELETE FROM session_slots WHERE expires_at < ?", (now,))
+    for row in conn.execute("SELECT DISTINCT pid FROM session_slots").fetchall():
+        if not _pid_alive(row['pid']):
+            logging.warning(f"Releasing session slots held by dead process {row['pid']}.")
+            conn.execute("DELETE FROM session_slots WHERE pid = ?", (row['pid'],))
+
+def _try_acquire(holder):
+    """Makes a single attempt to lease a free slot. Returns a SlotLease or None."""
+    now = time.time()
+    with db.transaction() as conn:
+        _reap_stale_leases(conn, now)
+        taken = {row['slot'] for row in conn.execute("SELECT slot FROM session_slots")}
+        free_slots = [s for s in range(config.MAX_CONCURRENT_SESSIONS) if s not in taken]
+        if not free_slots:
+            return None
+        lease = SlotLease(uuid.uuid4().hex, free_slots[0], holder)
+        conn.execute(
+            "INSERT INTO session_slots (slot, lease_id, holder, pid, acquired_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (lease.slot, lease.lease_id, holder, os.getpid(), now, now + config.SESSION_LEASE_SECONDS)
+        )
+    return lease
+
+def acquire(holder, timeout=None, poll_interval=0.5):
+    """
+    Blocks until a session slot is available and returns its SlotLease.
+    Returns None if `timeout` seconds pass without a free slot.
+    """
+    db.ensure_schema('slot_broker', _SCHEMA)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        lease = _try_acquire(holder)
+        if lease:
+            with _held_lock:
+                _held_leases[lease.lease_id] = lease
+            _ensure_heartbeat()
+            return lease
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        time.sleep(poll_interval)
+
+def release(lease):
+    """Returns a leased slot to the pool."""
+    with _held_lock:
+        _held_leases.pop(lease.lease_id, None)
+    try:
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM session_slots WHERE lease_id = ?", (lease.lease_id,))
+    except Exception as e:
+        # The lease will expire on its own if we cannot delete it now.
+        logging.error(f"Could not release session slot {lease.slot} for {lease.holder}: {e}")
+
+@contextmanager
+def session_slot(holder, timeout=None):
+    """Context manager that holds a session slot for the duration of the block."""
+    lease = acquire(holder, timeout=timeout)
+    if lease is None:
+        raise TimeoutError(f"No session slot became available for {holder} within {timeout} seconds.")
+    try:
+        yield lease
+    finally:
+        release(lease)
+
+def active_leases():
+    """Returns the currently held leases across all processes, for monitoring."""
+    db.ensure_schema('slot_broker', _SCHEMA)
+    rows = db.get_connection().execute(
+        "SELECT slot, holder, pid, acquired_at, expires_at FROM session_slots WHERE expires_at >= ? ORDER BY slot",
+        (time.time(),)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def _heartbeat_loop():
+    """Periodically extends the expiry of every lease held by this process."""
+    interval = max(1, config.SESSION_LEASE_SECONDS // 3)
+    while True:
+        time.sleep(interval)
+        with _held_lock:
+            lease_ids = list(_held_leases)
+        if not lease_ids:
+            continue
+        try:
+            with db.transaction() as conn:
+                expires_at = time.time() + config.SESSION_LEASE_SECONDS
+                conn.executemany(
+                    "UPDATE session_slots SET expires_at = ? WHERE lease_id = ?",
+                    [(expires_at, lease_id) for lease_id in lease_ids]
+                )
+        except Exception as e:
+            logging.error(f"Could not renew session slot leases: {e}")
+
+def _ensure_heartbeat():
+    global _heartbeat_thread
+    with _held_lock:
+        if _heartbeat_thread is None or not _heartbeat_thread.is_alive():
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name="slot-heartbeat")
+            _heartbeat_thread.daemon = True
+            _heartbeat_thread.start()
@@ -13,6 +13,80 @@ document.addEventListener('DOMContentLoaded', () => {
     const uidsRaw = document.getElementById('uids-raw');
     const couponsRaw = document.getElementById('coupons-raw');
 
+    // Lists
+    const uidList = document.getElementById('uid-list');
+    const couponList = document.getElementById('coupon-list');
+
+    // --- List Loading ---
+    // The lists come from /api/uids and /api/coupons. The browser revalidates them with their ETag,
+    // so an unchanged list costs a 304 instead of a re-rendered page.
+
+    function createListItem(id, name, value, text, checked, deleteClass, deleteData) {
+        const item = document.createElement('div');
+        item.className = 'list-item';
+        const checkbox = document.createElement('input');
+        checkbox.type = 'checkbox';
+        checkbox.id = id;
+        checkbox.name = name;
+        checkbox.value = value;
+        checkbox.checked = checked;
+        const label = document.createElement('label');
+        label.htmlFor = id;
+        label.textContent = text;
+        const deleteBtn = document.createElement('button');
+        deleteBtn.className = `delete-btn ${deleteClass}`;
+        Object.assign(deleteBtn.dataset, deleteData);
+        deleteBtn.textContent = 'Delete';
+        item.append(checkbox, label, deleteBtn);
+        return item;
+    }
+
+    function checkedValues(name) {
+        return new Set(Array.from(document.querySelectorAll(`input[name="${name}"]:checked`)).map(cb => cb.value));
+    }
+
+    function loadUids() {
+        return fetch('/api/uids', { cache: 'no-cache' })
+            .then(response => response.json())
+            .then(data => {
+                const checked = checkedValues('uids');
+                uidList.replaceChildren(...data.uids.map(item => createListItem(
+                    item.id, 'uids', item.id,
+                    item.comment ? `${item.uid} (${item.comment})` : item.uid,
+                    checked.has(item.id), 'delete-uid-btn', { uid: item.uid }
+                )));
+                uidsRaw.value = data.raw;
+            })
+            .catch(error => {
+                console.error('Error loading UIDs:', error);
+                uidList.innerHTML = '<p>Error loading UIDs.</p>';
+            });
+    }
+
+    // Coupons start out selected; a reload keeps the user's choices for coupons already shown.
+    let shownCoupons = new Set();
+
+    function loadCoupons() {
+        return fetch('/api/coupons', { cache: 'no-cache' })
+            .then(response => response.json())
+            .then(data => {
+                const checked = checkedValues('coupons');
+                couponList.replaceChildren(...data.coupons.map((coupon, i) => createListItem(
+                    `coupon-${i + 1}`, 'coupons', coupon, coupon,
+                    !shownCoupons.has(coupon) || checked.has(coupon), 'delete-coupon-btn', { couponName: coupon }
+                )));
+                shownCoupons = new Set(data.coupons);
+                couponsRaw.value = data.raw;
+            })
+            .catch(error => {
+                console.error('Error loading coupons:', error);
+                couponList.innerHTML = '<p>Error loading coupons.</p>';
+            });
+    }
+
+    loadUids();
+    loadCoupons();
+
     // Generic function to handle run logic
     const handleRun = (url, force = false) => {
         const selectedUids = Array.from(document.querySelectorAll('input[name="uids"]:checked'))
@@ -72,7 +146,7 @@ document.addEventListener('DOMContentLoaded', () => {
             .then(data => {
                 alert(data.message);
                 if(data.status === 'success') {
-                    window.location.reload();
+                    loadUids();
                 }
             });
         });
@@ -90,7 +164,7 @@ document.addEventListener('DOMContentLoaded', () => {
             .then(data => {
                 alert(data.message);
                 if(data.status === 'success') {
-                    window.location.reload();
+                    loadCoupons();
                 }
             });
         });
@@ -124,55 +198,55 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Deletion Logic ---
 
+    // The buttons are re-created with the lists, so clicks are handled on the list containers.
+
     // Delete Coupon
-    const deleteCouponBtns = document.querySelectorAll('.delete-coupon-btn');
-    deleteCouponBtns.forEach(btn => {
-        btn.addEventListener('click', (e) => {
-            const couponName = e.target.dataset.couponName;
-            if (confirm(`Are you sure you want to delete the coupon "${couponName}"?`)) {
-                fetch('/delete_coupon', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ coupon_name: couponName })
-                })
-                .then(response => response.json())
-                .then(data => {
-                    alert(data.message);
-                    if (data.status === 'success') {
-                        window.location.reload();
-                    }
-                })
-                .catch(error => {
-                    console.error('Error:', error);
-                    alert('An error occurred while deleting the coupon.');
-                });
-            }
-        });
+    couponList.addEventListener('click', (e) => {
+        const btn = e.target.closest('.delete-coupon-btn');
+        if (!btn) return;
+        const couponName = btn.dataset.couponName;
+        if (confirm(`Are you sure you want to delete the coupon "${couponName}"?`)) {
+            fetch('/delete_coupon', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ coupon_name: couponName })
+            })
+            .then(response => response.json())
+            .then(data => {
+                alert(data.message);
+                if (data.status === 'success') {
+                    loadCoupons();
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                alert('An error occurred while deleting the coupon.');
+            });
+        }
     });
 
     // Delete UID
-    const deleteUidBtns = document.querySelectorAll('.delete-uid-btn');
-    deleteUidBtns.forEach(btn => {
-        btn.addEventListener('click', (e) => {
-            const uid = e.target.dataset.uid;
-            if (confirm(`Are you sure you want to delete the UID "${uid}"?`)) {
-                fetch('/delete_uid', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ uid: uid })
-                })
-                .then(response => response.json())
-                .then(data => {
-                    alert(data.message);
-                    if (data.status === 'success') {
-                        window.location.reload();
-                    }
-                })
-                .catch(error => {
-                    console.error('Error:', error);
-                    alert('An error occurred while deleting the UID.');
-                });
-            }
-        });
+    uidList.addEventListener('click', (e) => {
+        const btn = e.target.closest('.delete-uid-btn');
+        if (!btn) return;
+        const uid = btn.dataset.uid;
+        if (confirm(`Are you sure you want to delete the UID "${uid}"?`)) {
+            fetch('/delete_uid', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ uid: uid })
+            })
+            .then(response => response.json())
+            .then(data => {
+                alert(data.message);
+                if (data.status === 'success') {
+                    loadUids();
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                alert('An error occurred while deleting the UID.');
+            });
+        }
     });
 });
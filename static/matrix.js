@@ -0,0 +1,60 @@
+document.addEventListener('DOMContentLoaded', () => {
+    const couponsBody = document.getElementById('matrix-coupons');
+    const uidsBody = document.getElementById('matrix-uids');
+    const gapsOnly = document.getElementById('matrix-gaps-only');
+    let matrix = null;
+    let lastEtag = null;
+
+    function cell(row, text) {
+        const td = document.createElement('td');
+        td.textContent = text;
+        row.appendChild(td);
+        return td;
+    }
+
+    function render() {
+        if (!matrix) return;
+        couponsBody.innerHTML = '';
+        matrix.coupons.forEach(c => {
+            const row = document.createElement('tr');
+            cell(row, c.coupon);
+            cell(row, c.success);
+            cell(row, c.used);
+            cell(row, c.failed);
+            cell(row, c.pending).className = c.pending ? 'matrix-pending' : '';
+            couponsBody.appendChild(row);
+        });
+
+        uidsBody.innerHTML = '';
+        matrix.uids
+            .filter(u => !gapsOnly.checked || u.missing.length > 0)
+            .forEach(u => {
+                const row = document.createElement('tr');
+                cell(row, u.uid);
+                cell(row, u.comment);
+                cell(row, u.missing.length ? u.missing.join(', ') : '-');
+                uidsBody.appendChild(row);
+            });
+    }
+
+    function fetchMatrix() {
+        // The browser revalidates with the ETag; an unchanged matrix is answered with 304.
+        fetch('/api/matrix')
+            .then(response => {
+                const etag = response.headers.get('ETag');
+                if (etag && etag === lastEtag) return null;
+                lastEtag = etag;
+                return response.json();
+            })
+            .then(data => {
+                if (!data) return;
+                matrix = data;
+                render();
+            })
+            .catch(error => console.error('Error fetching matrix:', error));
+    }
+
+    gapsOnly.addEventListener('change', render);
+    fetchMatrix();
+    setInterval(fetchMatrix, 10000);
+});
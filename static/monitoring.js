@@ -16,6 +16,9 @@ document.addEventListener('DOMContentLoaded', function() {
             case 'Queued':
                 statusBadge = '<span class="badge bg-secondary">Queued</span>';
                 break;
+            case 'Parked':
+                statusBadge = '<span class="badge bg-warning">Parked</span>';
+                break;
             case 'Finished':
                 statusBadge = '<span class="badge bg-success">Finished</span>';
                 break;
@@ -30,6 +33,10 @@ document.addEventListener('DOMContentLoaded', function() {
             ? `<a href="${seleniumHubUrl}/ui/#/session/${session.session_id}" target="_blank" class="btn btn-sm btn-outline-primary float-end">Go to Session</a>`
             : '';
 
+        const progress = session.coupons_total
+            ? `<p class="card-text mb-1"><strong>Coupons:</strong> ${session.coupons_done || 0}/${session.coupons_total}</p>`
+            : '';
+
         card.innerHTML = `
             <div class="card h-100">
                 <div class="card-header d-flex justify-content-between align-items-center">
@@ -38,6 +45,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 </div>
                 <div class="card-body">
                     <p class="card-text mb-1"><strong>Status:</strong> ${statusBadge}</p>
+                    ${progress}
                     <p class="card-text text-muted" style="font-size: 0.8rem;">${session.log_preview}</p>
                 </div>
             </div>
@@ -45,37 +53,67 @@ document.addEventListener('DOMContentLoaded', function() {
         return card;
     }
 
-    async function fetchAndUpdateStatus() {
-        try {
-            const response = await fetch('/status');
-            if (!response.ok) {
-                sessionsContainer.innerHTML = '<p class="text-center text-danger">Error fetching status.</p>';
-                return;
-            }
-            const data = await response.json();
-            
-            const activeSessions = Object.entries(data).filter(([key, session]) => {
-                return session.status !== 'Finished' && session.status !== 'Error';
-            });
+    // Latest known status of every session, keyed by base filename.
+    const sessions = {};
 
-            sessionsContainer.innerHTML = '';
+    function isActive(session) {
+        return session.status !== 'Finished' && session.status !== 'Error';
+    }
 
-            if (activeSessions.length === 0) {
-                sessionsContainer.innerHTML = '<p class="text-center text-muted">No active sessions.</p>';
-                return;
-            }
+    function showPlaceholder() {
+        if (!Object.values(sessions).some(isActive)) {
+            sessionsContainer.innerHTML = '<p class="text-center text-muted">No active sessions.</p>';
+        }
+    }
+
+    function updateCards(changed) {
+        const placeholder = sessionsContainer.querySelector('p');
+        if (placeholder) placeholder.remove();
 
-            for (const [key, session] of activeSessions) {
-                const card = createSessionCard(key, session);
+        for (const [key, session] of Object.entries(changed)) {
+            const existing = document.getElementById(`session-card-${key}`);
+            // null: the session was pruned from the server's status store.
+            if (session === null) {
+                delete sessions[key];
+                if (existing) existing.remove();
+                continue;
+            }
+            sessions[key] = session;
+            if (!isActive(session)) {
+                if (existing) existing.remove();
+                continue;
+            }
+            const card = createSessionCard(key, session);
+            if (existing) {
+                existing.replaceWith(card);
+            } else {
                 sessionsContainer.appendChild(card);
             }
+        }
+        showPlaceholder();
+    }
+
+    function connectStatusStream() {
+        // The server sends every session on connect, then only the sessions that changed.
+        const eventSource = new EventSource('/status/stream');
 
-        } catch (error) {
-            console.error('Error fetching status:', error);
+        eventSource.addEventListener('snapshot', (event) => {
+            for (const key of Object.keys(sessions)) delete sessions[key];
+            sessionsContainer.innerHTML = '';
+            updateCards(JSON.parse(event.data));
+        });
+
+        eventSource.onmessage = (event) => {
+            updateCards(JSON.parse(event.data));
+        };
+
+        eventSource.onerror = (err) => {
+            console.error('Status stream failed:', err);
+            eventSource.close();
             sessionsContainer.innerHTML = '<p class="text-center text-danger">Could not connect to server.</p>';
-        }
+            setTimeout(connectStatusStream, 5000);
+        };
     }
 
-    fetchAndUpdateStatus();
-    setInterval(fetchAndUpdateStatus, 2000);
-});
\ No newline at end of file
+    connectStatusStream();
+});
@@ -3,13 +3,63 @@ document.addEventListener('DOMContentLoaded', () => {
     const couponLogFilesList = document.getElementById('coupon-log-files-list');
     const logFilename = document.getElementById('log-filename');
     const logContent = document.getElementById('log-content');
+    const loadOlderBtn = document.getElementById('load-older-btn');
+    const downloadLink = document.getElementById('log-download-link');
+    const screenshotsBox = document.getElementById('log-screenshots');
+
+    // Lines fetched per page; older pages are loaded on demand.
+    const PAGE_LINES = 500;
+    // The log being shown and where its first loaded line starts.
+    let current = null;
+
+    function logQuery(type, file) {
+        return `type=${encodeURIComponent(type)}&file=${encodeURIComponent(file)}`;
+    }
+
+    // Shows the thumbnail of a UID's latest screenshot and links to its recent frames.
+    function fetchScreenshots(type, file) {
+        screenshotsBox.replaceChildren();
+        if (type !== 'log' || !file.endsWith('.log')) return;
+        const shown = current;
+        fetch(`/api/screenshots/${encodeURIComponent(file.slice(0, -'.log'.length))}`)
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (!data || shown !== current || !data.latest) return;
+                const link = document.createElement('a');
+                link.href = data.latest;
+                link.target = '_blank';
+                const image = document.createElement('img');
+                image.src = data.thumbnail || data.latest;
+                image.alt = 'Latest screenshot';
+                image.loading = 'lazy';
+                link.appendChild(image);
+                screenshotsBox.appendChild(link);
+                data.history.forEach(url => {
+                    const frame = document.createElement('a');
+                    frame.href = url;
+                    frame.target = '_blank';
+                    frame.textContent = url.split('/').pop().replace('.png', '');
+                    screenshotsBox.appendChild(frame);
+                });
+            })
+            .catch(error => console.error('Error fetching screenshots:', error));
+    }
 
     function fetchLogContent(type, file) {
-        fetch(`/api/log-content?type=${type}&file=${file}`)
+        current = { type, file, start: 0 };
+        fetchScreenshots(type, file);
+        downloadLink.href = `/api/log-download?${logQuery(type, file)}`;
+        downloadLink.style.display = '';
+        loadOlderBtn.style.display = 'none';
+        fetch(`/api/log-content?${logQuery(type, file)}&tail=${PAGE_LINES}`)
             .then(response => response.json())
             .then(data => {
                 logFilename.textContent = data.filename;
                 logContent.textContent = data.content;
+                current.start = data.start;
+                loadOlderBtn.style.display = data.has_more_before ? '' : 'none';
+                // Show the newest lines first, as a tail would.
+                logContent.scrollTop = logContent.scrollHeight;
             })
             .catch(error => {
                 console.error('Error fetching log content:', error);
@@ -17,6 +67,57 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
 
+    function fetchOlderLines() {
+        const shown = current;
+        if (!shown) return;
+        loadOlderBtn.disabled = true;
+        fetch(`/api/log-content?${logQuery(shown.type, shown.file)}&tail=${PAGE_LINES}&before=${shown.start}`)
+            .then(response => response.json())
+            .then(data => {
+                if (shown !== current) return; // Another log was selected meanwhile.
+                const previousHeight = logContent.scrollHeight;
+                logContent.textContent = data.lines.join('\n') + '\n' + logContent.textContent;
+                // Keep the lines that were on screen in place.
+                logContent.scrollTop += logContent.scrollHeight - previousHeight;
+                shown.start = data.start;
+                loadOlderBtn.style.display = data.has_more_before ? '' : 'none';
+            })
+            .catch(error => console.error('Error fetching older log lines:', error))
+            .finally(() => { loadOlderBtn.disabled = false; });
+    }
+
+    loadOlderBtn.addEventListener('click', fetchOlderLines);
+
+    function searchLogs(e) {
+        e.preventDefault();
+        const params = new URLSearchParams({ limit: 500 });
+        const fields = { q: 'search-text', uid: 'search-uid', result_class: 'search-result', last: 'search-last' };
+        Object.entries(fields).forEach(([name, id]) => {
+            const value = document.getElementById(id).value.trim();
+            if (value) params.set(name, value);
+        });
+        current = null;
+        screenshotsBox.replaceChildren();
+        document.querySelectorAll('.log-list a.active').forEach(el => el.classList.remove('active'));
+        loadOlderBtn.style.display = 'none';
+        downloadLink.style.display = 'none';
+        fetch(`/api/search?${params}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'error') throw new Error(data.message);
+                logFilename.textContent = `Search: ${data.count} lines (${data.took_ms} ms)`;
+                logContent.textContent = data.results
+                    .map(r => `${r.time} [${r.level}] ${r.base_filename} - ${r.message}`)
+                    .join('\n') || 'No matching lines.';
+            })
+            .catch(error => {
+                console.error('Error searching logs:', error);
+                logContent.textContent = 'Error searching logs.';
+            });
+    }
+
+    document.getElementById('log-search-form').addEventListener('submit', searchLogs);
+
     function populateLogList(listElement, files, type) {
         if (!files || files.length === 0) {
             listElement.innerHTML = '<li>No logs found.</li>';
@@ -1,4 +1,4 @@
-const CACHE_NAME = 'th-applier-cache-v1';
+const CACHE_NAME = 'th-applier-cache-v7';
 const urlsToCache = [
   '/',
   '/static/style.css',
@@ -6,6 +6,7 @@ const urlsToCache = [
   '/static/monitoring.js',
   '/static/logs.js',
   '/static/old_logs.js',
+  '/static/matrix.js',
   '/static/manifest.json',
   '/static/icon-192x192.png',
   '/static/icon-512x512.png'
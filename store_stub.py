@@ -0,0 +1,97 @@
+import sys
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# --- Local Store Stub ---
+# A stand-in for the store's login and redeem endpoints, for trying the `http` backend without
+# touching the real store:
+#
+#   python store_stub.py 8099
+#   STORE_LOGIN_URL=http://localhost:8099/login STORE_REDEEM_URL=http://localhost:8099/redeem ...
+#
+# Any UID logs in, except ones starting with "0", which are rejected. The answer to a redeem call is
+# picked by the gift code's prefix (see ANSWERS); any other code succeeds once and is "Already Used"
+# after that. Every request is logged, so a code sent twice shows up twice.
+
+# Redeem answers by code prefix: (HTTP status, body). A str body is sent as-is (not JSON).
+ANSWERS = {
+    'USED': (200, {'code': 1, 'msg': 'Already Used'}),
+    'LIMIT': (200, {'code': 1, 'msg': 'Personal redemption limit reached'}),
+    'EXPIRED': (200, {'code': 1, 'msg': 'This gift code has expired'}),
+    'BUSY': (200, {'code': 1, 'msg': 'Too many requests. Please try again later.'}),
+    'NOMSG': (200, {'code': 1}),
+    'BROKEN': (200, '<html><body>Maintenance</body></html>'),
+    'GATEWAY': (504, '<html><body>504 Gateway Time-out</body></html>'),
+}
+
+TOKEN_PREFIX = 'stub-'
+
+_redeemed = set()
+_redeemed_lock = threading.Lock()
+
+def redeem_answer(uid, code):
+    """Returns (HTTP status, body) for `uid` redeeming `code`."""
+    for prefix, answer in ANSWERS.items():
+        if code.upper().startswith(prefix):
+            return answer
+    with _redeemed_lock:
+        if (uid, code) in _redeemed:
+            return ANSWERS['USED']
+        _redeemed.add((uid, code))
+    return 200, {'code': 0, 'msg': 'Success'}
+
+class StubHandler(BaseHTTPRequestHandler):
+    def _send(self, status, body, cookie=None):
+        data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html' if isinstance(body, str) else 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if cookie:
+            self.send_header('Set-Cookie', cookie)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        except ValueError:
+            self._send(400, {'code': 400, 'msg': 'Bad request'})
+            return
+
+        if self.path.rstrip('/').endswith('/login'):
+            uid = str(payload.get(config.STORE_UID_FIELD, ''))
+            if not uid or uid.startswith('0'):
+                self._send(200, {'code': 1, 'msg': 'Data does not exist'})
+            else:
+                self._send(200, {'code': 0, 'data': {'token': TOKEN_PREFIX + uid}}, cookie=f"session={uid}; Path=/")
+        elif self.path.rstrip('/').endswith('/redeem'):
+            auth = self.headers.get('Authorization', '')
+            if not auth.startswith(f"Bearer {TOKEN_PREFIX}"):
+                self._send(401, {'code': 401, 'msg': 'Please log in first'})
+                return
+            uid = auth[len(f"Bearer {TOKEN_PREFIX}"):]
+            self._send(*redeem_answer(uid, str(payload.get(config.STORE_CODE_FIELD, ''))))
+        else:
+            self._send(404, {'code': 404, 'msg': 'Not found'})
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+def serve(port=8099, host='127.0.0.1'):
+    """Runs the stub until interrupted."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    logging.info(f"Store stub listening on http://{host}:{port} (/login, /redeem)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] - %(message)s')
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8099)
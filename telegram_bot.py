@@ -12,7 +12,10 @@ from telegram.ext import (
 
 import config
 import data_manager
-from app import running_threads, thread_lock, worker_wrapper, session_semaphore
+import ledger
+import log_reader
+import session_status
+from app import enqueue_run
 
 # --- Conversation States ---
 (
@@ -32,7 +35,12 @@ from app import running_threads, thread_lock, worker_wrapper, session_semaphore
     CHOOSING_LOG_FILE,
     CHOOSING_COUPON_LOG_FILE,
     CHOOSING_MONITOR_SESSION,
-) = range(16)
+    PAGING_LOG,
+) = range(17)
+
+# Lines read for one log page; the oldest are dropped until the page fits into one message.
+LOG_PAGE_LINES = 100
+MESSAGE_LIMIT = 4096
 
 # --- Main Menu ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -264,40 +272,22 @@ async def select_coupons_for_run(update: Update, context: ContextTypes.DEFAULT_T
 
         selected_uids = context.user_data.pop('selected_uids_for_run')
         
-        # This part is synchronous but should be quick
-        uids_map = {f"{u['uid']}_{u['comment']}": u for u in data_manager.get_uids_list()}
-        started_count = 0
-        with thread_lock:
-            for base_filename in selected_uids:
-                if base_filename in uids_map and base_filename not in running_threads:
-                    uid_info = uids_map[base_filename]
-                    running_threads[base_filename] = {
-                        'status': 'Queued', 'log_preview': 'Waiting for session...',
-                        'display_name': f"{uid_info['uid']} ({uid_info['comment']})", 'session_id': None
-                    }
-                    # Offload the actual work to a thread
-                    context.application.create_task(
-                        run_worker_in_thread(uid_info['uid'], uid_info['comment'], selected_coupons, base_filename)
-                    )
-                    started_count += 1
+        # Queue the jobs; the scheduler (in whichever process leads) starts them as slots free up.
+        result = enqueue_run(selected_uids, selected_coupons)
         
-        await update.message.reply_text(f"Started automation for {started_count} UIDs.", reply_markup=ReplyKeyboardRemove())
+        await update.message.reply_text(
+            f"Queued automation for {result['queued']} UIDs ({result['merged']} merged into waiting jobs, {result['running']} already running).",
+            reply_markup=ReplyKeyboardRemove()
+        )
         return await start(update, context)
 
     except ValueError:
         await update.message.reply_text("Invalid format. Please enter numbers separated by commas.")
         return SELECTING_COUPONS_FOR_RUN
 
-async def run_worker_in_thread(uid, comment, coupons, base_filename):
-    """Helper to run the blocking worker_wrapper in a separate thread."""
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(
-        None, worker_wrapper, uid, comment, coupons, base_filename
-    )
-
 # --- Log Viewing ---
 async def log_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    reply_keyboard = [["1. View App Logs"], ["2. View Coupon Logs"], ["Back to Main Menu"]]
+    reply_keyboard = [["1. View App Logs"], ["2. View Coupon Logs"], ["3. Reset Failed Coupons"], ["Back to Main Menu"]]
     await update.message.reply_text(
         "Log Viewer:",
         reply_markup=ReplyKeyboardMarkup(reply_keyboard, one_time_keyboard=True),
@@ -315,26 +305,57 @@ async def choose_log_file_start(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.reply_text(message, reply_markup=ReplyKeyboardRemove())
     return CHOOSING_LOG_FILE
 
+def _read_log_page(page, count):
+    """Returns (lines, start, end) for the `count` lines of a log that end at page['before']."""
+    if page['type'] == 'log':
+        return log_reader.tail(os.path.join('logs', page['file']), count, page['before'])
+    end = page['before'] if page['before'] is not None else ledger.count_results(page['file'])
+    start = max(0, end - count)
+    return ledger.export_lines(page['file'], start, end - start), start, end
+
+async def send_log_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Sends the newest lines of the chosen log that were not shown yet, as one message."""
+    page = context.user_data['log_page']
+    try:
+        lines, start, end = _read_log_page(page, LOG_PAGE_LINES)
+        page['before'] = end
+        kept = len(lines)
+        while kept > 1 and len("\n".join(lines[-kept:])) > MESSAGE_LIMIT:
+            kept -= 1
+        if kept < len(lines):
+            lines, start, end = _read_log_page(page, kept)
+    except FileNotFoundError:
+        # The log was removed, or rotated away between two pages.
+        context.user_data.pop('log_page', None)
+        await update.message.reply_text("File not found or empty.")
+        return await log_menu(update, context)
+    page['before'] = start
+
+    content = "\n".join(lines)[-MESSAGE_LIMIT:] or "File not found or empty."
+    reply_keyboard = [["Older Lines"], ["Back to Log Menu"]] if start > 0 else [["Back to Log Menu"]]
+    await update.message.reply_text(content, reply_markup=ReplyKeyboardMarkup(reply_keyboard, one_time_keyboard=True))
+    return PAGING_LOG
+
+async def back_to_log_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data.pop('log_page', None)
+    return await log_menu(update, context)
+
 async def show_log_content(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         choice = int(update.message.text) - 1
         log_files = context.user_data.pop('log_files')
         if 0 <= choice < len(log_files):
-            filepath = os.path.join('logs', log_files[choice])
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            # Split content if too long for a single message
-            for i in range(0, len(content), 4096):
-                await update.message.reply_text(content[i:i+4096])
+            context.user_data['log_page'] = {'type': 'log', 'file': log_files[choice], 'before': None}
+            return await send_log_page(update, context)
         else:
             await update.message.reply_text("Invalid choice.")
     except (ValueError, IndexError):
         await update.message.reply_text("Invalid input.")
-    
+
     return await log_menu(update, context)
 
 async def choose_coupon_log_file_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    log_files = sorted([f for f in os.listdir('coupon_logs') if f.endswith('.txt')], reverse=True)
+    log_files = ledger.log_names()
     if not log_files:
         await update.message.reply_text("No coupon logs found.")
         return await log_menu(update, context)
@@ -349,11 +370,8 @@ async def show_coupon_log_content(update: Update, context: ContextTypes.DEFAULT_
         choice = int(update.message.text) - 1
         log_files = context.user_data.pop('coupon_log_files')
         if 0 <= choice < len(log_files):
-            filepath = os.path.join('coupon_logs', log_files[choice])
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            for i in range(0, len(content), 4096):
-                await update.message.reply_text(content[i:i+4096])
+            context.user_data['log_page'] = {'type': 'coupon', 'file': log_files[choice][:-len('.txt')], 'before': None}
+            return await send_log_page(update, context)
         else:
             await update.message.reply_text("Invalid choice.")
     except (ValueError, IndexError):
@@ -361,11 +379,19 @@ async def show_coupon_log_content(update: Update, context: ContextTypes.DEFAULT_
 
     return await log_menu(update, context)
 
+async def compact_coupon_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Drops transient failures from the redemption ledger so those coupons are retried."""
+    result = ledger.compact()
+    await update.message.reply_text(
+        f"Removed {result['ledger_removed']} failed or rate-limited results; {result['ledger_remaining']} remain."
+    )
+    return await log_menu(update, context)
+
 
 # --- Monitoring ---
 async def monitoring_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    with thread_lock:
-        active_sessions = {k: v for k, v in running_threads.items() if v.get('session_id')}
+    _, sessions = session_status.collect()
+    active_sessions = {k: v for k, v in sessions.items() if v.get('session_id')}
     
     if not active_sessions:
         await update.message.reply_text("No active Selenium sessions.", reply_markup=ReplyKeyboardRemove())
@@ -451,10 +477,15 @@ def main() -> None:
             CHOOSING_LOG_TYPE: [
                 MessageHandler(filters.Regex("^1\\. View App Logs$"), choose_log_file_start),
                 MessageHandler(filters.Regex("^2\\. View Coupon Logs$"), choose_coupon_log_file_start),
+                MessageHandler(filters.Regex("^3\\. Reset Failed Coupons$"), compact_coupon_logs),
                 MessageHandler(filters.Regex("^Back to Main Menu$"), back_to_main_menu),
             ],
             CHOOSING_LOG_FILE: [MessageHandler(filters.TEXT & ~filters.COMMAND, show_log_content)],
             CHOOSING_COUPON_LOG_FILE: [MessageHandler(filters.TEXT & ~filters.COMMAND, show_coupon_log_content)],
+            PAGING_LOG: [
+                MessageHandler(filters.Regex("^Older Lines$"), send_log_page),
+                MessageHandler(filters.Regex("^Back to Log Menu$"), back_to_log_menu),
+            ],
             # Monitoring States
             CHOOSING_MONITOR_SESSION: [MessageHandler(filters.TEXT & ~filters.COMMAND, show_monitoring_link)],
         },
@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+
+import bulk_io
+
+@pytest.fixture(params=[1, 2, 3, 7, 64 * 1024], ids=lambda size: f"chunk={size}")
+def chunk_size(request, monkeypatch):
+    # Tiny chunks cut numbers, strings and literals in the middle.
+    monkeypatch.setattr(bulk_io, '_JSON_CHUNK_SIZE', request.param)
+    return request.param
+
+def parse(text):
+    return list(bulk_io._iter_json_array(io.StringIO(text)))
+
+VALUES = [
+    [],
+    [1, 22, 333, -4.5e3],
+    ["CODE1", "쿠폰코드", "with \"quotes\" and , commas ]"],
+    [{"uid": "123", "comment": "main"}, {"coupon": "ABC"}],
+    [["123", "alt"], [], {}],
+    [True, False, None, 0],
+]
+
+@pytest.mark.parametrize("values", VALUES, ids=lambda v: json.dumps(v, ensure_ascii=False)[:30])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_streams_the_same_values_as_json_loads(chunk_size, values, indent):
+    assert parse(json.dumps(values, indent=indent, ensure_ascii=False)) == values
+
+@pytest.mark.parametrize("text, values", [
+    ("[12345, 6]", [12345, 6]),   # the first chunk ends inside 12345
+    ("[12.5, 6]", [12.5, 6]),     # ... right before the fraction
+    ("[12e3, 6]", [12e3, 6]),     # ... right before the exponent
+])
+def test_number_at_the_end_of_a_chunk_is_read_whole(monkeypatch, text, values):
+    monkeypatch.setattr(bulk_io, '_JSON_CHUNK_SIZE', 3)
+    assert parse(text) == values
+
+def test_surrounding_whitespace(chunk_size):
+    assert parse("  \n[ 1 ,\n 2 ]  \n") == [1, 2]
+
+def test_empty_upload_has_no_rows(chunk_size):
+    assert parse("") == []
+    assert parse("   \n") == []
+
+@pytest.mark.parametrize("text", ['{"uid": "1"}', '"123"', '1, 2'])
+def test_top_level_must_be_an_array(chunk_size, text):
+    with pytest.raises(ValueError, match="must be an array"):
+        parse(text)
+
+@pytest.mark.parametrize("text", ['[1, 2', '[{"uid": "1"}', '['])
+def test_unclosed_array(chunk_size, text):
+    with pytest.raises(ValueError, match="not closed"):
+        parse(text)
+
+@pytest.mark.parametrize("text", ['[1, {"uid": ]', '[nope]', '["unterminated]'])
+def test_invalid_element(chunk_size, text):
+    with pytest.raises(ValueError):
+        parse(text)
+
+def test_elements_before_an_error_are_yielded(chunk_size):
+    rows = bulk_io._iter_json_array(io.StringIO('[1, 2, oops]'))
+    assert next(rows) == 1
+    assert next(rows) == 2
+    with pytest.raises(ValueError):
+        next(rows)
+
+def test_iter_rows_numbers_json_elements():
+    stream = io.BytesIO('﻿[{"uid": "1"}, "2 #alt"]'.encode('utf-8'))
+    assert list(bulk_io.iter_rows(stream, 'json')) == [(1, {"uid": "1"}), (2, "2 #alt")]
@@ -0,0 +1,83 @@
+import pytest
+
+import classifier
+import coupon_cache
+from classifier import ResultCode
+
+CASES = [
+    # Written by the worker itself.
+    ("Success", ResultCode.SUCCESS),
+    ("Unknown Error (Fleeting)", ResultCode.FAILED),
+    ("Failed after multiple retries", ResultCode.FAILED),
+    ("  Failed after multiple retries  ", ResultCode.FAILED),
+    # "failed" next to a real store answer is classified by the answer.
+    ("Redemption failed: coupon already used", ResultCode.ALREADY_USED),
+    ("Failed: Personal redemption limit reached for this CDKey", ResultCode.LIMIT_REACHED),
+    ("Request failed, please try again later", ResultCode.RATE_LIMITED),
+    ("Failed", ResultCode.UNKNOWN),
+    ("Unknown Error", ResultCode.UNKNOWN),
+    # Store answers.
+    ("Already Used", ResultCode.ALREADY_USED),
+    ("Already Used (or Limit Reached)", ResultCode.ALREADY_USED),
+    ("Personal redemption limit reached for this CDKey", ResultCode.LIMIT_REACHED),
+    ("Data does not exist", ResultCode.INVALID),
+    ("Invalid code", ResultCode.INVALID),
+    ("This gift code has expired", ResultCode.EXPIRED),
+    ("The event has ended", ResultCode.EXPIRED),
+    ("Too many requests. Please try again later.", ResultCode.RATE_LIMITED),
+    ("Operation is too frequent", ResultCode.RATE_LIMITED),
+    ("Paused (Limit/Rate)", ResultCode.RATE_LIMITED),
+    # English phrases match whole words only.
+    ("invalid codes", ResultCode.UNKNOWN),
+    ("Available later this week", ResultCode.UNKNOWN),
+    # Korean phrases are stems and match inside longer words.
+    ("이미 사용된 쿠폰입니다", ResultCode.ALREADY_USED),
+    ("이 CDKey의 개인 교환 횟수 제한에 도달했습니다", ResultCode.LIMIT_REACHED),
+    ("데이터가 존재하지 않습니다", ResultCode.INVALID),
+    ("유효하지 않은 코드입니다", ResultCode.INVALID),
+    ("쿠폰이 만료되었습니다", ResultCode.EXPIRED),
+    ("이벤트가 종료되었습니다", ResultCode.EXPIRED),
+    ("빈번한 작업입니다", ResultCode.RATE_LIMITED),
+    ("잠시 후 다시 시도해 주세요", ResultCode.RATE_LIMITED),
+    ("횟수가 초과되었습니다", ResultCode.RATE_LIMITED),
+    # Nothing to classify.
+    ("", ResultCode.UNKNOWN),
+    (None, ResultCode.UNKNOWN),
+]
+
+# Messages about the account or session, not the coupon. They must never mark a coupon dead.
+ACCOUNT_MESSAGES = [
+    "invalid UID",
+    "Invalid UID, please check",
+    "Your session expired, please log in again",
+    "로그인 세션이 만료되었습니다",
+    "세션이 종료되었습니다",
+    "유효하지 않은 UID입니다",
+]
+
+@pytest.mark.parametrize("message, code", CASES)
+def test_classify(message, code):
+    assert classifier.classify(message) == code
+
+@pytest.mark.parametrize("message", ACCOUNT_MESSAGES)
+def test_account_messages_do_not_kill_coupons(message):
+    code = classifier.classify(message)
+    assert code not in (ResultCode.INVALID, ResultCode.EXPIRED)
+    assert coupon_cache.status_for(code) not in coupon_cache.DEAD_STATUSES
+
+def test_first_code_in_catalog_wins():
+    # "Already Used" comes after INVALID in the catalog.
+    assert classifier.classify("Invalid code or Already Used") == ResultCode.INVALID
+
+def test_extra_catalog_phrases(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text('{"rate_limited": ["please wait"], "FAILED": ["gateway timeout"]}', encoding='utf-8')
+    catalog = classifier.load_catalog(str(path))
+    pattern = classifier.compile_catalog(catalog)
+    names = {match.lastgroup for match in pattern.finditer("Please wait: gateway timeout")}
+    assert names == {ResultCode.RATE_LIMITED.name, ResultCode.FAILED.name}
+
+def test_broken_catalog_file_falls_back(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text('{"NOT_A_CODE": ["x"]}', encoding='utf-8')
+    assert classifier.load_catalog(str(path)).keys() == classifier.DEFAULT_CATALOG.keys()
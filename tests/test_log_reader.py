@@ -0,0 +1,81 @@
+import pytest
+
+import log_reader
+
+def write_lines(tmp_path, lines, trailing_newline=True):
+    path = tmp_path / "worker.log"
+    data = '\n'.join(lines) + ('\n' if trailing_newline and lines else '')
+    path.write_bytes(data.encode('utf-8'))
+    return str(path), data.encode('utf-8')
+
+@pytest.fixture(params=[4, 7, 64 * 1024], ids=lambda size: f"block={size}")
+def block_size(request, monkeypatch):
+    # Tiny blocks make lines cross block boundaries.
+    monkeypatch.setattr(log_reader, 'BLOCK_SIZE', request.param)
+    return request.param
+
+LINES = [f"line {n} " + "x" * (n % 5) for n in range(1, 21)]
+
+@pytest.mark.parametrize("count", [0, 1, 3, 19, 20, 25])
+def test_tail_returns_last_lines_and_their_byte_range(tmp_path, block_size, count):
+    path, data = write_lines(tmp_path, LINES)
+    lines, start, end = log_reader.tail(path, count)
+    expected = LINES[-count:] if count else []
+    assert lines == expected
+    assert end == len(data)
+    if expected:
+        # start is where the first returned line begins; the range holds exactly those lines.
+        assert data[start:end].decode('utf-8') == '\n'.join(expected) + '\n'
+    else:
+        assert start == end
+
+@pytest.mark.parametrize("count", [1, 4, 6])
+def test_paging_backwards_visits_every_line_once(tmp_path, block_size, count):
+    path, _ = write_lines(tmp_path, LINES)
+    seen = []
+    before = None
+    while True:
+        lines, start, _ = log_reader.tail(path, count, before=before)
+        if not lines:
+            break
+        seen = lines + seen
+        before = start
+    assert seen == LINES
+
+def test_tail_without_trailing_newline(tmp_path, block_size):
+    path, data = write_lines(tmp_path, LINES, trailing_newline=False)
+    lines, start, end = log_reader.tail(path, 2)
+    assert lines == LINES[-2:]
+    assert data[start:end].decode('utf-8') == '\n'.join(LINES[-2:])
+
+def test_tail_keeps_multibyte_characters_whole(tmp_path, block_size):
+    korean = ["쿠폰 사용 완료", "이미 사용된 쿠폰입니다", "빈번한 작업"]
+    path, data = write_lines(tmp_path, korean)
+    lines, start, end = log_reader.tail(path, 2)
+    assert lines == korean[-2:]
+    assert data[start:end].decode('utf-8') == '\n'.join(korean[-2:]) + '\n'
+
+def test_tail_of_empty_file(tmp_path, block_size):
+    path, _ = write_lines(tmp_path, [])
+    assert log_reader.tail(path, 10) == ([], 0, 0)
+
+def test_tail_clamps_before(tmp_path, block_size):
+    path, data = write_lines(tmp_path, LINES)
+    assert log_reader.tail(path, 2, before=len(data) + 100) == log_reader.tail(path, 2)
+    assert log_reader.tail(path, 2, before=-5) == ([], 0, 0)
+
+def test_read_after_continues_where_tail_ended(tmp_path):
+    path, _ = write_lines(tmp_path, LINES[:10])
+    _, _, end = log_reader.tail(path, 3)
+    with open(path, 'ab') as f:
+        f.write(('\n'.join(LINES[10:]) + '\n' + 'partial').encode('utf-8'))
+    lines, start, next_start = log_reader.read_after(path, end, 100)
+    assert start == end
+    # The unfinished last line is left for the next call.
+    assert lines == LINES[10:]
+    assert log_reader.read_after(path, next_start, 100)[0] == []
+
+def test_read_lines_pages_by_line_number(tmp_path):
+    path, _ = write_lines(tmp_path, LINES)
+    assert log_reader.read_lines(path, 5, 3) == (LINES[5:8], True)
+    assert log_reader.read_lines(path, 18, 5) == (LINES[18:], False)
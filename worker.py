@@ -1,60 +1,53 @@
 import time
 import threading
 import os
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+import classifier
 import config
+import coupon_cache
+import driver_pool
+import ledger
+import metrics
+import rate_limit
+import screenshots
+import search_index
 
 def get_used_coupons(base_filename):
     """
-    Reads the log file for a given base filename and returns a set of used coupon codes.
-    Coupons marked as 'Failed' are excluded so they can be retried.
+    Returns the set of coupon codes this UID already has a final result for in the ledger.
+    Coupons that only failed are excluded so they can be retried.
     """
-    used_coupons = set()
-    log_file_path = os.path.join("coupon_logs", f"{base_filename}.txt")
-    if not os.path.exists(log_file_path):
-        return used_coupons
-    
     try:
-        with open(log_file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if '#' in line:
-                    parts = line.strip().split('#', 1)
-                    coupon_code = parts[0].strip()
-                    result = parts[1].strip()
-                    # If the coupon failed, don't add it to the used set, so it can be retried.
-                    if coupon_code and "Failed" not in result:
-                        used_coupons.add(coupon_code)
-                else:
-                    # Handle lines without a '#', maybe older format or corrupted log
-                    coupon_code = line.strip()
-                    if coupon_code:
-                        # If we don't know the status, assume it's used to be safe
-                        used_coupons.add(coupon_code)
-
+        return ledger.used_coupons(base_filename)
     except Exception as e:
-        print(f"[ERROR] Could not read coupon log for {base_filename}: {e}")
-        
-    return used_coupons
-
-def log_coupon_result(base_filename, coupon_code, result, log_func):
-    """Appends the result of a coupon attempt to the log file and logs it."""
-    log_message = f"Coupon '{coupon_code}': {result}"
-    log_func(log_message)
-    
-    log_file_path = os.path.join("coupon_logs", f"{base_filename}.txt")
+        print(f"[ERROR] Could not read redemption ledger for {base_filename}: {e}")
+        return set()
+
+def log_coupon_result(base_filename, coupon_code, result, log_func, code=None):
+    """Records the result of a coupon attempt in the ledger and logs it. `code` is classified from `result` if not given."""
+    code = code or classifier.classify(result)
+    log_message = f"Coupon '{coupon_code}': {result} [{code}]"
+    log_func(log_message, coupon=coupon_code, result_class=code)
+
     try:
-        with open(log_file_path, 'a', encoding='utf-8') as f:
-            f.write(f"{coupon_code} # {result}\n")
+        ledger.record(base_filename, coupon_code, result, code)
     except Exception as e:
         # Use the logger to report this error
-        log_func(f"Could not write to coupon log for {base_filename}: {e}", level=logging.ERROR)
+        log_func(f"Could not write to redemption ledger for {base_filename}: {e}", level=logging.ERROR)
+
+    # Share what we learned about the code itself with every other UID.
+    try:
+        status = coupon_cache.record(coupon_code, result, code)
+        if status in coupon_cache.DEAD_STATUSES:
+            log_func(f"Coupon '{coupon_code}' is {status} for everyone. Other UIDs will skip it.")
+    except Exception as e:
+        log_func(f"Could not update coupon status cache for '{coupon_code}': {e}", level=logging.ERROR)
+    metrics.inc('coupon_attempts_total', result=code)
 
 import logging
 from logging.handlers import RotatingFileHandler
@@ -90,26 +83,28 @@ def get_thread_safe_logger(base_filename, status_dict, lock):
         # Add the configured file handler to the logger.
         logger.addHandler(file_handler)
 
-    def log(message, level=logging.INFO):
+        # Also feed every line to the log search index.
+        logger.addHandler(search_index.IndexHandler(base_filename))
+
+    def log(message, level=logging.INFO, **fields):
         """
         Logs a message to the worker's dedicated log file and updates the UI status.
+        `fields` (such as coupon and result_class) are stored with the line in the search index.
         """
         # Log the message using the configured logger.
-        logger.log(level, message)
+        logger.log(level, message, extra={'search_fields': fields})
         
         # Update the in-memory dictionary for the UI preview. This must be thread-safe.
         with lock:
             status_dict['log_preview'] = message
+            # A coupon result; count each coupon once, even if it was retried.
+            if 'coupon' in fields:
+                done = status_dict.setdefault('coupons_seen', set())
+                done.add(fields['coupon'])
+                status_dict['coupons_done'] = len(done)
             
     return log
 
-def take_screenshot(driver, base_filename):
-    """Saves a screenshot, overwriting the previous one for the same UID."""
-    try:
-        driver.save_screenshot(os.path.join("screenshots", f"{base_filename}.png"))
-    except Exception as e:
-        print(f"Could not take screenshot for {base_filename}: {e}")
-
 def wait_and_find_element(driver, by, value, timeout=10, visible=True):
     """Waits for an element to be present/visible and returns it."""
     try:
@@ -123,6 +118,75 @@ def wait_and_find_element(driver, by, value, timeout=10, visible=True):
     except TimeoutException:
         return None
 
+# Installs a counter of in-flight XHR/fetch requests on first use, then reports whether the
+# document has loaded, no request is pending and no Element UI loading mask is visible.
+PAGE_READY_SCRIPT = """
+if (window.__thPendingRequests === undefined) {
+    window.__thPendingRequests = 0;
+    const originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        window.__thPendingRequests++;
+        this.addEventListener('loadend', () => { window.__thPendingRequests--; });
+        return originalSend.apply(this, arguments);
+    };
+    if (window.fetch) {
+        const originalFetch = window.fetch;
+        window.fetch = function() {
+            window.__thPendingRequests++;
+            return originalFetch.apply(this, arguments).finally(() => { window.__thPendingRequests--; });
+        };
+    }
+}
+const loadingMaskVisible = Array.from(document.querySelectorAll('.el-loading-mask'))
+    .some(el => el.offsetParent !== null);
+return document.readyState === 'complete' && window.__thPendingRequests <= 0 && !loadingMaskVisible;
+"""
+
+# Per-thread totals of condition-based waits, so each UID can report the time saved
+# compared with the fixed sleeps they replaced.
+_wait_totals = threading.local()
+
+def reset_wait_totals():
+    """Starts a new tally of condition-based waits for the current thread."""
+    _wait_totals.waited = 0.0
+    _wait_totals.replaced = 0.0
+
+def get_wait_totals():
+    """Returns (seconds actually waited, seconds of fixed sleeps replaced) for the current thread."""
+    return getattr(_wait_totals, 'waited', 0.0), getattr(_wait_totals, 'replaced', 0.0)
+
+def wait_until(driver, condition, description, log_func, timeout=10, replaces=0, poll_frequency=0.2):
+    """
+    Waits until `condition(driver)` is truthy and logs how long it actually waited.
+    `replaces` is the fixed sleep (in seconds) this wait stands in for.
+    Returns the condition's result, or None on timeout.
+    """
+    start = time.monotonic()
+    # The implicit wait would otherwise stall every poll for an absent element (e.g. invisibility checks).
+    driver.implicitly_wait(0)
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=poll_frequency).until(condition)
+    except TimeoutException:
+        result = None
+    except Exception as e:
+        log_func(f"Error while waiting for {description}: {str(e)[:50]}", level=logging.WARNING)
+        result = None
+    finally:
+        driver.implicitly_wait(driver_pool.IMPLICIT_WAIT_SECONDS)
+    waited = time.monotonic() - start
+    _wait_totals.waited = get_wait_totals()[0] + waited
+    _wait_totals.replaced = get_wait_totals()[1] + replaces
+    log_func(f"Waited {waited:.2f}s for {description}{'' if result else ' (timed out)'}.")
+    return result
+
+def page_is_ready(driver):
+    """True once the document has loaded, network requests have settled and no loading mask is shown."""
+    return driver.execute_script(PAGE_READY_SCRIPT)
+
+def wait_for_page_ready(driver, log_func, timeout=15, replaces=0):
+    """Waits until the page is ready for interaction. See page_is_ready."""
+    return wait_until(driver, page_is_ready, "page to be ready", log_func, timeout=timeout, replaces=replaces)
+
 def click_element(driver, by, value, log_func, description, timeout=10, retries=3):
     """Waits for an element to be clickable and clicks it."""
     for attempt in range(retries):
@@ -140,10 +204,15 @@ def click_element(driver, by, value, log_func, description, timeout=10, retries=
             # This can happen if another element is obscuring the button.
             # We'll try JS click as a fallback.
             log_func(f"Could not click '{description}', trying JS fallback.", level=logging.WARNING)
-            return click_element_js(driver, by, value, log_func, description, timeout)
+            return count_fallback_click('js', click_element_js(driver, by, value, log_func, description, timeout))
     log_func(f"ERROR: Failed to click '{description}' after {retries} retries.", level=logging.ERROR)
     return False
 
+def count_fallback_click(method, clicked):
+    """Records the use of a fallback click method and passes its result through."""
+    metrics.inc('fallback_clicks_total', method=method, outcome='clicked' if clicked else 'failed')
+    return clicked
+
 def click_element_js(driver, by, value, log_func, description, timeout=10):
     """Waits for an element and clicks it using JavaScript."""
     element = wait_and_find_element(driver, by, value, timeout, visible=True)
@@ -165,8 +234,14 @@ def click_element_actions(driver, by, value, log_func, description, timeout=10):
     if element:
         try:
             # Force scroll into view using JS first to ensure it's in the viewport
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
-            time.sleep(0.5)
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'instant'});", element)
+            wait_until(
+                driver,
+                lambda d: d.execute_script(
+                    "const r = arguments[0].getBoundingClientRect();"
+                    "return r.top >= 0 && r.bottom <= window.innerHeight;", element),
+                f"'{description}' to scroll into view", log_func, timeout=2, replaces=0.5
+            )
             
             actions = ActionChains(driver)
             # Move to element and click
@@ -195,252 +270,204 @@ def click_element_actions(driver, by, value, log_func, description, timeout=10):
                 return False
     return False
 
+class RateLimited(Exception):
+    """Raised by redeem_coupons when the store rejects attempts as too frequent."""
+
+    def __init__(self, remaining_coupons, message):
+        super().__init__(message)
+        # The coupon that was rate limited and every coupon after it.
+        self.remaining_coupons = remaining_coupons
+
 def redeem_coupons(driver, log_func, base_filename, coupons_to_try):
-    """Iterates through coupons and attempts to redeem them."""
+    """
+    Iterates through coupons and attempts to redeem them.
+    Raises RateLimited with the coupons still to try if the store asks us to slow down.
+    """
     if not coupons_to_try:
         log_func("No new coupons to try. Skipping.")
         return
 
     log_func(f"Starting redemption for {len(coupons_to_try)} new coupons.")
-    for coupon in coupons_to_try:
-        log_func(f"Processing coupon: {coupon}")
-        take_screenshot(driver, base_filename)
+    for index, coupon in enumerate(coupons_to_try):
+        # Another UID may have found this code to be invalid or expired since we started.
+        coupon_status = coupon_cache.get_status(coupon)
+        if coupon_status in coupon_cache.DEAD_STATUSES:
+            log_func(f"Skipping coupon {coupon}: known to be {coupon_status}.")
+            continue
+
+        with metrics.span('coupon'):
+            log_func(f"Processing coupon: {coupon}")
+            screenshots.capture(driver, base_filename, screenshots.COUPON, coupon)
         
-        max_retries = 2
-        result_logged = False
-        for attempt in range(max_retries):
-            log_func(f"Attempt {attempt + 1}/{max_retries} for {coupon}")
+            max_retries = 2
+            result_logged = False
+            for attempt in range(max_retries):
+                log_func(f"Attempt {attempt + 1}/{max_retries} for {coupon}")
 
-            # # Try to clear any pop-ups before starting
-            # click_element(driver, By.XPATH, config.CANCEL_BUTTON, log_func, "Pre-emptive Cancel", timeout=3, retries=1)
+                # # Try to clear any pop-ups before starting
+                # click_element(driver, By.XPATH, config.CANCEL_BUTTON, log_func, "Pre-emptive Cancel", timeout=3, retries=1)
             
-            # if not click_element(driver, By.XPATH, config.COUPON_CODE_INPUT, log_func, "Coupon input"):
-            #     log_func("ERROR: Coupon input click failed.")
+                # if not click_element(driver, By.XPATH, config.COUPON_CODE_INPUT, log_func, "Coupon input"):
+                #     log_func("ERROR: Coupon input click failed.")
             
-            coupon_input = wait_and_find_element(driver, By.XPATH, config.COUPON_CODE_INPUT)
-            if not coupon_input:
-                log_func("ERROR: Coupon input field not found after click. Retrying...", level=logging.ERROR)
-                driver.refresh()
-                time.sleep(3)
-                continue
+                coupon_input = wait_and_find_element(driver, By.XPATH, config.COUPON_CODE_INPUT)
+                if not coupon_input:
+                    log_func("ERROR: Coupon input field not found after click. Retrying...", level=logging.ERROR)
+                    driver.refresh()
+                    wait_for_page_ready(driver, log_func, replaces=3)
+                    continue
             
-            coupon_input.clear()
-            coupon_input.send_keys(coupon)
-            log_func(f"Entered coupon code: {coupon}")
+                coupon_input.clear()
+                coupon_input.send_keys(coupon)
+                log_func(f"Entered coupon code: {coupon}")
             
-            # 1. Try Standard Click
-            log_func(f"DEBUG: Starting Initial Redeem click for {coupon}")
-            clicked = click_element(driver, By.XPATH, config.REDEEM_BUTTON_INITIAL, log_func, "Initial Redeem (Standard)", timeout=5, retries=1)
+                # 1. Try Standard Click
+                log_func(f"DEBUG: Starting Initial Redeem click for {coupon}")
+                clicked = click_element(driver, By.XPATH, config.REDEEM_BUTTON_INITIAL, log_func, "Initial Redeem (Standard)", timeout=5, retries=1)
             
-            # 2. Try Mouse Actions Fallback
-            if not clicked:
-                log_func("DEBUG: Standard click failed. Attempting Mouse Actions.")
-                clicked = click_element_actions(driver, By.XPATH, config.REDEEM_BUTTON_INITIAL, log_func, "Initial Redeem (Mouse)", timeout=5)
+                # 2. Try Mouse Actions Fallback
+                if not clicked:
+                    log_func("DEBUG: Standard click failed. Attempting Mouse Actions.")
+                    clicked = count_fallback_click('actions', click_element_actions(
+                        driver, By.XPATH, config.REDEEM_BUTTON_INITIAL, log_func, "Initial Redeem (Mouse)", timeout=5))
             
-            # 3. Try JS Fallback
-            if not clicked:
-                log_func("DEBUG: Mouse actions failed. Attempting JS click.")
-                clicked = click_element_js(driver, By.XPATH, config.REDEEM_BUTTON_INITIAL, log_func, "Initial Redeem (JS)", timeout=5)
-
-            if not clicked:
-                log_func(f"ERROR: Could not click Initial Redeem button for {coupon}.", level=logging.ERROR)
-                continue
+                # 3. Try JS Fallback
+                if not clicked:
+                    log_func("DEBUG: Mouse actions failed. Attempting JS click.")
+                    clicked = count_fallback_click('js', click_element_js(
+                        driver, By.XPATH, config.REDEEM_BUTTON_INITIAL, log_func, "Initial Redeem (JS)", timeout=5))
 
-            # --- Start Message Polling immediately after successful click ---
-            log_func(f"DEBUG: Click successful! Now waiting for response message for {coupon}...")
-            msg_element = None
-            is_error = False
-            try:
-                # Look for both error and success styles
-                combined_xpath = f"{config.ERROR_MESSAGE_P} | {config.SUCCESS_MESSAGE}"
-                # Poll every 0.5s
-                fast_wait = WebDriverWait(driver, 3, poll_frequency=0.5)
-                msg_element = fast_wait.until(EC.presence_of_element_located((By.XPATH, combined_xpath)))
-                
-                # Determine if it's an error based on the parent div's class
-                parent_div = msg_element.find_element(By.XPATH, "./..")
-                is_error = "el-message--error" in parent_div.get_attribute("class")
-                log_func(f"Message detected! Type: {'Error' if is_error else 'Success'}")
-            except TimeoutException:
-                log_func("No response message appeared within 3s.")
-                pass
-            except Exception as e:
-                log_func(f"Note: Exception while polling: {str(e)[:50]}")
+                if not clicked:
+                    log_func(f"ERROR: Could not click Initial Redeem button for {coupon}.", level=logging.ERROR)
+                    continue
 
-            if msg_element:
-                msg_text = ""
+                # --- Start Message Polling immediately after successful click ---
+                log_func(f"DEBUG: Click successful! Now waiting for response message for {coupon}...")
+                msg_element = None
+                is_error = False
                 try:
-                    msg_text = msg_element.get_attribute("textContent").strip() or msg_element.text.strip()
-                    log_func(f"Detected Message: '{msg_text}'")
-                except StaleElementReferenceException:
-                    log_func("Message disappeared too quickly to read text.")
-
-                if is_error:
-                    # Handle Error Case
-                    if msg_text:
-                        # 1. 'Already Used' / 'Personal Limit' (As provided by user)
-                        already_used_messages = [
-                            "이미 사용",
-                            "Personal redemption limit reached for this CDKey",
-                            "이 CDKey의 개인 교환 횟수 제한에 도달했습니다",
-                            "Data does not exist"
-                        ]
-                        
-                        if any(phrase in msg_text for phrase in already_used_messages):
-                            log_func(f"Coupon already used or invalid: {msg_text}")
-                            log_coupon_result(base_filename, coupon, msg_text, log_func)
-                            result_logged = True
-                            break 
-
-                        # 2. 'Rate Limit' (As provided by user)
-                        rate_limit_messages = [
-                            "빈번한 작업", "빈번한", "frequent", "too many", "too frequent", "다시 시도", 
-                            "later", "작업이 너무 자주", "횟수가 초과되었습니다", "operation is too frequent"
-                        ]
-                        
-                        # Use lower() for case-insensitive matching
-                        if any(phrase.lower() in msg_text.lower() for phrase in rate_limit_messages):
-                            log_func(f"RATE LIMIT DETECTED: {msg_text}. Pausing session for 660 seconds before retrying...")
-                            time.sleep(660)
-                            log_func("Wait over. Retrying current coupon...")
-                            continue 
-
-                        log_coupon_result(base_filename, coupon, msg_text, log_func)
-                    else:
-                        log_coupon_result(base_filename, coupon, "Unknown Error (Fleeting)", log_func)
+                    # Look for both error and success styles
+                    combined_xpath = f"{config.ERROR_MESSAGE_P} | {config.SUCCESS_MESSAGE}"
+                    # Poll every 0.5s
+                    fast_wait = WebDriverWait(driver, 3, poll_frequency=0.5)
+                    msg_element = fast_wait.until(EC.presence_of_element_located((By.XPATH, combined_xpath)))
+                
+                    # Determine if it's an error based on the parent div's class
+                    parent_div = msg_element.find_element(By.XPATH, "./..")
+                    is_error = "el-message--error" in parent_div.get_attribute("class")
+                    log_func(f"Message detected! Type: {'Error' if is_error else 'Success'}")
+                except TimeoutException:
+                    log_func("No response message appeared within 3s.")
+                    pass
+                except Exception as e:
+                    log_func(f"Note: Exception while polling: {str(e)[:50]}")
+
+                if msg_element:
+                    msg_text = ""
+                    try:
+                        msg_text = msg_element.get_attribute("textContent").strip() or msg_element.text.strip()
+                        log_func(f"Detected Message: '{msg_text}'")
+                    except StaleElementReferenceException:
+                        log_func("Message disappeared too quickly to read text.")
+
+                    if is_error:
+                        # Handle Error Case
+                        if msg_text:
+                            code = classifier.classify(msg_text)
+                            if code == classifier.ResultCode.RATE_LIMITED:
+                                log_func(f"RATE LIMIT DETECTED: {msg_text}. Parking remaining coupons and releasing the session.")
+                                raise RateLimited(coupons_to_try[index:], msg_text)
+
+                            if code in classifier.REJECTED_CODES:
+                                log_func(f"Coupon already used or invalid: {msg_text}")
+                            log_coupon_result(base_filename, coupon, msg_text, log_func, code)
+                        else:
+                            log_coupon_result(base_filename, coupon, "Unknown Error (Fleeting)", log_func, classifier.ResultCode.FAILED)
                     
+                        result_logged = True
+                        break 
+                    else:
+                        # Handle Success Case
+                        log_func(f"Success confirmed: {msg_text or 'Success'}")
+                        log_coupon_result(base_filename, coupon, "Success", log_func, classifier.ResultCode.SUCCESS)
+                        result_logged = True
+                        break
+
+                # If no message was detected, proceed to the confirmation dialog once it can be clicked
+                wait_until(driver, EC.element_to_be_clickable((By.XPATH, config.REDEEM_BUTTON_CONFIRM)),
+                           "confirm dialog", log_func, timeout=3, replaces=1)
+
+                if not click_element_js(driver, By.XPATH, config.REDEEM_BUTTON_CONFIRM, log_func, "Confirm Redeem"):
+                    log_func(f"Failed to click confirm for {coupon}. Retrying.", level=logging.WARNING)
+                    continue
+
+                # Check for success or other final messages
+                if wait_and_find_element(driver, By.XPATH, config.SUCCESS_MESSAGE, timeout=3):
+                    log_coupon_result(base_filename, coupon, "Success", log_func, classifier.ResultCode.SUCCESS)
                     result_logged = True
                     break 
-                else:
-                    # Handle Success Case
-                    log_func(f"Success confirmed: {msg_text or 'Success'}")
-                    log_coupon_result(base_filename, coupon, "Success", log_func)
-                    result_logged = True
-                    break
-
-            # If no message was detected, wait a moment and proceed to confirmation dialog
-            time.sleep(1) 
-
-            if not click_element_js(driver, By.XPATH, config.REDEEM_BUTTON_CONFIRM, log_func, "Confirm Redeem"):
-                log_func(f"Failed to click confirm for {coupon}. Retrying.", level=logging.WARNING)
-                continue
-
-            # Check for success or other final messages
-            if wait_and_find_element(driver, By.XPATH, config.SUCCESS_MESSAGE, timeout=3):
-                log_coupon_result(base_filename, coupon, "Success", log_func)
-                result_logged = True
-                break 
             
-            error_element_post = wait_and_find_element(driver, By.XPATH, config.ERROR_MESSAGE_P, timeout=3)
-            if error_element_post:
-                # Use .text and innerText as a fallback for more reliable detection
-                error_text = error_element_post.text.strip() or error_element_post.get_attribute("innerText").strip()
-                
-                # Handle rate limiting messages (10 minutes wait)
-                # We use a broader list of keywords and case-insensitive check
-                rate_limit_messages = [
-                    "빈번한 작업", "빈번한", "frequent", "too many", "too frequent", "다시 시도", 
-                    "later", "작업이 너무 자주", "횟수가 초과되었습니다", "operation is too frequent"
-                ]
-                
-                if any(msg.lower() in error_text.lower() for msg in rate_limit_messages):
-                    log_func(f"Rate limit reached: '{error_text}'. Waiting 10 minutes to retry.", level=logging.WARNING)
-                    time.sleep(660) # Wait for 10 minutes
-                    continue # Retry the same coupon
-
-                # Handle already used or personal limit reached messages
-                already_used_messages = [
-                    "이미 사용",
-                    "Personal redemption limit reached for this CDKey",
-                    "이 CDKey의 개인 교환 횟수 제한에 도달했습니다"
-                ]
+                error_element_post = wait_and_find_element(driver, By.XPATH, config.ERROR_MESSAGE_P, timeout=3)
+                if error_element_post:
+                    # Use .text and innerText as a fallback for more reliable detection
+                    error_text = error_element_post.text.strip() or error_element_post.get_attribute("innerText").strip()
                 
-                if any(msg.lower() in error_text.lower() for msg in already_used_messages):
-                    log_coupon_result(base_filename, coupon, "Already Used (or Limit Reached)", log_func)
-                    click_element(driver, By.XPATH, config.CANCEL_BUTTON, log_func, "Cancel on 'Already Used/Limit'", timeout=5, retries=1)
+                    code = classifier.classify(error_text)
+                    if code == classifier.ResultCode.RATE_LIMITED:
+                        log_func(f"Rate limit reached: '{error_text}'. Parking remaining coupons and releasing the session.", level=logging.WARNING)
+                        raise RateLimited(coupons_to_try[index:], error_text)
+
+                    if code in (classifier.ResultCode.ALREADY_USED, classifier.ResultCode.LIMIT_REACHED):
+                        log_coupon_result(base_filename, coupon, error_text, log_func, code)
+                        click_element(driver, By.XPATH, config.CANCEL_BUTTON, log_func, "Cancel on 'Already Used/Limit'", timeout=5, retries=1)
+                        result_logged = True
+                        break
+
+                    log_coupon_result(base_filename, coupon, error_text, log_func, code)
                     result_logged = True
                     break
-
-                log_coupon_result(base_filename, coupon, error_text, log_func)
-                result_logged = True
-                break
-            else:
-                log_func(f"WARNING: No known message for '{coupon}' on attempt {attempt + 1}.", level=logging.WARNING)
+                else:
+                    log_func(f"WARNING: No known message for '{coupon}' on attempt {attempt + 1}.", level=logging.WARNING)
         
-        if not result_logged:
-            log_func(f"Failed to get a result for '{coupon}' after {max_retries} attempts.", level=logging.ERROR)
-            log_coupon_result(base_filename, coupon, "Failed after multiple retries", log_func)
+            if not result_logged:
+                log_func(f"Failed to get a result for '{coupon}' after {max_retries} attempts.", level=logging.ERROR)
+                log_coupon_result(base_filename, coupon, "Failed after multiple retries", log_func, classifier.ResultCode.FAILED)
         
-        time.sleep(2) # Pause between coupons
-
-def process_uid(uid, comment, all_coupons, status_dict, lock, force_run=False):
+            # Wait for the result message to go away and the input to be usable before the next coupon
+            if index < len(coupons_to_try) - 1:
+                wait_until(driver, EC.invisibility_of_element_located((By.XPATH, f"{config.ERROR_MESSAGE_P} | {config.SUCCESS_MESSAGE}")),
+                           "result message to disappear", log_func, timeout=5, replaces=2)
+                wait_until(driver, EC.element_to_be_clickable((By.XPATH, config.COUPON_CODE_INPUT)),
+                           "coupon input to be interactable", log_func, timeout=5)
+
+def log_in(driver, uid, base_filename, log):
     """
-    Manages the browser automation lifecycle for a single UID and updates a shared status dict.
+    Logs in as the given UID from the store's landing page, then clears the walkthrough
+    banner and (optionally) claims promotional bonuses. Raises an Exception on failure.
     """
-    base_filename = f"{uid}_{comment}" if comment else uid
-    log = get_thread_safe_logger(base_filename, status_dict, lock)
-    
-    with lock:
-        status_dict['status'] = 'Preparing'
-    
-    used_coupons = get_used_coupons(base_filename)
-    coupons_to_try = [c for c in all_coupons if c not in used_coupons]
-    log(f"Found {len(used_coupons)} used coupons. Will try {len(coupons_to_try)} new coupons.")
-
-    if not coupons_to_try and not force_run:
-        log("No new coupons to try. Skipping session start as Force Run is not enabled.")
-        with lock:
-            status_dict['status'] = 'Finished'
-        return
-
-    driver = None
-    try:
-        with lock:
-            status_dict['status'] = 'Starting Browser'
-        
-        chrome_options = Options()
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        # Add arguments for running in a container
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        
-        driver = webdriver.Remote(
-            command_executor=config.SELENIUM_HUB_URL,
-            options=chrome_options
-        )
-        # Store session ID for live view
-        with lock:
-            status_dict['session_id'] = driver.session_id
-
-        driver.set_window_size(1920, 1080)
-        driver.implicitly_wait(3)
-
-        with lock:
-            status_dict['status'] = 'Running'
-
-        driver.get(config.BASE_URL)
-        log(f"Navigated to {config.BASE_URL}")
-        take_screenshot(driver, base_filename)
+    screenshots.capture(driver, base_filename, screenshots.PHASE, 'landing')
 
+    with metrics.span('login_click'):
         if not click_element(driver, By.XPATH, config.LOGIN_BUTTON, log, "Login button"):
             # If login button not found, maybe a banner is blocking it. Try one refresh as a fallback.
             log("Login button not found. Refreshing once as fallback.")
             driver.refresh()
-            time.sleep(3)
+            wait_for_page_ready(driver, log, replaces=3)
             if not click_element(driver, By.XPATH, config.LOGIN_BUTTON, log, "Login button"):
                 raise Exception("Failed to find or click Login button.")
-        
-        time.sleep(1)
-        take_screenshot(driver, base_filename)
 
-        uid_input = wait_and_find_element(driver, By.XPATH, config.UID_INPUT)
+    with metrics.span('uid_check'):
+        uid_input = wait_until(driver, EC.visibility_of_element_located((By.XPATH, config.UID_INPUT)),
+                               "login modal", log, timeout=10, replaces=1)
+        screenshots.capture(driver, base_filename, screenshots.PHASE, 'login-modal')
         if not uid_input:
             raise Exception("UID input field not found.")
         uid_input.send_keys(uid)
-        
+
         if not click_element(driver, By.XPATH, config.UID_CHECK_BUTTON, log, "UID check button"):
             raise Exception("Failed to click UID check button.")
-        
+
+    with metrics.span('confirm'):
         # Attempt to click the confirm button up to 5 times with a 5-second interval.
         confirm_clicked = False
         for i in range(5):
@@ -448,30 +475,34 @@ def process_uid(uid, comment, all_coupons, status_dict, lock, force_run=False):
             if click_element(driver, By.XPATH, config.CONFIRM_BUTTON, log, "Confirm button"):
                 confirm_clicked = True
                 break  # Exit the loop if successful
-            
-            if i < 4: # Don't sleep after the final attempt
-                log("Button not found or clickable, waiting 5 seconds to retry.")
-                time.sleep(5)
+
+            if i < 4: # Don't wait after the final attempt
+                log("Button not found or clickable, waiting for the page to settle before retrying.")
+                wait_for_page_ready(driver, log, timeout=5, replaces=5)
 
         if not confirm_clicked:
             log("Could not click confirm button after 5 attempts. Continuing without confirmation.", level=logging.WARNING)
 
         log("Login successful. Waiting for page to load.")
-        time.sleep(5)
-        take_screenshot(driver, base_filename)
+        wait_until(driver, EC.invisibility_of_element_located((By.XPATH, config.UID_INPUT)),
+                   "login modal to close", log, timeout=10, replaces=5)
+        wait_for_page_ready(driver, log)
+    screenshots.capture(driver, base_filename, screenshots.PHASE, 'logged-in')
 
+    with metrics.span('banner'):
         # Check for the Gold Blocks walkthrough banner (Swiper-based)
         gold_blocks_banner_xpath = "//div[contains(@class, 'swiper-wrapper') and contains(@class, 'slide-block')] | //*[contains(text(), 'Gold Blocks work')]"
         if wait_and_find_element(driver, By.XPATH, gold_blocks_banner_xpath, timeout=3, visible=True):
             log("Detected 'Gold Blocks' walkthrough banner. Refreshing page to clear it.")
             driver.refresh()
-            time.sleep(5)
+            wait_for_page_ready(driver, log, replaces=5)
             log("Page refreshed after login.")
-            take_screenshot(driver, base_filename)
+            screenshots.capture(driver, base_filename, screenshots.PHASE, 'banner-cleared')
         else:
             log("No walkthrough banner detected. Continuing.")
 
-        # Conditional click of promotional buttons based on environment variable
+    # Conditional click of promotional buttons based on environment variable
+    with metrics.span('promo'):
         if config.ENABLE_PROMOTIONAL_BUTTONS == 'Y':
             log("ENABLE_PROMOTIONAL_BUTTONS is 'Y'. Attempting to click promotional buttons.")
             for i in range(1, 11):
@@ -498,31 +529,32 @@ def process_uid(uid, comment, all_coupons, status_dict, lock, force_run=False):
                     log(f"Standard clicks failed for Promo Button {i}. Trying Mouse Actions fallback.", level=logging.INFO)
                     promotion_button_text = config.PROMOTION_BUTTON_TEXT
                     fallback_button_xpath = f"(//div[contains(@class, 'handle')]//span[contains(text(), '{promotion_button_text}')])[1]"
-                    clicked = click_element_actions(driver, By.XPATH, fallback_button_xpath, log, f"Promo Button {i} (Mouse Actions)", timeout=2)
+                    clicked = count_fallback_click('actions', click_element_actions(
+                        driver, By.XPATH, fallback_button_xpath, log, f"Promo Button {i} (Mouse Actions)", timeout=2))
 
                 if clicked:
-                    time.sleep(2)
+                    wait_for_page_ready(driver, log, timeout=5, replaces=2)
                     # Now, the X button logic
                     config_x_selector = "." + config.CLOSE_BUTTON_CLASS.replace(" ", ".")
-                    
+
                     x_button_selectors = [
                         (By.CSS_SELECTOR, 'button.el-dialog__headerbtn'), # Standard Element UI button
                         (By.CSS_SELECTOR, config_x_selector),             # From config
                         (By.XPATH, "//button[@aria-label='Close']"),      # Aria-label fallback
                         (By.XPATH, '//*[@id="site-widget-1035124126946440"]//i[contains(@class, "close")]') # Container fallback
                     ]
-                    
+
                     closed = False
                     for by, selector in x_button_selectors:
                         log(f"Trying to close popup with selector: {selector}")
-                        
+
                         # 1. Try Mouse Actions FIRST (more reliable for some UI)
                         closed = click_element_actions(driver, by, selector, log, f"'X' button ({selector}) (Mouse)")
-                        
+
                         # 2. Try Standard Click if Mouse failed
                         if not closed:
                             closed = click_element(driver, by, selector, log, f"'X' button ({selector}) (Standard)", timeout=2, retries=1)
-                        
+
                         # 3. Try JS click as ABSOLUTE LAST fallback (often says success but does nothing)
                         if not closed:
                             element = wait_and_find_element(driver, by, selector, timeout=1, visible=False)
@@ -532,8 +564,8 @@ def process_uid(uid, comment, all_coupons, status_dict, lock, force_run=False):
                                     log(f"Clicked '{selector}' using emergency JS fallback.")
                                     # We don't set closed=True immediately because JS often lies. 
                                     # Let's check if element is still there.
-                                    time.sleep(1)
-                                    if not wait_and_find_element(driver, by, selector, timeout=1, visible=True):
+                                    if wait_until(driver, EC.invisibility_of_element_located((by, selector)),
+                                                  f"'{selector}' to disappear", log, timeout=2, replaces=2):
                                         log(f"Popup seems closed after JS click.")
                                         closed = True
                                 except:
@@ -543,32 +575,140 @@ def process_uid(uid, comment, all_coupons, status_dict, lock, force_run=False):
 
                     if closed:
                         log("Popup closed successfully. Assuming no more bonuses to claim. Moving to coupons.")
-                        time.sleep(1)
+                        wait_for_page_ready(driver, log, timeout=5, replaces=1)
                         break # Exit the for i in range(1, 11) loop
                     else:
                         log(f"No 'X' button found after clicking promo button.")
                 else:
                     log(f"Could not click any promotional button for attempt #{i}. Moving to the next.")
-            
+
             log("Finished clicking promotional buttons.")
-            take_screenshot(driver, base_filename)
+            screenshots.capture(driver, base_filename, screenshots.PHASE, 'promotions')
         else:
             log("ENABLE_PROMOTIONAL_BUTTONS is not 'Y'. Skipping promotional buttons.")
 
-        redeem_coupons(driver, log, base_filename, coupons_to_try)
+def log_out(driver):
+    """Clears the logged-in account and reloads the landing page for the next UID."""
+    with metrics.span('logout'):
+        driver_pool.reset_driver_state(driver)
+        driver.get(config.BASE_URL)
 
-        log("All tasks completed for this UID.")
-        with lock:
-            status_dict['status'] = 'Finished'
+def get_coupons_to_try(base_filename, all_coupons, log):
+    """Filters out the coupons this UID has already redeemed and those known to be dead for everyone."""
+    used_coupons = get_used_coupons(base_filename)
+    dead_coupons = coupon_cache.dead_coupons(all_coupons)
+    coupons_to_try = [c for c in all_coupons if c not in used_coupons and c not in dead_coupons]
+    log(f"Found {len(used_coupons)} used coupons and {len(dead_coupons)} invalid or expired coupons. Will try {len(coupons_to_try)} new coupons.")
+    return coupons_to_try
 
-    except Exception as e:
-        log(f"FATAL ERROR: {e}", level=logging.ERROR)
-        with lock:
-            status_dict['status'] = 'Error'
-        # Take a final screenshot on error
-        if driver:
-            take_screenshot(driver, base_filename)
+def start_progress(status_dict, lock, coupons_to_try):
+    """Resets a UID's coupon progress counters for a new attempt."""
+    with lock:
+        status_dict['coupons_seen'] = set()
+        status_dict['coupons_total'] = len(coupons_to_try)
+        status_dict['coupons_done'] = 0
+
+def set_final_status(status_dict, lock, status, started):
+    """Sets a UID's final status and records how long it took to get there."""
+    with lock:
+        status_dict['status'] = status
+    metrics.inc('uids_total', status=status)
+    metrics.observe('uid_seconds', time.monotonic() - started, status=status)
+
+def process_uid(uid, comment, all_coupons, status_dict, lock, force_run=False):
+    """
+    Manages the browser automation lifecycle for a single UID and updates a shared status dict.
+    """
+    account = {'uid': uid, 'comment': comment, 'coupons': all_coupons, 'force_run': force_run, 'status_dict': status_dict}
+    process_uid_batch([account], lock)
+
+def process_uid_batch(accounts, lock):
+    """
+    Redeems coupons for several UIDs one after another in a single browser session,
+    logging out between accounts. `accounts` is a list of dicts with 'uid', 'comment',
+    'coupons', 'force_run' and 'status_dict'; every UID keeps its own log file,
+    coupon log and status dict.
+    """
+    driver = None
+    # True when the driver is on BASE_URL in a clean, logged-out state.
+    page_ready = False
+    log = None
+    try:
+        for index, account in enumerate(accounts):
+            uid, comment, force_run = account['uid'], account['comment'], account['force_run']
+            status_dict = account['status_dict']
+            base_filename = f"{uid}_{comment}" if comment else uid
+            log = get_thread_safe_logger(base_filename, status_dict, lock)
+
+            with lock:
+                status_dict['status'] = 'Preparing'
+            reset_wait_totals()
+            started = time.monotonic()
+
+            coupons_to_try = get_coupons_to_try(base_filename, account['coupons'], log)
+            start_progress(status_dict, lock, coupons_to_try)
+            if not coupons_to_try and not force_run:
+                log("No new coupons to try. Skipping session start as Force Run is not enabled.")
+                set_final_status(status_dict, lock, 'Finished', started)
+                continue
+
+            try:
+                if driver is None:
+                    with lock:
+                        status_dict['status'] = 'Starting Browser'
+                    with metrics.span('driver_acquire'):
+                        driver = driver_pool.acquire()
+                    page_ready = driver_pool.is_warm(driver)
+
+                # Store session ID for live view
+                with lock:
+                    status_dict['session_id'] = driver.session_id
+                    status_dict['status'] = 'Running'
+
+                if page_ready:
+                    log(f"Reusing browser session already at {config.BASE_URL}")
+                else:
+                    with metrics.span('page_load'):
+                        driver.get(config.BASE_URL)
+                    log(f"Navigated to {config.BASE_URL}")
+                page_ready = False
+
+                log_in(driver, uid, base_filename, log)
+                redeem_coupons(driver, log, base_filename, coupons_to_try)
+
+                waited, replaced = get_wait_totals()
+                log(f"Condition-based waits took {waited:.1f}s in place of {replaced:.1f}s of fixed sleeps (saved {replaced - waited:.1f}s).")
+                log("All tasks completed for this UID.")
+                set_final_status(status_dict, lock, 'Finished', started)
+            except RateLimited as e:
+                # Park the remaining coupons instead of holding the session through the cooldown.
+                resume_at = rate_limit.park(uid, comment, e.remaining_coupons, force_run=force_run, reason=str(e))
+                resume_text = time.strftime('%H:%M:%S', time.localtime(resume_at))
+                log(f"Parked {len(e.remaining_coupons)} coupons until {resume_text}.", level=logging.WARNING)
+                set_final_status(status_dict, lock, 'Parked', started)
+            except Exception as e:
+                log(f"FATAL ERROR: {e}", level=logging.ERROR)
+                set_final_status(status_dict, lock, 'Error', started)
+                # Take a final screenshot on error
+                if driver:
+                    screenshots.capture(driver, base_filename, screenshots.ERROR, 'error')
+                    # Sessions that hit an error are closed rather than handed to the next UID.
+                    driver_pool.release(driver, discard=True)
+                    driver = None
+                    log("Browser session closed after error.")
+                continue
+
+            if index < len(accounts) - 1:
+                try:
+                    log_out(driver)
+                    page_ready = True
+                    log("Logged out. Handing the browser session to the next UID.")
+                except Exception as e:
+                    log(f"Could not log out cleanly, closing session: {e}", level=logging.WARNING)
+                    driver_pool.release(driver, discard=True)
+                    driver = None
     finally:
         if driver:
-            driver.quit()
-            log("Browser session closed.")
+            driver_pool.release(driver)
+            if log:
+                log("Browser session released.")